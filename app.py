@@ -1,14 +1,13 @@
-from flask import Flask, render_template, request, jsonify, session, send_from_directory, redirect, url_for
-from flask_mail import Mail, Message
+from flask import Flask, render_template, request, jsonify, session, send_from_directory, redirect, url_for, Response, stream_with_context
+from flask_mail import Mail
 from flask_session import Session
 import os, json, datetime, shutil
 import google.generativeai as genai
 import re
 from bs4 import BeautifulSoup
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
 from pathlib import Path
 import zipfile
-from io import BytesIO
 from flask import send_file
 from authlib.integrations.flask_client import OAuth
 import redis
@@ -16,9 +15,36 @@ import os
 import razorpay
 import hmac
 import hashlib
+import gzip
+import secrets
+import base64
+import threading
+import time
+import random
+import uuid
+import click
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
 from dotenv import load_dotenv
+from logging_config import configure_logging, init_request_logging, debug_enabled
+from image_variants import (
+    EXPORT_MAX_WIDTH, VARIANT_CONTENT_TYPES, choose_variant, make_variants, pick_variant,
+    sniff_image_type, variants_enabled
+)
+from github_push import GitHubClient, GitHubPushError, push_files
+from metadata_cache import init_metadata_cache, get_user, get_owned_project, invalidate_user, invalidate_project
+from rate_limit import detach_inflight_slot, init_rate_limits, rate_limited
+from mail_queue import MailWorker, enqueue_mail
+from session_store import (
+    CompactRedisSessionInterface, set_github_link, get_github_link, set_figma_url, clear_figma_url,
+    clear_user_links
+)
+from credits import effective_credits, new_reservation_id, reserve_credit, refund_credit, grant_credits, utcnow
+from preview_utils import guess_content_type, preload_link_header, make_preview_token, PREVIEW_TOKEN_MAX_AGE
 load_dotenv()
 
+logger = configure_logging()
+
 SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -32,8 +58,11 @@ SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv("SQLALCHEMY_TRACK_MODIFICATIONS") ==
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
 RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+# API base URL; point it at a local stand-in to exercise payments without Razorpay
+RAZORPAY_API_URL = os.getenv("RAZORPAY_API_URL")
 
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+razorpay_options = {'base_url': RAZORPAY_API_URL.rstrip('/')} if RAZORPAY_API_URL else {}
+razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), **razorpay_options)
 
 # Validate that sensitive API keys are set
 import warnings
@@ -46,19 +75,25 @@ if not ANTHROPIC_API_KEY:
 
 # CRITICAL: Never store API keys in session or log them
 if GEMINI_API_KEY:
-    print("✅ Gemini API key loaded (length: {})".format(len(GEMINI_API_KEY)))
+    logger.info("Gemini API key loaded", extra={'fields': {'key_length': len(GEMINI_API_KEY)}})
 else:
-    print("❌ Gemini API key missing!")
+    logger.error("Gemini API key missing")
 
 if ANTHROPIC_API_KEY:
-    print("✅ Anthropic API key loaded (length: {})".format(len(ANTHROPIC_API_KEY)))
+    logger.info("Anthropic API key loaded", extra={'fields': {'key_length': len(ANTHROPIC_API_KEY)}})
 else:
-    print("❌ Anthropic API key missing!")
+    logger.error("Anthropic API key missing")
 
 
 # Database imports
-from models import db, User, Project, ProjectFile, ChatHistory, SessionRecord
+from models import (
+    db, User, Project, ProjectFile, ChatHistory, SessionRecord, PublishedSnapshot, ImageVariant, PaymentOrder, WebhookEvent,
+    delete_unreferenced_blobs
+)
 from flask_migrate import Migrate
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Global variables to store extracted CSS/JS
 _extracted_css = None
@@ -66,6 +101,7 @@ _extracted_js = None
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
+init_request_logging(app)
 
 app.config['SESSION_TYPE'] = 'redis'
 app.config['SESSION_REDIS'] = redis.from_url(
@@ -78,19 +114,33 @@ app.config['SESSION_COOKIE_SECURE'] = True  # Use HTTPS
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
-# Initialize Flask-Session
+# Initialize Flask-Session, storing sessions through the write-on-change interface
 Session(app)
+app.session_interface = CompactRedisSessionInterface(
+    app,
+    client=app.config['SESSION_REDIS'],
+    key_prefix=app.config['SESSION_KEY_PREFIX'],
+    use_signer=app.config['SESSION_USE_SIGNER'],
+    permanent=app.config['SESSION_PERMANENT'],
+)
+
+# Shared Redis connection for app state outside the session (jobs, caches)
+redis_client = app.config['SESSION_REDIS']
+init_metadata_cache(redis_client)
+init_rate_limits(redis_client)
 
-# Mail configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+# Mail configuration; point MAIL_SERVER at a local SMTP sink to test delivery
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', '587'))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
 
-# Initialize Flask-Mail
+# Initialize Flask-Mail. Mail is queued in Redis and sent by a worker thread
+# each web process starts with its first request (or `flask send-mail --loop`).
 mail = Mail(app)
+mail_worker = MailWorker(app, mail, redis_client)
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
@@ -127,6 +177,35 @@ WORKSPACE_DIR = os.path.dirname(os.path.abspath(__file__))
 GENERATED_FILES_DIR = os.path.join(WORKSPACE_DIR, 'generated_files')
 os.makedirs(GENERATED_FILES_DIR, exist_ok=True)
 
+# Published sites live at PUBLISHED_DIR/<slug>/<version dir>, with a `current`
+# symlink pointing at the live version. Any static server can serve this tree.
+PUBLISHED_DIR = os.getenv('PUBLISHED_DIR', os.path.join(WORKSPACE_DIR, 'published'))
+os.makedirs(PUBLISHED_DIR, exist_ok=True)
+PUBLISH_KEEP_VERSIONS = 5
+PRECOMPRESS_EXTENSIONS = {'html', 'css', 'js', 'json', 'svg', 'txt'}
+
+# Inline preview: images up to this size are embedded as data URIs
+INLINE_IMAGE_MAX_BYTES = 32 * 1024
+INLINE_PREVIEW_CACHE_BYTES = 32 * 1024 * 1024
+
+# Base URL of the standalone preview app (preview_app.py). When unset, the
+# editor previews through /preview on this app.
+PREVIEW_BASE_URL = os.getenv('PREVIEW_BASE_URL', '').rstrip('/')
+
+# Finished ZIP exports, one per project, named by the project's combined file revision
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(WORKSPACE_DIR, 'export_cache'))
+os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+# Already-compressed formats are stored as-is instead of deflated again
+ZIP_STORED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Image uploads are read in chunks and refused past the size limit
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv('IMAGE_UPLOAD_MAX_BYTES', str(5 * 1024 * 1024)))
+IMAGE_UPLOAD_MAX_FILES = 3
+UPLOAD_CHUNK_SIZE = 64 * 1024
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
+
 ALLOWED_EXTENSIONS = {'html', 'css', 'js', 'txt', 'json', 'svg', 'png', 'jpg', 'jpeg', 'gif'}
 IMAGE_CATEGORIES = {
     "clothing": "fashion,clothing,apparel",
@@ -139,31 +218,6 @@ IMAGE_CATEGORIES = {
 
 
 # --- Helper Functions ---
-def check_and_reset_daily_credits(user):
-    """Reset credits to 3 if 24 hours have passed"""
-    from datetime import datetime, timedelta, timezone
-    
-    # Handle timezone-naive last_credit_reset from old records
-    if not user.last_credit_reset:
-        user.last_credit_reset = datetime.now(timezone.utc)
-        db.session.commit()
-        return
-    
-    # Convert naive datetime to aware if needed
-    last_reset = user.last_credit_reset
-    if last_reset.tzinfo is None:
-        # Convert naive UTC datetime to aware
-        last_reset = last_reset.replace(tzinfo=timezone.utc)
-    
-    # Check if 24 hours have passed
-    time_since_reset = datetime.now(timezone.utc) - last_reset
-    
-    if time_since_reset >= timedelta(hours=24):
-        user.credits = 3
-        user.last_credit_reset = datetime.now(timezone.utc)
-        db.session.commit()
-        print(f"✅ Credits reset to 3 for user {user.email}")
-
 def sanitize_session_for_logging(session_data):
     """Remove sensitive data before logging session"""
     safe_data = dict(session_data)
@@ -199,9 +253,6 @@ def get_or_create_user(email, name, picture=None):
         )
         db.session.add(user)
         db.session.commit()
-    else:
-        # Check and reset credits if needed
-        check_and_reset_daily_credits(user)
     return user
 
 def generate_project_name(prompt):
@@ -260,7 +311,7 @@ def save_session_record(record, user_id=None, project_id=None):
         error_msg = str(e)
         if 'api' in error_msg.lower() and 'key' in error_msg.lower():
             error_msg = "Database configuration error"
-        print(f"❌ Error saving to database: {error_msg}")
+        logger.error("Error saving session record to database", extra={'fields': {'error': error_msg}})
         db.session.rollback()
     
     # Also save to JSON file (KEPT for backward compatibility)
@@ -273,7 +324,7 @@ def save_session_record(record, user_id=None, project_id=None):
         error_msg = str(e)
         if 'api' in error_msg.lower() and 'key' in error_msg.lower():
             error_msg = "Storage error"
-        print(f"❌ Error saving to JSON: {error_msg}")
+        logger.error("Error saving session record to JSON", extra={'fields': {'error': error_msg}})
 
 # def save_files_to_database(user_id, project_name):
 #     """Save all generated files to database"""
@@ -362,7 +413,7 @@ def clear_generated_files():
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
             except Exception as e:
-                print(f"❌ Error deleting {file_path}: {type(e).__name__}")
+                logger.warning("Error deleting generated file", extra={'fields': {'path': file_path, 'error': type(e).__name__}})
 
 def extract_navigation_structure(html_content):
     """Extracts ALL .html links from the page, not just nav"""
@@ -549,7 +600,7 @@ FINAL OUTPUT GOAL:
         error_msg = str(e)
         if 'api' in error_msg.lower() and 'key' in error_msg.lower():
             error_msg = "AI service error"
-        print(f"❌ AI generation failed for {page_title}: {error_msg}")
+        logger.error("AI page generation failed", extra={'fields': {'page': page_title, 'error': error_msg}})
         content_html = f"""
         <main class="container py-5">
             <div class="text-center mb-5">
@@ -674,60 +725,447 @@ def serve_preview_file(filename):
     user_id = session.get('user_id')
     project_id = session.get('current_project_id')
     
-    print(f"🔍 Preview request: {filename} for project_id={project_id}")
-    
     if not project_id:
-        print("❌ No active project in session")
+        logger.info("Preview without active project", extra={'fields': {'filename': filename}})
         return "No active project", 404
     
     # Verify user owns this project
-    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+    project = get_owned_project(project_id, user_id)
     if not project:
-        print(f"❌ Project {project_id} not found or unauthorized")
+        logger.warning("Preview of unowned project", extra={'fields': {'project_id': project_id, 'user_id': user_id}})
         return "Unauthorized", 403
     
-    print(f"✅ Project found: {project.name}")
+    if filename.endswith('.html') and request.args.get('inline') == '1':
+        return serve_inline_preview(project_id, filename)
     
-    # Get file from database
+    # Get file from database; image bytes are loaded only if no variant is served
     file = ProjectFile.query.filter_by(
         project_id=project_id,
         filename=filename
     ).first()
     
     if not file:
-        print(f"❌ File {filename} not found in project {project_id}")
-        # List available files for debugging
-        available = ProjectFile.query.filter_by(project_id=project_id).all()
-        print(f"📁 Available files: {[f.filename for f in available]}")
+        logger.info("Preview file not found", extra={'fields': {'project_id': project_id, 'filename': filename}})
+        # List available files for debugging - names only, and only when it will be logged
+        if debug_enabled():
+            available = db.session.query(ProjectFile.filename).filter_by(project_id=project_id).all()
+            logger.debug("Available preview files", extra={'fields': {'project_id': project_id, 'files': [f.filename for f in available]}})
         return f"File {filename} not found", 404
     
-    print(f"✅ Serving file: {filename} (type: {file.file_type})")
-    
-    # Determine content type
-    content_type = 'text/html'
-    if filename.endswith('.css'):
-        content_type = 'text/css'
-    elif filename.endswith('.js'):
-        content_type = 'application/javascript'
-    elif filename.endswith('.json'):
-        content_type = 'application/json'
-    elif filename.endswith('.png'):
-        content_type = 'image/png'
-    elif filename.endswith(('.jpg', '.jpeg')):
-        content_type = 'image/jpeg'
-    elif filename.endswith('.gif'):
-        content_type = 'image/gif'
-    elif filename.endswith('.svg'):
-        content_type = 'image/svg+xml'
+    logger.debug("Serving preview file", extra={'fields': {'project_id': project_id, 'filename': filename, 'file_type': file.file_type}})
+    
+    content_type = guess_content_type(filename)
     
     # Return binary content for images, text content for code files
-    if file.content_binary:
-        return file.content_binary, 200, {'Content-Type': content_type}
-    else:
-        return file.content, 200, {'Content-Type': content_type}
+    if file.is_binary:
+        # A resized/WebP variant when one is ready and smaller
+        variant = pick_variant(file, accept_webp='image/webp' in request.headers.get('Accept', ''))
+        if variant:
+            return variant.content_binary, 200, {'Content-Type': VARIANT_CONTENT_TYPES[variant.format], 'Vary': 'Accept'}
+        return file.content_binary, 200, {'Content-Type': content_type, 'Vary': 'Accept'}
+    
+    headers = {'Content-Type': content_type}
+    if file.asset_refs:
+        # Let the browser fetch styles/scripts/images before it has parsed the page.
+        # Proxies that support 103 Early Hints (e.g. Cloudflare) promote these.
+        headers['Link'] = preload_link_header(file.asset_refs)
+    return file.content, 200, headers
+
+@app.route("/api/preview-token")
+@login_required
+def preview_token():
+    """Issue a signed token for the standalone preview app"""
+    user_id = session.get('user_id')
+    project_id = session.get('current_project_id')
+    
+    if not project_id:
+        return jsonify({'error': 'No active project'}), 400
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'token': make_preview_token(app.secret_key, user_id, project_id),
+        'base_url': PREVIEW_BASE_URL,
+        'expires_in': PREVIEW_TOKEN_MAX_AGE
+    })
 # --- End Serve ---
 
 
+# --- Inline Preview ---
+# Single-document preview: the page is returned with project CSS/JS inlined and
+# small images as data URIs, so one request renders the whole page. Assembled
+# documents are cached by the combined revision of the project's files.
+_inline_preview_cache = LRUCache(maxsize=INLINE_PREVIEW_CACHE_BYTES, getsizeof=lambda entry: len(entry[1]))
+_inline_preview_lock = threading.Lock()
+
+def project_file_manifest(project_id):
+    """(id, filename, revision, binary size) of every file, without loading content"""
+    return db.session.query(
+        ProjectFile.id,
+        ProjectFile.filename,
+        ProjectFile.revision,
+        db.case((ProjectFile.is_binary, db.func.coalesce(ProjectFile.size_bytes, 0)), else_=0)
+    ).filter_by(project_id=project_id).all()
+
+def combined_revision(manifest):
+    """Stable digest that changes whenever any file is added, removed or updated"""
+    digest = hashlib.sha1()
+    for file_id, _, revision, _ in sorted(manifest):
+        digest.update(f"{file_id}:{revision};".encode('ascii'))
+    return digest.hexdigest()
+
+def _local_file(ref, files_by_name):
+    """Resolves a relative reference in a page to a project file, if it is one"""
+    ref = ref.split('#', 1)[0].split('?', 1)[0]
+    if ref.startswith('./'):
+        ref = ref[2:]
+    return files_by_name.get(ref)
+
+def _data_uri(file):
+    encoded = base64.b64encode(file.content_binary).decode('ascii')
+    return f"data:{guess_content_type(file.filename)};base64,{encoded}"
+
+def inline_css_urls(css, files_by_name):
+    """Embeds small project images referenced from CSS url()s"""
+    def replace(match):
+        file = _local_file(match.group(2), files_by_name)
+        if file and file.content_binary:
+            return f'url("{_data_uri(file)}")'
+        return match.group(0)
+    return re.sub(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', replace, css)
+
+def assemble_inline_document(page, files_by_name):
+    """Returns the page HTML with project stylesheets, scripts and small images inlined"""
+    soup = BeautifulSoup(page.content or '', 'html.parser')
+    
+    for link in soup.find_all('link', href=True):
+        file = _local_file(link['href'], files_by_name)
+        if 'stylesheet' in (link.get('rel') or []) and file and file.content is not None:
+            style_tag = soup.new_tag('style')
+            style_tag.string = inline_css_urls(file.content, files_by_name)
+            link.replace_with(style_tag)
+    
+    for script in soup.find_all('script', src=True):
+        file = _local_file(script['src'], files_by_name)
+        if file and file.content is not None:
+            inline_script = soup.new_tag('script')
+            if script.get('type'):
+                inline_script['type'] = script['type']
+            inline_script.string = file.content.replace('</script', '<\\/script')
+            script.replace_with(inline_script)
+    
+    for img in soup.find_all('img', src=True):
+        file = _local_file(img['src'], files_by_name)
+        if file and file.content_binary:
+            img['src'] = _data_uri(file)
+    
+    # Keep navigation between pages in inline mode
+    for anchor in soup.find_all('a', href=True):
+        file = _local_file(anchor['href'], files_by_name)
+        if file and file.filename.endswith('.html') and '?' not in anchor['href']:
+            path, _, fragment = anchor['href'].partition('#')
+            anchor['href'] = f"{path}?inline=1" + (f"#{fragment}" if fragment else '')
+    
+    return str(soup)
+
+def serve_inline_preview(project_id, filename):
+    """Serve a page as a single self-contained document (ownership already checked)"""
+    manifest = project_file_manifest(project_id)
+    page_entry = next((entry for entry in manifest if entry[1] == filename), None)
+    if not page_entry:
+        return f"File {filename} not found", 404
+    
+    revision = combined_revision(manifest)
+    etag = f'"{revision}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+    
+    cache_key = (project_id, filename)
+    with _inline_preview_lock:
+        cached = _inline_preview_cache.get(cache_key)
+    
+    if cached and cached[0] == revision:
+        body = cached[1]
+    else:
+        # One query for the page, all text assets and the images small enough to embed
+        wanted_ids = [file_id for file_id, name, _, size in manifest
+                      if name == filename or size <= INLINE_IMAGE_MAX_BYTES]
+        files = ProjectFile.query.filter(ProjectFile.id.in_(wanted_ids)).options(db.selectinload(ProjectFile.blob)).all()
+        files_by_name = {f.filename: f for f in files}
+        body = assemble_inline_document(files_by_name[filename], files_by_name).encode('utf-8')
+        with _inline_preview_lock:
+            _inline_preview_cache[cache_key] = (revision, body)
+    
+    return body, 200, {
+        'Content-Type': 'text/html; charset=utf-8',
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache'
+    }
+# --- End Inline Preview ---
+
+
+# --- Publishing ---
+# Assets renamed by build_static_snapshot: name.<12 hex digits of sha256>.ext
+HASHED_ASSET_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+def rewrite_asset_references(text, renames):
+    """Points quoted or url() references at the content-hashed asset names"""
+    if not renames:
+        return text
+    names = '|'.join(re.escape(name) for name in sorted(renames, key=len, reverse=True))
+    pattern = re.compile(r'(["\'(])(?:\./)?(' + names + r')(?=[)"\'?#])')
+    return pattern.sub(lambda m: m.group(1) + renames[m.group(2)], text)
+
+def build_static_snapshot(files, target_dir):
+    """Renders project files into target_dir and returns the snapshot hash.
+
+    HTML pages keep their names so links between pages still work; every other
+    file gets its content hash in the name so it can be cached forever, and
+    HTML and CSS are rewritten to use those names. Assets are also written
+    under their original names, for references that cannot be rewritten
+    (URLs built by scripts, fetch() calls). Text assets are written a second
+    time as .gz for servers that send them as-is.
+    """
+    payloads = {}
+    for file in files:
+        if safe_join(target_dir, file.filename) is None:
+            continue
+        if file.content_binary:
+            payloads[file.filename] = file.content_binary
+        else:
+            payloads[file.filename] = (file.content or '').encode('utf-8')
+
+    renames = {}
+    for filename, data in payloads.items():
+        if filename.endswith('.html'):
+            continue
+        stem, ext = os.path.splitext(filename)
+        renames[filename] = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+    snapshot_hash = hashlib.sha256()
+    for filename in sorted(payloads):
+        data = payloads[filename]
+        if filename.endswith(('.html', '.css')):
+            data = rewrite_asset_references(data.decode('utf-8'), renames).encode('utf-8')
+
+        extension = filename.rsplit('.', 1)[-1].lower()
+        compressed = None
+        if extension in PRECOMPRESS_EXTENSIONS:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= len(data):
+                compressed = None
+
+        output_names = [renames[filename], filename] if filename in renames else [filename]
+        for output_name in output_names:
+            output_path = safe_join(target_dir, output_name)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            if compressed is not None:
+                with open(output_path + '.gz', 'wb') as f:
+                    f.write(compressed)
+            snapshot_hash.update(output_name.encode('utf-8') + b'\0' + hashlib.sha256(data).digest())
+
+    return snapshot_hash.hexdigest()
+
+def activate_snapshot_dir(site_dir, version_dirname):
+    """Atomically points the site's `current` symlink at a version directory"""
+    temp_link = os.path.join(site_dir, f".current-{secrets.token_hex(4)}")
+    os.symlink(version_dirname, temp_link)
+    os.replace(temp_link, os.path.join(site_dir, 'current'))
+
+def prune_snapshot_dirs(site_dir, keep):
+    """Removes all but the newest `keep` version directories (never the live one)"""
+    current = os.path.realpath(os.path.join(site_dir, 'current'))
+    versions = []
+    for name in os.listdir(site_dir):
+        match = re.match(r'^v(\d+)-[0-9a-f]+$', name)
+        if match:
+            versions.append((int(match.group(1)), name))
+    versions.sort(reverse=True)
+    for _, name in versions[keep:]:
+        path = os.path.join(site_dir, name)
+        if os.path.realpath(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+@app.route("/api/publish", methods=["POST"])
+@login_required
+def publish_project():
+    """Publish the current project as an immutable static snapshot"""
+    version_dir = None
+    try:
+        user_id = session.get('user_id')
+        project_id = session.get('current_project_id')
+        
+        if not project_id:
+            return jsonify({'error': 'No active project'}), 400
+        
+        # Verify user owns this project
+        project = get_owned_project(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        files = ProjectFile.query.filter_by(project_id=project_id).options(db.selectinload(ProjectFile.blob)).all()
+        if not any(f.filename == 'index.html' for f in files):
+            return jsonify({'error': 'Project has no index.html to publish'}), 400
+        
+        latest = PublishedSnapshot.query.filter_by(project_id=project_id).order_by(PublishedSnapshot.version.desc()).first()
+        slug = latest.slug if latest else f"{generate_project_name(project.name)}-{secrets.token_hex(4)}"
+        version = latest.version + 1 if latest else 1
+        
+        site_dir = os.path.join(PUBLISHED_DIR, slug)
+        os.makedirs(site_dir, exist_ok=True)
+        
+        # Build into a hidden directory, then rename so a version dir is never half-written
+        build_dir = os.path.join(site_dir, f".build-{secrets.token_hex(4)}")
+        os.makedirs(build_dir)
+        try:
+            content_hash = build_static_snapshot(files, build_dir)
+            version_dirname = f"v{version}-{content_hash[:12]}"
+            target_dir = os.path.join(site_dir, version_dirname)
+            if os.path.isdir(target_dir):
+                # A concurrent publish of the same content got there first; its
+                # directory is identical, and only that request may remove it
+                shutil.rmtree(build_dir, ignore_errors=True)
+            else:
+                os.rename(build_dir, target_dir)
+                version_dir = target_dir
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        
+        # The flush claims the version number; the row is committed only once the site is live
+        db.session.add(PublishedSnapshot(
+            project_id=project_id,
+            slug=slug,
+            version=version,
+            content_hash=content_hash,
+            file_count=len(files)
+        ))
+        db.session.flush()
+        
+        current_link = os.path.join(site_dir, 'current')
+        previous_dirname = os.readlink(current_link) if os.path.islink(current_link) else None
+        activate_snapshot_dir(site_dir, version_dirname)
+        try:
+            db.session.commit()
+        except Exception:
+            # Put the previous version back, unless the directory is another request's
+            if version_dir and previous_dirname:
+                activate_snapshot_dir(site_dir, previous_dirname)
+            elif version_dir:
+                os.remove(current_link)
+            raise
+        version_dir = None  # live and committed: nothing below may remove it
+        prune_snapshot_dirs(site_dir, PUBLISH_KEEP_VERSIONS)
+        
+        logger.info("Published project", extra={'fields': {'project_id': project_id, 'slug': slug, 'version': version}})
+        
+        return jsonify({
+            'success': True,
+            'slug': slug,
+            'version': version,
+            'content_hash': content_hash,
+            'url': url_for('serve_published_file', slug=slug, _external=True)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        if version_dir:
+            shutil.rmtree(version_dir, ignore_errors=True)
+        error_msg = "Failed to publish project"
+        logger.exception("Error publishing project")
+        return jsonify({'error': error_msg}), 500
+
+@app.route("/api/publish", methods=["GET"])
+@login_required
+def list_published_versions():
+    """List published versions of the current project"""
+    user_id = session.get('user_id')
+    project_id = session.get('current_project_id')
+    
+    if not project_id:
+        return jsonify({'versions': []})
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    snapshots = PublishedSnapshot.query.filter_by(project_id=project_id).order_by(PublishedSnapshot.version.desc()).all()
+    if not snapshots:
+        return jsonify({'versions': []})
+    
+    current = os.path.basename(os.path.realpath(os.path.join(PUBLISHED_DIR, snapshots[0].slug, 'current')))
+    return jsonify({
+        'slug': snapshots[0].slug,
+        'url': url_for('serve_published_file', slug=snapshots[0].slug, _external=True),
+        'versions': [{
+            'version': s.version,
+            'content_hash': s.content_hash,
+            'file_count': s.file_count,
+            'created_at': s.created_at.isoformat() if s.created_at else None,
+            'live': current == f"v{s.version}-{s.content_hash[:12]}"
+        } for s in snapshots]
+    })
+
+@app.route("/api/publish/<int:version>/activate", methods=["POST"])
+@login_required
+def activate_published_version(version):
+    """Swap the live site of the current project to an earlier published version"""
+    user_id = session.get('user_id')
+    project_id = session.get('current_project_id')
+    
+    if not project_id:
+        return jsonify({'error': 'No active project'}), 400
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    snapshot = PublishedSnapshot.query.filter_by(project_id=project_id, version=version).first()
+    if not snapshot:
+        return jsonify({'error': 'Version not found'}), 404
+    
+    site_dir = os.path.join(PUBLISHED_DIR, snapshot.slug)
+    version_dirname = f"v{snapshot.version}-{snapshot.content_hash[:12]}"
+    if not os.path.isdir(os.path.join(site_dir, version_dirname)):
+        return jsonify({'error': 'Version is no longer available'}), 410
+    
+    activate_snapshot_dir(site_dir, version_dirname)
+    return jsonify({'success': True, 'version': version})
+
+@app.route("/p/<slug>/", defaults={'filename': 'index.html'})
+@app.route("/p/<slug>/<path:filename>")
+def serve_published_file(slug, filename):
+    """Serve a published site straight from disk - no login, session or database"""
+    if not re.match(r'^[a-z0-9-]+$', slug):
+        return "Not found", 404
+    
+    path = safe_join(PUBLISHED_DIR, slug, 'current', filename)
+    if not path or not os.path.isfile(path):
+        return "Not found", 404
+    
+    content_type = guess_content_type(filename)
+    precompressed = path + '.gz'
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and os.path.isfile(precompressed):
+        response = send_file(precompressed, mimetype=content_type, conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(path, mimetype=content_type, conditional=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    
+    if HASHED_ASSET_NAME.search(filename):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # Pages and assets under their original names are stable URLs, so
+        # browsers must revalidate them after a republish
+        response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+# --- End Publishing ---
+
+
 # --- Authentication Routes ---
 @app.route("/")
 def index():
@@ -781,13 +1219,8 @@ def contact():
             return render_template("contact.html", error="Invalid email address")
         
         try:
-            # Send email notification
-            msg = Message(
-                subject=f"Contact Form: {subject}",
-                sender=app.config['MAIL_USERNAME'],
-                recipients=['info@prabonyai.in']
-            )
-            msg.body = f"""
+            # Queue the email notification; the mail worker sends it
+            body = f"""
 New Contact Form Submission
 
 From: {name}
@@ -801,20 +1234,36 @@ Message:
 Sent from Bad Coder Contact Form
             """
             
-            mail.send(msg)
+            message_id = enqueue_mail(
+                redis_client,
+                subject=f"Contact Form: {subject}",
+                recipients=['info@prabonyai.in'],
+                body=body,
+                sender=app.config['MAIL_USERNAME']
+            )
             
             # Log success
-            print(f"✅ Email sent successfully from {name} ({email})")
+            logger.info("Contact email queued", extra={'fields': {'message_id': message_id}})
             
             # Return success response
             return render_template("contact.html", success=True)
             
         except Exception as e:
             # Log error without exposing details
-            print(f"❌ Email sending failed: {type(e).__name__}")
+            logger.error("Contact email queueing failed", extra={'fields': {'error': type(e).__name__}})
             return render_template("contact.html", error="Failed to send message. Please try again later or email us directly at info@prabonyai.in")
     
     return render_template("contact.html")
+
+@app.cli.command("send-mail")
+@click.option('--loop', is_flag=True, help='Keep running, delivering mail as it is queued.')
+def send_mail_command(loop):
+    """Deliver queued mail (one batch, or continuously with --loop)."""
+    if loop:
+        mail_worker.run()
+    else:
+        mail_worker.deliver_batch()
+        mail_worker.close()
     
 @app.route("/login")
 def login():
@@ -839,26 +1288,29 @@ def auth_callback():
             session['user_id'] = user.id
             session['user_email'] = user.email
             session['user_name'] = user.name
-            session['credits'] = user.credits
             # Don't store user_picture in session - load it from user_info on demand
             
             return redirect(url_for('index'))
         else:
-            print("No user info received")
+            logger.warning("OAuth callback without user info")
             return redirect(url_for('index'))
     except Exception as e:
         error_msg = str(e)
         if 'token' in error_msg.lower() or 'key' in error_msg.lower():
             error_msg = "Authentication error"
-        print(f"❌ OAuth error: {error_msg}")
-        # Only print traceback in debug mode
-        if app.debug:
-            import traceback
-            traceback.print_exc()
+        # Only log the traceback in debug mode
+        logger.error("OAuth error", extra={'fields': {'error': error_msg}}, exc_info=app.debug)
 
 @app.route("/logout")
 def logout():
     """Logout user"""
+    user_id = session.get('user_id')
+    if user_id:
+        # The GitHub token lives outside the session; don't leave it behind
+        try:
+            clear_user_links(redis_client, user_id)
+        except redis.RedisError as e:
+            logger.warning("Could not clear account links on logout", extra={'fields': {'user_id': user_id, 'error': type(e).__name__}})
     session.clear()
     clear_generated_files()
     return redirect(url_for('index'))
@@ -884,45 +1336,199 @@ def github_login():
 
 @app.route("/auth/github/callback")
 def github_callback():
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('index'))
     try:
         token = github.authorize_access_token()
         
-        # ===== FIX: Only store the token string, not the entire object =====
-        if isinstance(token, dict):
-            session['github_token'] = token.get('access_token', '')
-        else:
-            session['github_token'] = str(token)
-        
         # Get GitHub user info
         resp = github.get('user', token=token)
         github_user = resp.json()
-        session['github_username'] = github_user.get('login', '')
         
-        print(f"✅ GitHub linked for user: {github_user['login']}")
+        # Only the token string is kept, with the user rather than the session
+        access_token = token.get('access_token', '') if isinstance(token, dict) else str(token)
+        set_github_link(redis_client, user_id, access_token, github_user.get('login', ''))
+        
+        logger.info("GitHub linked", extra={'fields': {'github_username': github_user['login']}})
         return redirect(url_for('main_page'))
     except Exception as e:
         error_msg = str(e)
         if 'token' in error_msg.lower() or 'key' in error_msg.lower():
             error_msg = "GitHub authentication error"
-        print(f"❌ GitHub OAuth error: {error_msg}")
+        logger.error("GitHub OAuth error", extra={'fields': {'error': error_msg}})
         return redirect(url_for('main_page'))
 
+# Pushes run on a small background pool; job state lives in Redis so any
+# worker process can answer status polls. While a process holds a job
+# (queued or running) it renews a short heartbeat lease for it, together
+# with the job's dedupe key; a job whose lease ran out was lost with its
+# process and is reported as failed.
+GITHUB_PUSH_WORKERS = int(os.getenv('GITHUB_PUSH_WORKERS', '4'))
+GITHUB_PUSH_MAX_ATTEMPTS = 4
+GITHUB_PUSH_MAX_BACKOFF = 60  # seconds
+GITHUB_PUSH_JOB_TTL = 24 * 60 * 60
+GITHUB_PUSH_LEASE = 60  # seconds
+GITHUB_PUSH_HEARTBEAT_INTERVAL = 15  # seconds
+github_push_executor = ThreadPoolExecutor(max_workers=GITHUB_PUSH_WORKERS, thread_name_prefix='github-push')
+
+# job id -> dedupe key, for the jobs this process is holding
+_held_push_jobs = {}
+_held_push_jobs_lock = threading.Lock()
+_push_heartbeat_thread = None
+
+def _push_job_key(job_id):
+    return f"github_push:job:{job_id}"
+
+def _push_heartbeat_key(job_id):
+    return f"github_push:heartbeat:{job_id}"
+
+def _renew_push_leases(held):
+    pipe = redis_client.pipeline()
+    for job_id, dedupe_key in held.items():
+        pipe.set(_push_heartbeat_key(job_id), 1, ex=GITHUB_PUSH_LEASE)
+        pipe.expire(dedupe_key, GITHUB_PUSH_LEASE)
+    pipe.execute()
+
+def _push_heartbeat():
+    while True:
+        time.sleep(GITHUB_PUSH_HEARTBEAT_INTERVAL)
+        with _held_push_jobs_lock:
+            held = dict(_held_push_jobs)
+        if not held:
+            continue
+        try:
+            _renew_push_leases(held)
+        except redis.RedisError as e:
+            logger.warning("Could not renew GitHub push leases", extra={'fields': {'error': type(e).__name__}})
+
+def hold_push_job(job_id, dedupe_key):
+    """Keeps the job's lease alive from this process until release_push_job()"""
+    global _push_heartbeat_thread
+    _renew_push_leases({job_id: dedupe_key})
+    with _held_push_jobs_lock:
+        _held_push_jobs[job_id] = dedupe_key
+        if _push_heartbeat_thread is None or not _push_heartbeat_thread.is_alive():
+            _push_heartbeat_thread = threading.Thread(target=_push_heartbeat, name='github-push-heartbeat', daemon=True)
+            _push_heartbeat_thread.start()
+
+def release_push_job(job_id, dedupe_key):
+    with _held_push_jobs_lock:
+        _held_push_jobs.pop(job_id, None)
+    pipe = redis_client.pipeline()
+    pipe.delete(_push_heartbeat_key(job_id))
+    pipe.delete(dedupe_key)
+    pipe.execute()
+
+def get_push_job(job_id):
+    """The job's state; an unfinished job whose lease ran out is marked failed"""
+    raw = redis_client.get(_push_job_key(job_id))
+    if not raw:
+        return None
+    job = json.loads(raw)
+    if job['status'] not in ('done', 'failed') and not redis_client.exists(_push_heartbeat_key(job_id)):
+        update_push_job(job, status='failed', error='The push was interrupted. Please try again.')
+        logger.warning("GitHub push lost", extra={'fields': {'job_id': job_id}})
+    return job
+
+def update_push_job(job, **changes):
+    job.update(changes, updated_at=time.time())
+    redis_client.set(_push_job_key(job['id']), json.dumps(job), ex=GITHUB_PUSH_JOB_TTL)
+
+def _is_retryable(error):
+    """Rate limits, abuse limits and GitHub-side failures are worth retrying"""
+    if error.status in (403, 429):
+        return error.retry_after is not None or error.status == 429
+    return error.status is None or error.status >= 500
+
+def run_push_job(job, github_token, dedupe_key, release_slot):
+    """Background worker: pushes the project's files with retry and backoff.
+
+    release_slot frees the rate limiter's in-flight slot the request handed over.
+    """
+    try:
+        with app.app_context():
+            files = ProjectFile.query.filter_by(project_id=job['project_id']).options(db.selectinload(ProjectFile.blob)).all()
+            contents = {
+                file.filename: file.content_binary if file.content_binary else (file.content or '').encode('utf-8')
+                for file in files
+            }
+            db.session.remove()
+        
+        def progress(done, total):
+            update_push_job(job, status='running', files_done=done, files_total=total)
+        
+        for attempt in range(1, GITHUB_PUSH_MAX_ATTEMPTS + 1):
+            update_push_job(job, status='running', attempt=attempt, files_done=0)
+            client = GitHubClient(github_token)
+            try:
+                result = push_files(
+                    client,
+                    job['owner'],
+                    job['repo_name'],
+                    contents,
+                    job['commit_message'],
+                    description=job['description'],
+                    progress=progress
+                )
+                break
+            except GitHubPushError as e:
+                if attempt == GITHUB_PUSH_MAX_ATTEMPTS or not _is_retryable(e):
+                    raise
+                delay = e.retry_after if e.retry_after is not None else 2 ** attempt + random.random()
+                delay = min(delay, GITHUB_PUSH_MAX_BACKOFF)
+                logger.warning("GitHub push retrying", extra={'fields': {
+                    'job_id': job['id'], 'status': e.status, 'attempt': attempt, 'delay': delay
+                }})
+                update_push_job(job, status='retrying', retry_at=time.time() + delay, error='GitHub is busy, retrying shortly')
+                time.sleep(delay)
+            finally:
+                client.close()
+        
+        update_push_job(
+            job,
+            status='done',
+            commit_sha=result['commit_sha'],
+            files_done=len(contents),
+            files_total=len(contents),
+            message='Files pushed to GitHub successfully!' if result['commit_sha'] else 'Repository is already up to date',
+            error=None
+        )
+        logger.info("Pushed to GitHub", extra={'fields': {
+            'job_id': job['id'],
+            'repo': job['repo_name'],
+            'commit': result['commit_sha'],
+            'changed_files': result['changed'],
+            'created_repo': result['created_repo']
+        }})
+    except Exception as e:
+        error_msg = "GitHub authentication error" if getattr(e, 'status', None) == 401 else "Failed to push to GitHub"
+        update_push_job(job, status='failed', error=error_msg)
+        logger.error("Error pushing to GitHub", extra={'fields': {
+            'job_id': job['id'], 'error': type(e).__name__, 'status': getattr(e, 'status', None)
+        }})
+    finally:
+        release_push_job(job['id'], dedupe_key)
+        release_slot()
+
 @app.route("/api/push-to-github", methods=["POST"])
 @login_required
+@rate_limited
 def push_to_github():
-    """Push generated files to GitHub repository"""
+    """Queue a push of the project's files to GitHub; poll the returned status_url"""
     try:
-        if 'github_token' not in session:
+        user_id = session.get('user_id')
+        github_token, github_username = github_link(user_id)
+        if not github_token:
             return jsonify({'error': 'GitHub not linked. Please authenticate first.'}), 401
         
-        user_id = session.get('user_id')
         project_id = session.get('current_project_id')
         
         if not project_id:
             return jsonify({'error': 'No active project'}), 400
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -930,92 +1536,101 @@ def push_to_github():
         repo_name = data.get('repo_name', project.name.replace(' ', '-'))
         commit_message = data.get('commit_message', 'Add generated website files')
         
-        github_token = session.get('github_token')
-        github_username = session.get('github_username')
-        
-        # Get all files from database
-        files = ProjectFile.query.filter_by(project_id=project_id).all()
-        
-        if not files or len(files) == 0:
+        manifest = project_file_manifest(project_id)
+        if not manifest:
             return jsonify({'error': 'No files to push'}), 400
         
-        # Initialize PyGithub
-        from github import Github, GithubException
-        g = Github(github_token)
-        user = g.get_user()
-        
-        # Check if repo exists, if not create it
-        try:
-            repo = user.get_repo(repo_name)
-            print(f"✅ Using existing repo: {repo_name}")
-        except GithubException:
-            # Create new repo
-            repo = user.create_repo(
-                name=repo_name,
-                description=f'Generated website from Bad Coder - {project.name}',
-                private=False,
-                auto_init=True
-            )
-            print(f"✅ Created new repo: {repo_name}")
-        
-        # Push each file from database directly to GitHub
-        for file in files:
-            try:
-                # Get file content
-                if file.content_binary:
-                    # Binary file (image) - encode to base64
-                    import base64
-                    file_content = base64.b64encode(file.content_binary).decode('utf-8')
-                else:
-                    # Text file
-                    file_content = file.content
-                
-                # Try to update existing file
-                try:
-                    contents = repo.get_contents(file.filename)
-                    repo.update_file(
-                        contents.path,
-                        f"Update {file.filename}",
-                        file_content,
-                        contents.sha
-                    )
-                    print(f"✅ Updated {file.filename}")
-                except GithubException:
-                    # File doesn't exist, create it
-                    repo.create_file(
-                        file.filename,
-                        f"Add {file.filename}",
-                        file_content
-                    )
-                    print(f"✅ Created {file.filename}")
-                    
-            except Exception as file_err:
-                print(f"⚠️ Error pushing {file.filename}: {type(file_err).__name__}")
-                continue
+        # The same project state pushed to the same repo while a push is in flight joins that job
+        dedupe_key = f"github_push:active:{user_id}:{project_id}:{repo_name}:{combined_revision(manifest)}"
+        job_id = uuid.uuid4().hex
+        if not redis_client.set(dedupe_key, job_id, nx=True, ex=GITHUB_PUSH_LEASE):
+            existing_id = redis_client.get(dedupe_key)
+            existing_id = existing_id.decode() if isinstance(existing_id, bytes) else existing_id
+            existing = existing_id and get_push_job(existing_id)
+            if existing and existing['status'] not in ('done', 'failed'):
+                return jsonify({
+                    'job_id': existing_id,
+                    'status': existing['status'],
+                    'status_url': url_for('github_push_status', job_id=existing_id),
+                    'deduplicated': True
+                }), 202
+            redis_client.set(dedupe_key, job_id, ex=GITHUB_PUSH_LEASE)
+        
+        job = {
+            'id': job_id,
+            'user_id': user_id,
+            'project_id': project_id,
+            'owner': github_username,
+            'repo_name': repo_name,
+            'repo_url': f"https://github.com/{github_username}/{repo_name}",
+            'commit_message': commit_message,
+            'description': f'Generated website from Bad Coder - {project.name}',
+            'status': 'queued',
+            'files_done': 0,
+            'files_total': len(manifest),
+            'created_at': time.time()
+        }
+        update_push_job(job)
+        hold_push_job(job_id, dedupe_key)
+        # The push counts against the user's concurrent pushes until it finishes
+        github_push_executor.submit(run_push_job, job, github_token, dedupe_key, detach_inflight_slot())
         
-        repo_url = f"https://github.com/{github_username}/{repo_name}"
         return jsonify({
-            'success': True,
-            'message': f'Files pushed to GitHub successfully!',
-            'repo_url': repo_url,
-            'repo_name': repo_name
-        })
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('github_push_status', job_id=job_id)
+        }), 202
         
     except Exception as e:
         error_msg = "Failed to push to GitHub"
-        if 'token' in str(e).lower():
-            error_msg = "GitHub authentication error"
-        print(f"❌ Error pushing to GitHub: {type(e).__name__}")
+        logger.error("Error queueing GitHub push", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
 
+@app.route("/api/push-to-github/<job_id>")
+@login_required
+def github_push_status(job_id):
+    """Progress of a push job"""
+    job = get_push_job(job_id)
+    if not job or job['user_id'] != session.get('user_id'):
+        return jsonify({'error': 'Push job not found'}), 404
+    
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'files_done': job.get('files_done', 0),
+        'files_total': job.get('files_total', 0),
+        'attempt': job.get('attempt', 0),
+        'retry_at': job.get('retry_at') if job['status'] == 'retrying' else None,
+        'message': job.get('message'),
+        'error': job.get('error') if job['status'] in ('failed', 'retrying') else None,
+        'repo_url': job['repo_url'],
+        'repo_name': job['repo_name'],
+        'commit_sha': job.get('commit_sha')
+    })
+
+def github_link(user_id):
+    """(token, username) of the user's linked GitHub account, or (None, None).
+
+    Links made before the account moved out of the session are moved over
+    the first time they are read.
+    """
+    github_token, github_username = get_github_link(redis_client, user_id)
+    if 'github_token' in session:
+        legacy_token = session.pop('github_token')
+        legacy_username = session.pop('github_username', '')
+        if not github_token and legacy_token:
+            github_token, github_username = legacy_token, legacy_username
+            set_github_link(redis_client, user_id, github_token, github_username)
+    return github_token, github_username
+
 @app.route("/api/github-status")
 @login_required
 def github_status():
     """Check if GitHub is linked"""
-    is_linked = 'github_token' in session
+    github_token, github_username = github_link(session.get('user_id'))
     return jsonify({
-        'linked': is_linked,
-        'username': session.get('github_username', '')
+        'linked': bool(github_token),
+        'username': github_username or ''
     })
 # --- End Authentication Routes ---
 
@@ -1026,39 +1641,57 @@ def ping():
     """Ultra-minimal ping endpoint for uptime bots - returns only 1 byte"""
     return "1", 200, {'Content-Type': 'text/plain', 'Content-Length': '1'}
 
+MAIN_HISTORY_TURNS = 10
+MAIN_HISTORY_CODE_CHARS = 500
+
 @app.route("/main")
 @login_required
 def main_page():
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
+    user = get_user(user_id)
 
     history = []
+    has_earlier_history = False
 
+    credits = 0
+    project_name = 'New Project'
     if user:
-        # CHECK AND RESET CREDITS DAILY
-        check_and_reset_daily_credits(user)
-        
-        session['credits'] = user.credits
+        # Daily credits are worked out on read; only spending writes them
+        credits = effective_credits(user)[0]
         
         current_project_id = session.get('current_project_id')
+        project = get_owned_project(current_project_id, user_id) if current_project_id else None
+        if project:
+            project_name = project.name
         
         if current_project_id:
-            chat_history = ChatHistory.query.filter_by(
+            # Only the last few turns, with code truncated by the database;
+            # earlier turns load on demand from /api/project/<id>/chat
+            rows = db.session.query(
+                ChatHistory.id,
+                ChatHistory.prompt,
+                ChatHistory.response,
+                db.func.substr(ChatHistory.generated_code, 1, MAIN_HISTORY_CODE_CHARS).label('code_preview'),
+                ChatHistory.timestamp,
+                ChatHistory.created_files
+            ).filter_by(
                 user_id=user_id, 
                 project_id=current_project_id
-            ).order_by(ChatHistory.timestamp.asc()).all()
-
-            for chat in chat_history:
+            ).order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(MAIN_HISTORY_TURNS + 1).all()
+            
+            has_earlier_history = len(rows) > MAIN_HISTORY_TURNS
+            for chat in reversed(rows[:MAIN_HISTORY_TURNS]):
                 history.append({
+                    'id': chat.id,
                     'prompt': chat.prompt,
                     'description': chat.response,
-                    'generated_code': chat.generated_code[:500] + '...',
+                    'generated_code': (chat.code_preview or '') + '...',
                     'timestamp': chat.timestamp.isoformat() if chat.timestamp else None,
                     'created_files': chat.created_files
                 })
 
-    project_name = session.get('current_project_name', 'New Project')
-    return render_template("main.html", credits=session.get('credits', 3), history=history, project_name=project_name)
+    return render_template("main.html", credits=credits, history=history, project_name=project_name, preview_base_url=PREVIEW_BASE_URL,
+                           current_project_id=session.get('current_project_id'), has_earlier_history=has_earlier_history)
 
 
 # ===== COMPLETE /generate route with NOTHING REMOVED =====
@@ -1068,35 +1701,49 @@ def main_page():
 
 @app.route("/generate", methods=["POST"])
 @login_required
+@rate_limited
 def generate():
     user_id = session.get('user_id')
-    user = db.session.get(User, user_id)
-
-    check_and_reset_daily_credits(user)
+    user = get_user(user_id)
 
     # ADD THIS: Validate API key is available
     if not GEMINI_API_KEY:
         return jsonify({"error": "API configuration error. Please contact support."}), 500
     
-    if not user or user.credits <= 0:
+    if not user:
         return jsonify({"error": "No credits left!"})
     
     # Handle both FormData and JSON
     if request.content_type and 'multipart/form-data' in request.content_type:
+        limit_image_request()
         prompt = request.form.get("prompt", "").strip()
         is_modification_val = request.form.get("is_modification", "")
         is_modification = is_modification_val.lower() == "true" if is_modification_val else False
-        previous_code = request.form.get("previous_code", "")
+        base_revision = request.form.get("base_revision", type=int)
         uploaded_images = request.files.getlist("images")
     else:
         data = request.get_json()
         prompt = data.get("prompt", "").strip()
         is_modification = bool(data.get("is_modification", False))
-        previous_code = data.get("previous_code", "")
+        base_revision = data.get("base_revision")
+        if not isinstance(base_revision, int):
+            base_revision = None
         uploaded_images = []
 
     if not prompt:
         return jsonify({"error": "Prompt cannot be empty."})
+    
+    # Read and check attached images before spending a generation on them
+    try:
+        image_uploads = [
+            (secure_filename(img.filename), read_image_upload(img))
+            for img in uploaded_images[:IMAGE_UPLOAD_MAX_FILES]  # Limit to 3 images
+            if img and allowed_file(img.filename)
+        ]
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return jsonify({"error": f"Images must be {IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)} MB or smaller"}), 413
+    except InvalidImageUpload as e:
+        return jsonify({"error": f"File is not a valid image: {e}"}), 400
 
     # ===== FIX 1: Handle project name properly for modifications =====
     if not is_modification:
@@ -1104,15 +1751,34 @@ def generate():
     else:
         # For modifications, keep existing project name
         project_id = session.get('current_project_id')
-        if project_id:
-            project = Project.query.get(project_id)
-            project_name = project.name if project else 'Untitled'
-        else:
-            project_name = session.get('current_project_name', 'Untitled')
+        if not project_id:
+            return jsonify({"error": "No active project for modification"})
+        
+        project = get_owned_project(project_id, user_id)
+        if not project:
+            return jsonify({"error": "Unauthorized"}), 403
+        project_name = project.name
+        
+        # The stored index.html is the base for the change; the client only
+        # says which revision it was looking at
+        index_file = ProjectFile.query.filter_by(project_id=project_id, filename='index.html').first()
+        if base_revision is not None and (not index_file or index_file.revision != base_revision):
+            return jsonify({
+                "error": "This project was changed elsewhere. Reload it before making changes.",
+                "revision": index_file.revision if index_file else None
+            }), 409
+        base_code = index_file.content if index_file else ''
+
+    # ===== RESERVE CREDIT =====
+    # Taken atomically before any model work; refunded below if generation fails
+    reservation_id = new_reservation_id()
+    remaining_credits = reserve_credit(user_id, reservation_id)
+    if remaining_credits is None:
+        return jsonify({"error": "No credits left!"})
 
     try:
         # ===== AI PROMPT SETUP =====
-        if is_modification and previous_code:
+        if is_modification and base_code:
             system_prompt = """ STOP! READ THIS FIRST 
 
 index.html must be MAXIMUM 350 LINES OF HTML.
@@ -1152,7 +1818,7 @@ DO NOT refuse to make changes. If user asks for new pages, UPDATE THE NAVIGATION
 
 CURRENT CODE:
 ```html
-{previous_code}
+{base_code}
 ```
 
 USER REQUEST: {prompt}
@@ -1324,6 +1990,7 @@ UI STYLING:
 
         # ===== DATABASE STORAGE =====
         all_files = ['index.html']
+        new_images = []
         
         if not is_modification:
             # NEW PROJECT: Create and save all files
@@ -1332,19 +1999,19 @@ UI STYLING:
             db.session.flush()
             project_id = project.id
             session['current_project_id'] = project_id
-            session['current_project_name'] = project_name  # Store in session too
             
             # Save index.html
-            db.session.add(ProjectFile(
+            index_file = ProjectFile(
                 project_id=project_id,
                 filename='index.html',
                 content=generated_code,
                 file_type='html'
-            ))
+            )
+            db.session.add(index_file)
             
             # Generate and save additional pages
             for page_info in pages_to_generate:
-                print(f"Generating content for: {page_info['filename']}")
+                logger.info("Generating page", extra={'fields': {'project_id': project_id, 'filename': page_info['filename']}})
                 page_html = generate_page_with_ai(page_info, generated_code, prompt)
                 db.session.add(ProjectFile(
                     project_id=project_id,
@@ -1378,34 +2045,25 @@ UI STYLING:
                 all_files.append('scripts.js')
                 _extracted_js = None
             
-            # Handle uploaded images
-            if uploaded_images:
-                for img in uploaded_images[:3]:  # Limit to 3 images
-                    if img and allowed_file(img.filename):
-                        filename = secure_filename(img.filename)
-                        # Read image content as binary
-                        img_content = img.read()
-            
-                        db.session.add(ProjectFile(
-                            project_id=project_id,
-                            filename=filename,
-                            content=None,  # Binary files don't use text content
-                            content_binary=img_content,  # Store raw binary
-                            file_type=filename.rsplit('.', 1)[1].lower()
-                        ))
-                        all_files.append(filename)
+            # Handle uploaded images (read and validated above)
+            for filename, img_content in image_uploads:
+                image_file = ProjectFile(
+                    project_id=project_id,
+                    filename=filename,
+                    content=None,  # Binary files don't use text content
+                    content_binary=img_content,  # Store raw binary
+                    file_type=filename.rsplit('.', 1)[1].lower()
+                )
+                db.session.add(image_file)
+                new_images.append(image_file)
+                all_files.append(filename)
             
         else:
             # ===== FIX 2: MODIFICATION - Preserve CSS/JS files =====
-            project_id = session.get('current_project_id')
-            if not project_id:
-                return jsonify({"error": "No active project for modification"})
-            
-            project = Project.query.get(project_id)
-            if not project or project.user_id != user_id:
-                return jsonify({"error": "Unauthorized"}), 403
-            
-            project.updated_at = datetime.datetime.utcnow()
+            # (project and index_file were loaded and checked above)
+            db.session.execute(db.update(Project).where(Project.id == project_id).values(
+                updated_at=datetime.datetime.utcnow()
+            ))
             
             # **FIX: Only delete HTML files, preserve CSS/JS and images**
             existing_files = ProjectFile.query.filter_by(project_id=project_id).all()
@@ -1416,7 +2074,7 @@ UI STYLING:
             existing_images = []
             
             for file in existing_files:
-                if file.file_type == 'html':
+                if file.file_type == 'html' and file.filename != 'index.html':
                     db.session.delete(file)  # Delete old HTML files
                 elif file.filename == 'styles.css':
                     existing_css = file
@@ -1425,17 +2083,22 @@ UI STYLING:
                 elif file.file_type in ['png', 'jpg', 'jpeg', 'gif', 'svg']:
                     existing_images.append(file)
             
-            # Save updated index.html
-            db.session.add(ProjectFile(
-                project_id=project_id,
-                filename='index.html',
-                content=generated_code,
-                file_type='html'
-            ))
+            # Update index.html in place so its revision keeps counting up
+            if index_file:
+                index_file.content = generated_code
+                index_file.updated_at = datetime.datetime.utcnow()
+            else:
+                index_file = ProjectFile(
+                    project_id=project_id,
+                    filename='index.html',
+                    content=generated_code,
+                    file_type='html'
+                )
+                db.session.add(index_file)
             
             # Generate any new pages
             for page_info in pages_to_generate:
-                print(f"Creating/updating page: {page_info['filename']}")
+                logger.info("Creating/updating page", extra={'fields': {'project_id': project_id, 'filename': page_info['filename']}})
                 page_html = generate_page_with_ai(page_info, generated_code, prompt)
                 db.session.add(ProjectFile(
                     project_id=project_id,
@@ -1489,32 +2152,35 @@ UI STYLING:
                 all_files.append(img_file.filename)
         
         # Clear Figma URL from session after use
-        session.pop('figma_url', None)
+        clear_figma_url(redis_client, user_id)
         
         db.session.commit()
+        index_revision = index_file.revision
+        queue_image_variants([f.id for f in new_images])
         # ===== END DATABASE STORAGE =====
 
+    except StaleDataError:
+        # index.html was saved elsewhere while this generation ran
+        db.session.rollback()
+        refund_credit(user_id, reservation_id)
+        return jsonify({"error": "This project was changed elsewhere. Reload it before making changes."}), 409
     except Exception as e:
         db.session.rollback()
+        refund_credit(user_id, reservation_id)
         # Log error without exposing sensitive data
         error_msg = str(e)
         if 'api' in error_msg.lower() and 'key' in error_msg.lower():
             error_msg = "API configuration error. Please contact support."
-        print(f"❌ Generation error: {error_msg}")
+        logger.error("Generation error", extra={'fields': {'error': error_msg}})
         return jsonify({"error": error_msg})
 
-    # ===== UPDATE USER CREDITS =====
-    user.credits -= 1
-    db.session.commit()
-    session['credits'] = user.credits
-    
     # ===== CREATE CHAT RECORD =====
     record = {
         "prompt": prompt,
         "generated_code": generated_code,
         "description": description,
         "timestamp": str(datetime.datetime.now()),
-        "remaining_credits": user.credits,
+        "remaining_credits": remaining_credits,
         "filename": "index.html",
         "created_files": all_files,
         "was_modification": is_modification
@@ -1532,84 +2198,337 @@ UI STYLING:
         "code": generated_code,
         "description": description,
         "suggestions": [],
-        "credits": user.credits,
+        "credits": remaining_credits,
         "timestamp": record["timestamp"],
         "filename": "index.html",
         "created_files": all_files,
-        "project_name": project_name  # Return the correct project name
+        "project_name": project_name,  # Return the correct project name
+        "index_revision": index_revision
     })
 
+PROJECTS_PAGE_SIZE = 30
+PROJECTS_MAX_PAGE_SIZE = 100
+PROJECT_PREVIEW_CHARS = 160
+
+def encode_cursor(values):
+    """Opaque pagination cursor from a list of JSON-serializable values"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for a malformed cursor"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+
 @app.route("/api/projects", methods=["GET"])
 @login_required
 def get_user_projects():
-    """Get all projects for logged-in user"""
+    """Get a page of projects for logged-in user, most recently updated first.
+
+    Query params: limit, cursor (from next_cursor), q (name prefix).
+    """
     user_id = session.get('user_id')
     
     try:
-        # Get all projects with their latest chat
-        projects = Project.query.filter_by(user_id=user_id).order_by(Project.updated_at.desc()).all()
+        limit = min(max(request.args.get('limit', PROJECTS_PAGE_SIZE, type=int), 1), PROJECTS_MAX_PAGE_SIZE)
+        
+        # First prompt of each project, fetched in the same query as the projects
+        first_prompt = db.select(db.func.substr(ChatHistory.prompt, 1, PROJECT_PREVIEW_CHARS)).where(
+            ChatHistory.project_id == Project.id
+        ).order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc()).limit(1).correlate(Project).scalar_subquery()
+        
+        query = db.session.query(
+            Project.id, Project.name, Project.created_at, Project.updated_at, first_prompt
+        ).filter(Project.user_id == user_id)
+        
+        prefix = request.args.get('q', '').strip()
+        if prefix:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(Project.name.ilike(escaped + '%', escape='\\'))
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            position = decode_cursor(cursor)
+            try:
+                if not isinstance(position, list) or len(position) != 2:
+                    raise ValueError(position)
+                updated_at = datetime.datetime.fromisoformat(position[0])
+                if not isinstance(position[1], int) or isinstance(position[1], bool):
+                    raise TypeError(position[1])
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(db.or_(
+                Project.updated_at < updated_at,
+                db.and_(Project.updated_at == updated_at, Project.id < position[1])
+            ))
+        
+        rows = query.order_by(Project.updated_at.desc(), Project.id.desc()).limit(limit + 1).all()
         
         result = []
-        for project in projects:
-            # Get first chat message for preview
-            first_chat = ChatHistory.query.filter_by(project_id=project.id).order_by(ChatHistory.timestamp.asc()).first()
-            
+        for project_id, name, created_at, updated_at, preview in rows[:limit]:
             result.append({
-                'id': project.id,
-                'name': project.name,
-                'created_at': project.created_at.isoformat(),
-                'updated_at': project.updated_at.isoformat(),
-                'preview': first_chat.prompt if first_chat else 'New Project'
+                'id': project_id,
+                'name': name,
+                'created_at': created_at.isoformat(),
+                'updated_at': updated_at.isoformat(),
+                'preview': preview or 'New Project'
             })
         
-        return jsonify({'projects': result})
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last.updated_at.isoformat(), last.id])
+        
+        return jsonify({'projects': result, 'next_cursor': next_cursor})
     except Exception as e:
         error_msg = "Failed to load projects"
-        print(f"❌ Error loading projects: {type(e).__name__}")
+        logger.error("Error loading projects", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
 
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_TERMS = 8
+SEARCH_SNIPPET_WORDS = 12
+
+# Highlights come back wrapped in these markers; clients escape the snippet
+# and then turn the (escaped) markers into <mark> elements.
+_SEARCH_SQL = {
+    # Ranks only the matching rows and builds headlines for the final page
+    'postgresql': db.text("""
+        WITH hits AS (
+            SELECT s.id, ts_rank(s.document, query) AS rank
+            FROM search_entries s, to_tsquery('english', :query) query
+            WHERE s.user_id = :user_id AND s.document @@ query
+            ORDER BY rank DESC
+            LIMIT :limit
+        )
+        SELECT s.kind, s.ref_id, s.project_id, p.name AS project_name, s.title,
+               ts_headline('english', left(coalesce(s.body, ''), 20000), to_tsquery('english', :query),
+                           'StartSel=<mark>, StopSel=</mark>, MaxWords=' || :words || ', MinWords=5, MaxFragments=1') AS snippet
+        FROM hits
+        JOIN search_entries s ON s.id = hits.id
+        LEFT JOIN projects p ON p.id = s.project_id
+        ORDER BY hits.rank DESC
+    """),
+    'sqlite': db.text("""
+        SELECT s.kind, s.ref_id, s.project_id, p.name AS project_name, s.title,
+               snippet(search_entries_fts, 1, '<mark>', '</mark>', '…', :words) AS snippet
+        FROM search_entries_fts
+        JOIN search_entries s ON s.id = search_entries_fts.rowid
+        LEFT JOIN projects p ON p.id = s.project_id
+        WHERE search_entries_fts MATCH :query AND s.user_id = :user_id
+        ORDER BY bm25(search_entries_fts, 5.0, 1.0)
+        LIMIT :limit
+    """),
+}
+
+def search_query(text, dialect):
+    """Prefix query over the words in text, in the dialect's query syntax.
+
+    Only word characters are kept, so user input cannot inject operators.
+    """
+    terms = re.findall(r'\w+', text)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    if dialect == 'postgresql':
+        return ' & '.join(f"{term}:*" for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+@app.route("/api/search", methods=["GET"])
+@login_required
+def search():
+    """Full-text search over the user's project names, chat messages and text files.
+
+    Query params: q, limit. Results are ranked best first.
+    """
+    user_id = session.get('user_id')
+    dialect = db.engine.dialect.name
+    if dialect not in _SEARCH_SQL:
+        return jsonify({'error': 'Search is not available'}), 501
+
+    query = search_query(request.args.get('q', ''), dialect)
+    if not query:
+        return jsonify({'results': []})
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), PROJECTS_MAX_PAGE_SIZE)
+
+    try:
+        started = time.perf_counter()
+        rows = db.session.execute(_SEARCH_SQL[dialect], {
+            'query': query, 'user_id': user_id, 'limit': limit, 'words': SEARCH_SNIPPET_WORDS
+        }).all()
+        logger.info("Search", extra={'fields': {
+            'results': len(rows), 'ms': round((time.perf_counter() - started) * 1000, 1)
+        }})
+    except Exception as e:
+        logger.error("Search failed", extra={'fields': {'error': type(e).__name__}})
+        return jsonify({'error': 'Search failed'}), 500
+
+    results = []
+    for row in rows:
+        result = {
+            'kind': row.kind,
+            'project_id': row.project_id,
+            'project_name': row.project_name,
+            'title': (row.title or '')[:PROJECT_PREVIEW_CHARS],
+            'snippet': row.snippet or '',
+        }
+        if row.kind == 'chat':
+            result['chat_id'] = row.ref_id
+        elif row.kind == 'file':
+            result['filename'] = row.title
+        results.append(result)
+    return jsonify({'results': results})
+
+CHAT_PAGE_SIZE = 20
+CHAT_SUMMARY_CHARS = 120
+
 @app.route("/api/project/<int:project_id>", methods=["GET"])
 @login_required
 def get_project_details(project_id):
-    """Get specific project with all files and chat history"""
+    """Get a project manifest: file metadata and chat summaries, no content.
+
+    File content comes from /api/project/<id>/file/<filename> and full chat
+    messages from /api/project/<id>/chat, so clients fetch only what they render.
+    """
     user_id = session.get('user_id')
     
     try:
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        # Get all files
-        files = ProjectFile.query.filter_by(project_id=project_id).all()
+        files = db.session.query(
+            ProjectFile.id, ProjectFile.filename, ProjectFile.file_type,
+            ProjectFile.revision, ProjectFile.size_bytes, ProjectFile.content_hash
+        ).filter_by(project_id=project_id).order_by(ProjectFile.filename).all()
         files_data = [{
             'filename': f.filename,
-            'content': f.content,
-            'file_type': f.file_type
+            'file_type': f.file_type,
+            'revision': f.revision,
+            'size': f.size_bytes,
+            'hash': f.content_hash
         } for f in files]
         
-        # Get chat history
-        chats = ChatHistory.query.filter_by(project_id=project_id).order_by(ChatHistory.timestamp.asc()).all()
+        chats = db.session.query(
+            ChatHistory.id,
+            db.func.substr(ChatHistory.prompt, 1, CHAT_SUMMARY_CHARS).label('summary'),
+            ChatHistory.timestamp
+        ).filter_by(project_id=project_id).order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc()).all()
         chat_data = [{
-            'prompt': c.prompt,
-            'response': c.response,
-            'generated_code': c.generated_code,
-            'timestamp': c.timestamp.isoformat(),
-            'created_files': c.created_files
+            'id': c.id,
+            'summary': c.summary,
+            'timestamp': c.timestamp.isoformat() if c.timestamp else None
         } for c in chats]
         
         return jsonify({
             'project': {
                 'id': project.id,
                 'name': project.name,
+                'revision': combined_revision([(f.id, f.filename, f.revision, 0) for f in files]),
                 'files': files_data,
-                'chat_history': chat_data
+                'chats': chat_data
             }
         })
     except Exception as e:
         error_msg = "Failed to load project details"
-        print(f"❌ Error loading project: {type(e).__name__}")
+        logger.error("Error loading project", extra={'fields': {'project_id': project_id, 'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
+
+@app.route("/api/project/<int:project_id>/file/<path:filename>", methods=["GET"])
+@login_required
+def get_project_file(project_id, filename):
+    """Raw content of one project file.
+
+    Cached by content hash: requests carrying ?v=<hash> are immutable, others
+    revalidate with the hash as ETag.
+    """
+    user_id = session.get('user_id')
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    file = ProjectFile.query.filter_by(project_id=project_id, filename=filename).first()
+    if not file:
+        return jsonify({'error': 'File not found'}), 404
+    
+    etag = f'"{file.content_hash}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag, 'X-File-Revision': str(file.revision)}
+    
+    headers = {'Content-Type': guess_content_type(filename), 'ETag': etag, 'X-File-Revision': str(file.revision)}
+    if request.args.get('v') == file.content_hash:
+        headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        headers['Cache-Control'] = 'private, no-cache'
+    
+    if file.content_binary:
+        return file.content_binary, 200, headers
+    return file.content or '', 200, headers
+
+@app.route("/api/project/<int:project_id>/chat", methods=["GET"])
+@login_required
+def get_project_chat(project_id):
+    """Page of chat messages, newest first, without generated code.
+
+    Query params: before (a chat id, from next_before), limit.
+    """
+    user_id = session.get('user_id')
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), 100)
+    query = db.session.query(
+        ChatHistory.id, ChatHistory.prompt, ChatHistory.response, ChatHistory.timestamp,
+        ChatHistory.created_files, ChatHistory.was_modification
+    ).filter_by(project_id=project_id)
+    
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(ChatHistory.id < before)
+    
+    rows = query.order_by(ChatHistory.id.desc()).limit(limit + 1).all()
+    messages = [{
+        'id': c.id,
+        'prompt': c.prompt,
+        'response': c.response,
+        'timestamp': c.timestamp.isoformat() if c.timestamp else None,
+        'created_files': c.created_files,
+        'was_modification': c.was_modification
+    } for c in rows[:limit]]
+    
+    return jsonify({
+        'messages': messages,
+        'next_before': rows[limit - 1].id if len(rows) > limit else None
+    })
+
+@app.route("/api/project/<int:project_id>/chat/<int:chat_id>", methods=["GET"])
+@login_required
+def get_project_chat_message(project_id, chat_id):
+    """One chat message including its generated code (messages never change)"""
+    user_id = session.get('user_id')
+    
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    chat = ChatHistory.query.filter_by(id=chat_id, project_id=project_id).first()
+    if not chat:
+        return jsonify({'error': 'Message not found'}), 404
+    
+    response = jsonify({
+        'id': chat.id,
+        'prompt': chat.prompt,
+        'response': chat.response,
+        'generated_code': chat.generated_code,
+        'timestamp': chat.timestamp.isoformat() if chat.timestamp else None,
+        'created_files': chat.created_files
+    })
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
     
 @app.route("/api/restore-files", methods=["POST"])
 @login_required
@@ -1625,21 +2544,20 @@ def restore_files():
         user_id = session.get('user_id')
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
         # Set in session - this is all we need!
         session['current_project_id'] = project_id
-        session['current_project_name'] = project.name
         
-        print(f"✅ Restored project {project_id} ({project.name})")
+        logger.info("Restored project", extra={'fields': {'project_id': project_id}})
         
         return jsonify({'success': True, 'project_id': project_id})
         
     except Exception as e:
         error_msg = "Failed to restore project"
-        print(f"❌ Error restoring project: {type(e).__name__}")
+        logger.error("Error restoring project", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
     
 @app.route("/api/update-project-name", methods=["POST"])
@@ -1668,6 +2586,7 @@ def update_project_name():
         project.name = new_name
         project.updated_at = datetime.datetime.utcnow()
         db.session.commit()
+        invalidate_project(project.id)
         
         return jsonify({
             'success': True,
@@ -1677,23 +2596,133 @@ def update_project_name():
         
     except Exception as e:
         error_msg = "Failed to update project name"
-        print(f"❌ Error updating project name: {type(e).__name__}")
+        logger.error("Error updating project name", extra={'fields': {'error': type(e).__name__}})
         db.session.rollback()
         return jsonify({'error': error_msg}), 500
 
+def _copy_project_rows(source_id, fork_id, user_id, last_chat=None):
+    """Copies files, image variants, chat history and search entries of a
+    project into another one with INSERT ... SELECT. Files and variants
+    point at their content by hash, so the copies share the source's blobs
+    and no file bytes are read or written; a write to either side stores a
+    new blob for that file only. With last_chat, only chats up to it are copied.
+    """
+    params = {'source': source_id, 'fork': fork_id, 'user_id': user_id}
+    db.session.execute(db.text("""
+        INSERT INTO project_files (project_id, filename, file_type, is_binary, revision,
+                                   asset_refs, content_hash, size_bytes, created_at, updated_at)
+        SELECT :fork, filename, file_type, is_binary, 1,
+               asset_refs, content_hash, size_bytes, created_at, updated_at
+        FROM project_files WHERE project_id = :source
+    """), params)
+    # Variants are keyed by source hash, so they stay valid for the copies
+    db.session.execute(db.text("""
+        INSERT INTO image_variants (file_id, source_hash, width, height, format, blob_hash, size_bytes, created_at)
+        SELECT copy.id, v.source_hash, v.width, v.height, v.format, v.blob_hash, v.size_bytes, v.created_at
+        FROM image_variants v
+        JOIN project_files src ON src.id = v.file_id AND src.project_id = :source
+        JOIN project_files copy ON copy.project_id = :fork AND copy.filename = src.filename
+    """), params)
+    db.session.execute(db.text("""
+        INSERT INTO search_entries (user_id, project_id, kind, ref_id, title, body)
+        SELECT :user_id, :fork, 'file', copy.id, e.title, e.body
+        FROM search_entries e
+        JOIN project_files src ON e.kind = 'file' AND e.ref_id = src.id AND src.project_id = :source
+        JOIN project_files copy ON copy.project_id = :fork AND copy.filename = src.filename
+    """), params)
+
+    chat_filter = ''
+    if last_chat:
+        chat_filter = 'AND (timestamp < :turn_at OR (timestamp = :turn_at AND id <= :turn_id))'
+        params.update(turn_at=last_chat.timestamp, turn_id=last_chat.id)
+    db.session.execute(db.text(f"""
+        INSERT INTO chat_history (user_id, project_id, prompt, response, generated_code,
+                                  was_modification, created_files, timestamp)
+        SELECT user_id, :fork, prompt, response, generated_code, was_modification, created_files, timestamp
+        FROM chat_history WHERE project_id = :source {chat_filter}
+        ORDER BY timestamp, id
+    """), params)
+    db.session.execute(db.text("""
+        INSERT INTO search_entries (user_id, project_id, kind, ref_id, title, body)
+        SELECT user_id, project_id, 'chat', id, prompt, coalesce(response, '')
+        FROM chat_history WHERE project_id = :fork
+    """), params)
+
+@app.route("/api/fork-project", methods=["POST"])
+@login_required
+def fork_project():
+    """Create a copy of a project to try a variation without regenerating it.
+
+    Body: project_id (default: current project), chat_id (fork at that turn:
+    its index.html and only the chat up to it), name.
+    """
+    data = request.get_json(silent=True) or {}
+    for field in ('project_id', 'chat_id'):
+        value = data.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return jsonify({'error': f'{field} must be an integer'}), 400
+    name = data.get('name') or ''
+    if not isinstance(name, str):
+        return jsonify({'error': 'name must be a string'}), 400
+
+    user_id = session.get('user_id')
+    project_id = data.get('project_id') or session.get('current_project_id')
+    if not project_id:
+        return jsonify({'error': 'No active project'}), 400
+
+    source = get_owned_project(project_id, user_id)
+    if not source:
+        return jsonify({'error': 'Project not found'}), 404
+
+    turn = None
+    if data.get('chat_id'):
+        turn = ChatHistory.query.filter_by(id=data['chat_id'], project_id=source.id).first()
+        if not turn:
+            return jsonify({'error': 'Chat message not found'}), 404
+        if not turn.generated_code:
+            return jsonify({'error': 'That message has no generated page to fork from'}), 400
+
+    name = name.strip()[:255] or f"{source.name} (fork)"[:255]
+
+    try:
+        fork = Project(user_id=user_id, name=name)
+        db.session.add(fork)
+        db.session.flush()
+        _copy_project_rows(source.id, fork.id, user_id, last_chat=turn)
+
+        if turn:
+            # Only index.html is recorded per turn; other files keep their current content
+            index_file = ProjectFile.query.filter_by(project_id=fork.id, filename='index.html').first()
+            if index_file:
+                index_file.content = turn.generated_code
+            else:
+                db.session.add(ProjectFile(project_id=fork.id, filename='index.html',
+                                           content=turn.generated_code, file_type='html'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error forking project", extra={'fields': {'project_id': source.id, 'error': type(e).__name__}})
+        return jsonify({'error': 'Failed to fork project'}), 500
+
+    logger.info("Forked project", extra={'fields': {
+        'project_id': source.id, 'fork_id': fork.id, 'chat_id': turn.id if turn else None
+    }})
+    return jsonify({'success': True, 'project_id': fork.id, 'name': fork.name}), 201
+
 @app.route("/reset")
 @login_required
 def reset():
     session.pop('history', None)
     clear_generated_files()
-    return jsonify({"message": "Session reset.", "credits": session.get('credits', 10)})
+    user = get_user(session.get('user_id'))
+    return jsonify({"message": "Session reset.", "credits": effective_credits(user)[0] if user else 0})
 
 @app.route("/new_chat", methods=["POST"])
 @login_required
 def new_chat():
     """Clear chat and files but keep credits"""
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
+    user = get_user(user_id)
     
     # Clear session history and project ID
     session.pop('history', None)
@@ -1703,7 +2732,7 @@ def new_chat():
     clear_generated_files()
     
     # Keep user's credits - don't reset them
-    current_credits = user.credits if user else 10
+    current_credits = effective_credits(user)[0] if user else 10
     
     return jsonify({
         "message": "Chat cleared", 
@@ -1723,7 +2752,7 @@ def list_all_files():
         return jsonify({"files": []})
     
     user_id = session.get('user_id')
-    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+    project = get_owned_project(project_id, user_id)
     
     if not project:
         return jsonify({"files": []}), 403
@@ -1751,7 +2780,7 @@ def read_file():
         return jsonify({'error': 'No active project'}), 400
     
     user_id = session.get('user_id')
-    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+    project = get_owned_project(project_id, user_id)
     
     if not project:
         return jsonify({'error': 'Unauthorized'}), 403
@@ -1764,7 +2793,7 @@ def read_file():
     if not file:
         return jsonify({'error': 'File not found'}), 404
     
-    return jsonify({'content': file.content if file.content else ''})
+    return jsonify({'content': file.content if file.content else '', 'revision': file.revision})
 
 @app.route("/api/file", methods=["POST"])
 @login_required
@@ -1778,7 +2807,7 @@ def save_file():
             return jsonify({'error': 'No active project'}), 400
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -1832,10 +2861,107 @@ def save_file():
         db.session.commit()
         return jsonify({'message': 'File saved successfully'})
         
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'File changed while saving, please reload it'}), 409
     except Exception as e:
         db.session.rollback()
         error_msg = "Failed to save file"
-        print(f"❌ Error saving file: {type(e).__name__}")
+        logger.error("Error saving file", extra={'fields': {'error': type(e).__name__}})
+        return jsonify({'error': error_msg}), 500
+
+
+PATCH_MAX_OPERATIONS = 200
+
+def apply_text_patches(content, patches):
+    """Applies [{start, end, text}] replacements to content.
+
+    Offsets are UTF-16 code units into the base content (what editors and
+    JavaScript strings use) and must not overlap. Raises ValueError when a
+    patch is malformed or out of range.
+    """
+    units = content.encode('utf-16-le')
+    length = len(units) // 2
+    ordered = sorted(patches, key=lambda patch: patch.get('start', -1) if isinstance(patch, dict) else -1, reverse=True)
+    limit = length
+    for patch in ordered:
+        if not isinstance(patch, dict):
+            raise ValueError('patch must be an object')
+        start, end, text = patch.get('start'), patch.get('end'), patch.get('text', '')
+        if not isinstance(start, int) or not isinstance(end, int) or not isinstance(text, str):
+            raise ValueError('patch needs integer start/end and string text')
+        if not 0 <= start <= end <= limit:
+            raise ValueError('patch out of range or overlapping')
+        units = units[:start * 2] + text.encode('utf-16-le') + units[end * 2:]
+        limit = start
+    return units.decode('utf-16-le')
+
+@app.route("/api/file", methods=["PATCH"])
+@login_required
+def patch_file():
+    """Apply editor patches to a text file against the revision they were made on.
+
+    Body: {"filename", "base_revision", "base_hash" (optional), "patches":
+    [{"start", "end", "text"}]}. Returns 409 with the current revision when
+    the file changed since base_revision.
+    """
+    try:
+        user_id = session.get('user_id')
+        project_id = session.get('current_project_id')
+        
+        if not project_id:
+            return jsonify({'error': 'No active project'}), 400
+        
+        # Verify user owns this project
+        project = get_owned_project(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
+        base_revision = data.get('base_revision')
+        patches = data.get('patches')
+        if not filename or not isinstance(base_revision, int):
+            return jsonify({'error': 'filename and base_revision are required'}), 400
+        if not isinstance(patches, list) or len(patches) > PATCH_MAX_OPERATIONS:
+            return jsonify({'error': f'patches must be a list of at most {PATCH_MAX_OPERATIONS}'}), 400
+        
+        file = ProjectFile.query.filter_by(project_id=project_id, filename=filename).first()
+        if not file:
+            return jsonify({'error': 'File not found'}), 404
+        if file.content_binary:
+            return jsonify({'error': 'Binary files cannot be patched'}), 400
+        
+        base_hash = data.get('base_hash')
+        if file.revision != base_revision or (base_hash and file.content_hash != base_hash):
+            return jsonify({
+                'error': 'File changed since it was opened',
+                'revision': file.revision,
+                'hash': file.content_hash
+            }), 409
+        
+        try:
+            file.content = apply_text_patches(file.content or '', patches)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid patch: {e}'}), 400
+        file.updated_at = datetime.datetime.utcnow()
+        # The UPDATE is conditional on base_revision, so a concurrent save raises StaleDataError
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'revision': file.revision,
+            'hash': file.content_hash,
+            'size': file.size_bytes
+        })
+        
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'File changed since it was opened'}), 409
+    except Exception as e:
+        db.session.rollback()
+        error_msg = "Failed to save file"
+        logger.error("Error patching file", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
 
 
@@ -1855,7 +2981,7 @@ def delete_file():
             return jsonify({'error': 'Filename is required'}), 400
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -1873,18 +2999,269 @@ def delete_file():
         
         return jsonify({'message': 'File deleted successfully'})
         
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'File changed while deleting, please reload it'}), 409
     except Exception as e:
         db.session.rollback()
         error_msg = "Failed to delete file"
-        print(f"❌ Error deleting file: {type(e).__name__}")
+        logger.error("Error deleting file", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500    
 
 
 
+BATCH_MAX_OPERATIONS = 50
+
+@app.route("/api/files/batch-read", methods=["POST"])
+@login_required
+def batch_read_files():
+    """Read several text files of the current project in one request.
+
+    Body: {"filenames": [...]} (omit to read every text file).
+    """
+    project_id = session.get('current_project_id')
+    if not project_id:
+        return jsonify({'error': 'No active project'}), 400
+    
+    user_id = session.get('user_id')
+    project = get_owned_project(project_id, user_id)
+    if not project:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    filenames = data.get('filenames')
+    
+    query = ProjectFile.query.filter_by(project_id=project_id, is_binary=False).options(db.selectinload(ProjectFile.blob))
+    if filenames is not None:
+        if not isinstance(filenames, list) or len(filenames) > BATCH_MAX_OPERATIONS:
+            return jsonify({'error': f'filenames must be a list of at most {BATCH_MAX_OPERATIONS}'}), 400
+        query = query.filter(ProjectFile.filename.in_(filenames))
+    
+    files = query.all()
+    found = {f.filename for f in files}
+    
+    return jsonify({
+        'files': [{
+            'filename': f.filename,
+            'content': f.content or '',
+            'revision': f.revision,
+            'hash': f.content_hash
+        } for f in files],
+        'missing': [name for name in (filenames or []) if name not in found]
+    })
+
+@app.route("/api/files/batch", methods=["POST"])
+@login_required
+def batch_write_files():
+    """Apply several text file writes/deletes to the current project atomically.
+
+    Body: {"operations": [{"op": "write", "filename": ..., "content": ...,
+    "base_revision": optional}, {"op": "delete", "filename": ...}]}.
+    Either every operation is applied or none is; a base_revision that no
+    longer matches fails the whole batch with 409.
+    """
+    try:
+        user_id = session.get('user_id')
+        project_id = session.get('current_project_id')
+        
+        if not project_id:
+            return jsonify({'error': 'No active project'}), 400
+        
+        # One ownership check for the whole batch
+        project = get_owned_project(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list'}), 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+        
+        for op in operations:
+            if (not isinstance(op, dict) or op.get('op') not in ('write', 'delete')
+                    or not isinstance(op.get('filename'), str) or not op['filename']):
+                return jsonify({'error': 'Each operation needs op (write/delete) and filename'}), 400
+            if op['op'] == 'write' and not allowed_file(op['filename']):
+                return jsonify({'error': f"File type not allowed: {op['filename']}"}), 400
+            if op['op'] == 'write' and not isinstance(op.get('content', ''), str):
+                return jsonify({'error': f"content must be a string: {op['filename']}"}), 400
+        
+        # Load every affected file in one query
+        filenames = {op['filename'] for op in operations}
+        existing = {f.filename: f for f in ProjectFile.query.filter(
+            ProjectFile.project_id == project_id,
+            ProjectFile.filename.in_(filenames)
+        ).all()}
+        
+        # Text writes never replace images; those go through the upload endpoint
+        for op in operations:
+            if op['op'] != 'write':
+                continue
+            current = existing.get(op['filename'])
+            is_image = op['filename'].rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS - {'svg'}
+            if (current is not None and current.content_binary) or (current is None and is_image):
+                return jsonify({'error': f"Cannot write text to binary file: {op['filename']}"}), 400
+        
+        conflicts = []
+        for op in operations:
+            base_revision = op.get('base_revision')
+            current = existing.get(op['filename'])
+            if base_revision is not None and (current.revision if current else 0) != base_revision:
+                conflicts.append({
+                    'filename': op['filename'],
+                    'revision': current.revision if current else None
+                })
+        if conflicts:
+            return jsonify({'error': 'Files changed since they were read', 'conflicts': conflicts}), 409
+        
+        touched = []
+        deleted = []
+        for op in operations:
+            filename = op['filename']
+            current = existing.get(filename)
+            if op['op'] == 'delete':
+                if current:
+                    db.session.delete(current)
+                    existing.pop(filename)
+                deleted.append(filename)
+            elif current:
+                current.content = op.get('content', '')
+                current.updated_at = datetime.datetime.utcnow()
+                touched.append(current)
+            else:
+                new_file = ProjectFile(
+                    project_id=project_id,
+                    filename=filename,
+                    content=op.get('content', ''),
+                    file_type=filename.rsplit('.', 1)[1].lower()
+                )
+                db.session.add(new_file)
+                existing[filename] = new_file
+                touched.append(new_file)
+        
+        db.session.commit()
+        
+        results = {f.filename: {'filename': f.filename, 'revision': f.revision, 'hash': f.content_hash}
+                   for f in touched if f.filename in existing}
+        for filename in deleted:
+            results[filename] = {'filename': filename, 'deleted': True}
+        return jsonify({'success': True, 'files': list(results.values())})
+        
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Files changed while saving, please retry'}), 409
+    except Exception as e:
+        db.session.rollback()
+        error_msg = "Failed to apply file batch"
+        logger.error("Error applying file batch", extra={'fields': {'error': type(e).__name__}})
+        return jsonify({'error': error_msg}), 500
+
+
+class _ZipStream:
+    """Write-only sink that collects zip bytes until the response drains them"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def export_image_variants(project_id):
+    """{file id: variant id} of the downsized copy each image is exported as.
+
+    Variants keep the original format so file names and references in the
+    pages stay valid.
+    """
+    rows = db.session.query(
+        ImageVariant.file_id, ImageVariant.id, ImageVariant.format, ImageVariant.width,
+        ImageVariant.size_bytes, ProjectFile.size_bytes
+    ).join(ProjectFile, ProjectFile.id == ImageVariant.file_id).filter(
+        ProjectFile.project_id == project_id,
+        ImageVariant.source_hash == ProjectFile.content_hash
+    ).all()
+    
+    by_file = {}
+    for file_id, variant_id, fmt, width, size, original_size in rows:
+        by_file.setdefault(file_id, ([], original_size))[0].append((variant_id, fmt, width, size))
+    chosen = {}
+    for file_id, (candidates, original_size) in by_file.items():
+        variant_id = choose_variant(candidates, False, EXPORT_MAX_WIDTH, original_size)
+        if variant_id:
+            chosen[file_id] = variant_id
+    return chosen
+
+def stream_project_zip(manifest, cache_path, variants=None):
+    """Yields a ZIP of the manifest's files entry by entry.
+
+    Files are loaded one at a time, and the bytes are also written to a temp
+    file that becomes cache_path once the archive is complete. variants maps
+    file ids to the ImageVariant exported in place of the original.
+    """
+    sink = _ZipStream()
+    tmp_path = f"{cache_path}.{secrets.token_hex(4)}.tmp"
+    completed = False
+    try:
+        with open(tmp_path, 'wb') as cache_file:
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for file_id, filename, _, _ in sorted(manifest, key=lambda row: row[1]):
+                    file = db.session.get(ProjectFile, file_id)
+                    if file is None:
+                        continue
+                    if variants and file_id in variants:
+                        variant = db.session.get(ImageVariant, variants[file_id])
+                        data = variant.content_binary
+                        db.session.expunge(variant)
+                    else:
+                        data = file.content_binary if file.content_binary else (file.content or '').encode('utf-8')
+                    db.session.expunge(file)
+                    info = zipfile.ZipInfo(filename, date_time=(file.updated_at or datetime.datetime(1980, 1, 1)).timetuple()[:6])
+                    extension = filename.rsplit('.', 1)[-1].lower()
+                    info.compress_type = zipfile.ZIP_STORED if extension in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    with zf.open(info, 'w') as entry:
+                        for offset in range(0, len(data), ZIP_CHUNK_SIZE):
+                            entry.write(data[offset:offset + ZIP_CHUNK_SIZE])
+                    del data
+
+                    chunk = sink.drain()
+                    cache_file.write(chunk)
+                    yield chunk
+            # Central directory
+            chunk = sink.drain()
+            cache_file.write(chunk)
+            yield chunk
+        os.replace(tmp_path, cache_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def prune_export_cache(project_id, keep_path):
+    """Removes older cached archives of a project"""
+    prefix = f"{project_id}-"
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith('.zip') and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
 @app.route("/api/download-zip", methods=["GET"])
 @login_required
+@rate_limited
 def download_zip():
-    """Creates and sends a ZIP file containing all files from database"""
+    """Streams a ZIP file of the project's files, reusing the cached archive when unchanged"""
     try:
         user_id = session.get('user_id')
         project_id = session.get('current_project_id')
@@ -1893,44 +3270,130 @@ def download_zip():
             return jsonify({'error': 'No active project'}), 404
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Get all files from database
-        files = ProjectFile.query.filter_by(project_id=project_id).all()
+        manifest = project_file_manifest(project_id)
         
-        if not files or len(files) == 0:
+        if not manifest:
             return jsonify({'error': 'No files to download'}), 404
         
-        # Create ZIP in memory
-        memory_file = BytesIO()
-        
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for file in files:
-                if file.content_binary:
-                    # Binary file (image)
-                    zf.writestr(file.filename, file.content_binary)
-                else:
-                    # Text file (HTML, CSS, JS)
-                    zf.writestr(file.filename, file.content.encode('utf-8'))
-        
-        memory_file.seek(0)
+        variants = export_image_variants(project_id)
+        revision = combined_revision(manifest)
+        if variants:
+            # Variants arrive after the upload, so they are part of the archive's identity
+            revision = hashlib.sha1(f"{revision}:{sorted(variants.items())}".encode('ascii')).hexdigest()
+        cache_path = os.path.join(EXPORT_CACHE_DIR, f"{project_id}-{revision}.zip")
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         zip_filename = f"{project.name}_{timestamp}.zip"
         
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
+        if os.path.exists(cache_path):
+            logger.info("Serving cached zip", extra={'fields': {'project_id': project_id}})
+            return send_file(
+                cache_path,
+                mimetype='application/zip',
+                as_attachment=True,
+                download_name=zip_filename
+            )
+        
+        prune_export_cache(project_id, cache_path)
+        response = Response(
+            stream_with_context(stream_project_zip(manifest, cache_path, variants)),
+            mimetype='application/zip'
         )
+        response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(zip_filename)}"'
+        return response
     
     except Exception as e:
         error_msg = "Failed to create download package"
-        print(f"❌ Error creating zip: {type(e).__name__}")
+        logger.error("Error creating zip", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
     
+image_variant_executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+
+class UploadTooLarge(Exception):
+    pass
+
+class InvalidImageUpload(Exception):
+    pass
+
+def read_image_upload(storage):
+    """Reads an uploaded image in chunks, enforcing IMAGE_UPLOAD_MAX_BYTES.
+
+    Raises UploadTooLarge past the limit and InvalidImageUpload when the
+    bytes are not an image matching the file's extension.
+    """
+    chunks = []
+    total = 0
+    while True:
+        chunk = storage.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > IMAGE_UPLOAD_MAX_BYTES:
+            raise UploadTooLarge(storage.filename)
+        chunks.append(chunk)
+    data = b''.join(chunks)
+    
+    extension = storage.filename.rsplit('.', 1)[-1].lower()
+    if extension != 'svg':
+        expected = 'jpeg' if extension == 'jpg' else extension
+        if sniff_image_type(data) != expected:
+            raise InvalidImageUpload(storage.filename)
+    return data
+
+def limit_image_request():
+    """Caps the request body before the multipart form is parsed"""
+    request.max_content_length = IMAGE_UPLOAD_MAX_BYTES * IMAGE_UPLOAD_MAX_FILES + 1024 * 1024
+
+def queue_image_variants(file_ids):
+    if not variants_enabled():
+        return
+    for file_id in file_ids:
+        image_variant_executor.submit(generate_image_variants, file_id)
+
+def generate_image_variants(file_id):
+    """Background worker: renders the variants of one stored image"""
+    with app.app_context():
+        try:
+            file = db.session.get(ProjectFile, file_id)
+            if not file or not file.content_binary:
+                return
+            source_hash = file.content_hash
+            variants = make_variants(file.content_binary, file.file_type)
+            if not variants:
+                return
+            
+            # The image may have been replaced while we were rendering
+            db.session.expire(file)
+            current = db.session.query(ProjectFile.content_hash).filter_by(id=file_id).scalar()
+            if current != source_hash:
+                return
+            
+            ImageVariant.query.filter_by(file_id=file_id).delete()
+            for width, height, fmt, data in variants:
+                db.session.add(ImageVariant(
+                    file_id=file_id,
+                    source_hash=source_hash,
+                    width=width,
+                    height=height,
+                    format=fmt,
+                    content_binary=data,
+                    size_bytes=len(data)
+                ))
+            db.session.commit()
+            logger.info("Image variants ready", extra={'fields': {
+                'file_id': file_id,
+                'original_bytes': file.size_bytes,
+                'variants': [(width, fmt, len(data)) for width, _, fmt, data in variants]
+            }})
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Image variants failed", extra={'fields': {'file_id': file_id, 'error': type(e).__name__}})
+        finally:
+            db.session.remove()
+
 @app.route("/api/upload-file", methods=["POST"])
 @login_required
 def upload_images():
@@ -1943,19 +3406,23 @@ def upload_images():
             return jsonify({"error": "No active project"}), 400
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Unauthorized'}), 403
         
+        limit_image_request()
         files = request.files.getlist("images")
         
         if len(files) == 0:
             return jsonify({"error": "No files uploaded"}), 400
         
         uploaded = []
-        for file in files[:3]:  # Limit to 3 images
+        stored = []
+        for file in files[:IMAGE_UPLOAD_MAX_FILES]:  # Limit to 3 images
             filename = secure_filename(file.filename)
-            content_binary = file.read()
+            if not allowed_file(filename) or filename.rsplit('.', 1)[1].lower() not in IMAGE_EXTENSIONS:
+                return jsonify({'error': f'Not an allowed image type: {filename}'}), 400
+            content_binary = read_image_upload(file)
             
             # Check if file already exists
             existing_file = ProjectFile.query.filter_by(
@@ -1967,6 +3434,7 @@ def upload_images():
                 # Update existing file
                 existing_file.content_binary = content_binary
                 existing_file.updated_at = datetime.datetime.utcnow()
+                stored.append(existing_file)
             else:
                 # Create new file
                 project_file = ProjectFile(
@@ -1976,16 +3444,28 @@ def upload_images():
                     file_type=filename.rsplit('.', 1)[1].lower()
                 )
                 db.session.add(project_file)
+                stored.append(project_file)
             
             uploaded.append(filename)
         
         db.session.commit()
+        queue_image_variants([f.id for f in stored])
         return jsonify({"uploaded": uploaded})
         
+    except (UploadTooLarge, RequestEntityTooLarge):
+        db.session.rollback()
+        limit_mb = IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)
+        return jsonify({'error': f'Images must be {limit_mb} MB or smaller'}), 413
+    except InvalidImageUpload as e:
+        db.session.rollback()
+        return jsonify({'error': f'File is not a valid image: {e}'}), 400
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Images changed while uploading, please retry'}), 409
     except Exception as e:
         db.session.rollback()
         error_msg = "Failed to upload images"
-        print(f"❌ Error uploading images: {type(e).__name__}")
+        logger.error("Error uploading images", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'error': error_msg}), 500
 
 @app.route("/api/figma-url", methods=["POST"])
@@ -1997,7 +3477,7 @@ def figma_url():
     if not figma_url:
         return jsonify({"success": False, "error": "URL cannot be empty"}), 400
 
-    session["figma_url"] = figma_url
+    set_figma_url(redis_client, session.get('user_id'), figma_url)
     return jsonify({"success": True, "figma_url": figma_url})
 
 @app.route("/api/set-current-project", methods=["POST"])
@@ -2014,25 +3494,51 @@ def set_current_project():
         user_id = session.get('user_id')
         
         # Verify user owns this project
-        project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+        project = get_owned_project(project_id, user_id)
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
         # Set in session
         session['current_project_id'] = project_id
-        session['current_project_name'] = project.name
         
-        print(f"✅ Set current_project_id to {project_id} ({project.name})")
+        logger.info("Set current project", extra={'fields': {'project_id': project_id}})
         
         return jsonify({'success': True, 'project_id': project_id, 'name': project.name})
         
     except Exception as e:
-        print(f"❌ Error setting project: {e}")
+        logger.exception("Error setting project")
         return jsonify({'error': str(e)}), 500
 
 
 # ===== RAZORPAY PAYMENT ROUTES =====
 
+# Credits added by each plan's payment
+PLAN_CREDITS = {
+    'monthly': 100,
+    'annual': 1200
+}
+
+def activate_subscription(user, plan_type):
+    """Starts the user's subscription to plan_type now; the caller commits"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    user.subscription_status = 'active'
+    user.subscription_plan = plan_type
+    user.subscription_start_date = now
+    user.subscription_end_date = now + datetime.timedelta(days=30 if plan_type == 'monthly' else 365)
+
+def mark_order_paid(order, payment_id):
+    """Records the order's payment; True only for the first caller, who activates the plan.
+
+    The caller commits, in the same transaction as the activation.
+    """
+    orders = PaymentOrder.__table__
+    result = db.session.execute(
+        orders.update()
+        .where(orders.c.id == order.id, orders.c.status != 'paid')
+        .values(status='paid', payment_id=payment_id, paid_at=utcnow())
+    )
+    return result.rowcount == 1
+
 @app.route("/api/create-razorpay-order", methods=["POST"])
 @login_required
 def create_razorpay_order():
@@ -2067,6 +3573,16 @@ def create_razorpay_order():
         
         order = razorpay_client.order.create(data=order_data)
         
+        # Kept so payments for this order map back to the user without asking Razorpay
+        db.session.add(PaymentOrder(
+            order_id=order['id'],
+            user_id=user_id,
+            plan_type=plan_type,
+            amount=order['amount'],
+            currency=order['currency']
+        ))
+        db.session.commit()
+        
         return jsonify({
             'success': True,
             'order_id': order['id'],
@@ -2076,7 +3592,8 @@ def create_razorpay_order():
         })
         
     except Exception as e:
-        print(f"❌ Error creating order: {e}")
+        logger.exception("Error creating Razorpay order")
+        db.session.rollback()
         return jsonify({'error': 'Failed to create order'}), 500
 
 
@@ -2090,7 +3607,6 @@ def verify_razorpay_payment():
         razorpay_order_id = data.get('razorpay_order_id')
         razorpay_payment_id = data.get('razorpay_payment_id')
         razorpay_signature = data.get('razorpay_signature')
-        plan_type = data.get('plan_type')
         
         # Verify signature
         generated_signature = hmac.new(
@@ -2102,40 +3618,64 @@ def verify_razorpay_payment():
         if generated_signature != razorpay_signature:
             return jsonify({'error': 'Invalid payment signature'}), 400
         
-        # Payment verified - Activate subscription
+        # The plan is the one this user ordered, not whatever the client sends now
         user_id = session.get('user_id')
-        user = User.query.get(user_id)
-        
-        user.subscription_status = 'active'
-        user.subscription_plan = plan_type
-        user.subscription_start_date = datetime.datetime.now(timezone.utc)
-        
-        # Set end date
-        if plan_type == 'monthly':
-            user.subscription_end_date = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=30)
-            user.credits += 100
-        else:  # annual
-            user.subscription_end_date = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=365)
-            user.credits += 1200
-        
+        order = PaymentOrder.query.filter_by(order_id=razorpay_order_id, user_id=user_id).first()
+        if not order:
+            return jsonify({'error': 'Order not found'}), 404
+        plan_type = order.plan_type
+        
+        # Payment verified - Activate subscription, unless the webhook already did
+        if mark_order_paid(order, razorpay_payment_id):
+            activate_subscription(db.session.get(User, user_id), plan_type)
         db.session.commit()
+        invalidate_user(user_id)
+        
+        # Once per payment, however often verification is retried
+        grant_credits(user_id, PLAN_CREDITS.get(plan_type, PLAN_CREDITS['annual']), 'purchase', razorpay_payment_id)
+        credits = effective_credits(get_user(user_id))[0]
         
         return jsonify({
             'success': True,
             'message': 'Subscription activated successfully!',
-            'credits': user.credits,
+            'credits': credits,
             'plan': plan_type
         })
         
     except Exception as e:
-        print(f"❌ Error verifying payment: {e}")
+        logger.exception("Error verifying Razorpay payment")
         db.session.rollback()
         return jsonify({'error': 'Payment verification failed'}), 500
 
 
+BILLING_HISTORY_LIMIT = 50
+
+@app.route("/api/billing-history")
+@login_required
+def billing_history():
+    """The user's most recent orders, newest first"""
+    orders = db.session.execute(
+        db.select(PaymentOrder.order_id, PaymentOrder.plan_type, PaymentOrder.amount, PaymentOrder.currency,
+                  PaymentOrder.status, PaymentOrder.payment_id, PaymentOrder.created_at, PaymentOrder.paid_at)
+        .where(PaymentOrder.user_id == session.get('user_id'))
+        .order_by(PaymentOrder.created_at.desc())
+        .limit(BILLING_HISTORY_LIMIT)
+    ).all()
+    return jsonify({'orders': [{
+        'order_id': order.order_id,
+        'plan': order.plan_type,
+        'amount': order.amount,
+        'currency': order.currency,
+        'status': order.status,
+        'payment_id': order.payment_id,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'paid_at': order.paid_at.isoformat() if order.paid_at else None
+    } for order in orders]})
+
+
 @app.route("/api/razorpay-webhook", methods=["POST"])
 def razorpay_webhook():
-    """Handle Razorpay webhook notifications"""
+    """Store a Razorpay webhook and acknowledge it; processing happens in the background"""
     try:
         webhook_signature = request.headers.get('X-Razorpay-Signature')
         webhook_body = request.get_data()
@@ -2147,40 +3687,210 @@ def razorpay_webhook():
             RAZORPAY_WEBHOOK_SECRET
         )
         
-        data = request.get_json()
-        event = data.get('event')
-        
-        # Handle different events
-        if event == 'payment.captured':
-            payment = data.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment.get('order_id')
-            
-            # Find and update user
-            order = razorpay_client.order.fetch(order_id)
-            user_id = int(order.get('notes', {}).get('user_id', 0))
-            
-            if user_id:
-                user = User.query.get(user_id)
-                if user and user.subscription_status != 'active':
-                    plan_type = order.get('notes', {}).get('plan_type', 'monthly')
-                    
-                    user.subscription_status = 'active'
-                    user.subscription_plan = plan_type
-                    user.subscription_start_date = datetime.datetime.now(timezone.utc)
-                    
-                    if plan_type == 'monthly':
-                        user.subscription_end_date = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=30)
-                    else:
-                        user.subscription_end_date = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=365)
-                    
-                    user.credits = 100
-                    db.session.commit()
-        
-        return jsonify({'status': 'success'}), 200
-        
+        data = json.loads(webhook_body)
     except Exception as e:
-        print(f"❌ Webhook error: {e}")
+        logger.warning("Rejected Razorpay webhook", extra={'fields': {'error': type(e).__name__}})
         return jsonify({'status': 'error'}), 400
+    
+    # Redeliveries carry the same event id
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(webhook_body).hexdigest()
+    event = WebhookEvent(
+        event_id=event_id,
+        event_type=data.get('event'),
+        payload=webhook_body.decode('utf-8'),
+        next_attempt_at=utcnow()
+    )
+    try:
+        db.session.add(event)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        logger.info("Duplicate Razorpay webhook", extra={'fields': {'event_id': event_id}})
+        return jsonify({'status': 'success'}), 200
+    
+    webhook_executor.submit(process_webhook_event, event.id)
+    return jsonify({'status': 'success'}), 200
+
+# Stored webhooks are processed on a small background pool right after they
+# are received. Retries and anything a crashed worker left behind are picked
+# up by a sweeper thread each web process runs, or by `flask process-webhooks`.
+WEBHOOK_WORKERS = 2
+WEBHOOK_MAX_ATTEMPTS = 6
+WEBHOOK_LEASE = datetime.timedelta(minutes=5)
+WEBHOOK_MAX_BACKOFF = 60 * 60  # seconds
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_SWEEP_INTERVAL = 30  # seconds
+webhook_executor = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix='webhooks')
+
+def handle_payment_captured(data):
+    payment = data.get('payload', {}).get('payment', {}).get('entity', {})
+    order_id = payment.get('order_id')
+    
+    order = PaymentOrder.query.filter_by(order_id=order_id).first() if order_id else None
+    if order:
+        user_id, plan_type = order.user_id, order.plan_type
+        # Verification may have got here first
+        activate = mark_order_paid(order, payment.get('id'))
+    elif order_id:
+        # Orders created before they were recorded locally
+        notes = razorpay_client.order.fetch(order_id).get('notes', {})
+        user_id, plan_type = int(notes.get('user_id', 0)), notes.get('plan_type', 'monthly')
+        activate = None
+    else:
+        return
+    
+    user = db.session.get(User, user_id) if user_id else None
+    if not user:
+        logger.warning("Payment for unknown user", extra={'fields': {'order_id': order_id}})
+        return
+    if activate or (activate is None and user.subscription_status != 'active'):
+        activate_subscription(user, plan_type)
+    db.session.commit()
+    invalidate_user(user_id)
+    # Once per payment, whether verification or the webhook gets here first
+    grant_credits(user_id, PLAN_CREDITS.get(plan_type, PLAN_CREDITS['annual']), 'purchase', payment.get('id'))
+
+def handle_payment_failed(data):
+    payment = data.get('payload', {}).get('payment', {}).get('entity', {})
+    orders = PaymentOrder.__table__
+    # A later attempt on the same order may still succeed and mark it paid
+    db.session.execute(
+        orders.update()
+        .where(orders.c.order_id == payment.get('order_id'), orders.c.status == 'created')
+        .values(status='failed')
+    )
+    db.session.commit()
+
+WEBHOOK_HANDLERS = {
+    'payment.captured': handle_payment_captured,
+    'payment.failed': handle_payment_failed,
+}
+
+def _claim_webhook_event(event_id, now):
+    """Marks a due event as processing; False if another worker has it or it is not due"""
+    events = WebhookEvent.__table__
+    result = db.session.execute(
+        events.update()
+        .where(events.c.id == event_id,
+               events.c.status.in_(('pending', 'processing')),
+               events.c.next_attempt_at <= now)
+        .values(status='processing', attempts=events.c.attempts + 1, next_attempt_at=now + WEBHOOK_LEASE)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def process_webhook_event(event_id):
+    """Background worker: runs the handler for one stored webhook, retrying with backoff on failure"""
+    with app.app_context():
+        try:
+            if not _claim_webhook_event(event_id, utcnow()):
+                return
+            event = db.session.get(WebhookEvent, event_id)
+            handler = WEBHOOK_HANDLERS.get(event.event_type)
+            try:
+                if handler:
+                    handler(json.loads(event.payload))
+            except Exception as e:
+                db.session.rollback()
+                event = db.session.get(WebhookEvent, event_id)
+                if event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    event.status = 'failed'
+                else:
+                    delay = min(30 * 2 ** (event.attempts - 1), WEBHOOK_MAX_BACKOFF)
+                    event.status = 'pending'
+                    event.next_attempt_at = utcnow() + datetime.timedelta(seconds=delay)
+                event.last_error = type(e).__name__
+                db.session.commit()
+                logger.exception("Webhook processing failed", extra={'fields': {
+                    'event_id': event.event_id, 'attempt': event.attempts, 'status': event.status
+                }})
+                return
+            
+            event.status = 'done'
+            event.processed_at = utcnow()
+            event.last_error = None
+            db.session.commit()
+            logger.info("Processed webhook", extra={'fields': {'event_id': event.event_id, 'event': event.event_type}})
+        finally:
+            db.session.remove()
+
+def process_due_webhooks():
+    """Processes every stored webhook that is due; returns how many were attempted"""
+    attempted = 0
+    while True:
+        with app.app_context():
+            due = db.session.execute(
+                db.select(WebhookEvent.id)
+                .where(WebhookEvent.status.in_(('pending', 'processing')), WebhookEvent.next_attempt_at <= utcnow())
+                .order_by(WebhookEvent.next_attempt_at)
+                .limit(WEBHOOK_BATCH_SIZE)
+            ).scalars().all()
+            db.session.remove()
+        for event_id in due:
+            process_webhook_event(event_id)
+        attempted += len(due)
+        if len(due) < WEBHOOK_BATCH_SIZE:
+            return attempted
+
+@app.cli.command("process-webhooks")
+@click.option('--loop', is_flag=True, help='Keep running, polling for due events.')
+@click.option('--interval', default=10, show_default=True, help='Seconds between polls with --loop.')
+def process_webhooks_command(loop, interval):
+    """Process stored webhooks that are due (retries, or left by a crashed worker)."""
+    while True:
+        attempted = process_due_webhooks()
+        if attempted:
+            logger.info("Processed due webhooks", extra={'fields': {'count': attempted}})
+        if not loop:
+            return
+        time.sleep(interval)
+
+def _sweep_webhooks():
+    while True:
+        time.sleep(WEBHOOK_SWEEP_INTERVAL)
+        try:
+            process_due_webhooks()
+        except Exception:
+            logger.exception("Webhook sweep failed")
+
+BLOB_GC_INTERVAL = 60 * 60  # seconds
+
+@app.cli.command("gc-blobs")
+def gc_blobs_command():
+    """Delete stored file contents that no file or image variant uses any more."""
+    deleted = delete_unreferenced_blobs()
+    logger.info("Deleted unreferenced blobs", extra={'fields': {'count': deleted}})
+
+def _collect_blobs():
+    while True:
+        time.sleep(BLOB_GC_INTERVAL)
+        try:
+            with app.app_context():
+                deleted = delete_unreferenced_blobs()
+            if deleted:
+                logger.info("Deleted unreferenced blobs", extra={'fields': {'count': deleted}})
+        except Exception:
+            logger.exception("Blob cleanup failed")
+
+_background_started = False
+_background_lock = threading.Lock()
+
+@app.before_request
+def start_background_workers():
+    """Starts this process's background threads with its first request.
+
+    Not at import, so CLI commands (migrations included) do not run them.
+    """
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        threading.Thread(target=_sweep_webhooks, name='webhook-sweeper', daemon=True).start()
+        threading.Thread(target=_collect_blobs, name='blob-collector', daemon=True).start()
+        mail_worker.start()
+        _background_started = True
         
 
 # --- End File API ---
@@ -2192,9 +3902,8 @@ if __name__ == "__main__":
     with app.app_context():
         try:
             db.create_all()
-            print("✅ Database tables created successfully!")
+            logger.info("Database tables created")
         except Exception as e:
-            print(f"⚠️ Database connection failed: {e}")
-            print("📝 App will continue without database persistence")
+            logger.warning("Database connection failed; continuing without persistence", extra={'fields': {'error': str(e)}})
     
     app.run(debug=True)
@@ -0,0 +1,211 @@
+"""GitHub push benchmark against a local stand-in for the GitHub API.
+
+Starts a small in-memory fake of the REST endpoints the push uses on a
+local port, with a fixed delay per request to mimic GitHub's latency, and
+times two ways of pushing the same project:
+
+  contents-api  one GET + PUT /contents/<path> per file (the old push)
+  git-data-api  github_push.push_files: concurrent blobs, one tree,
+                one commit, one ref update
+
+    python benchmarks/bench_github_push.py [--files 10] [--latency 0.15]
+
+It also checks that the git-data push produced one commit containing every
+file, and that pushing unchanged content creates no commit.
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+from flask import Flask, jsonify, request  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from github_push import GitHubClient, git_blob_sha, push_files  # noqa: E402
+
+
+def make_fake_github(latency):
+    """In-memory stand-in for the subset of the GitHub API used by pushes"""
+    fake = Flask('fake_github')
+    state = {'repos': {}, 'requests': 0}
+    lock = threading.Lock()
+    ids = itertools.count(1)
+
+    def new_sha(kind):
+        return hashlib.sha1(f"{kind}{next(ids)}".encode()).hexdigest()
+
+    @fake.before_request
+    def delay():
+        with lock:
+            state['requests'] += 1
+        time.sleep(latency)
+
+    def commit_files(repo, files, message, parents):
+        tree_sha = new_sha('tree')
+        repo['trees'][tree_sha] = dict(files)
+        sha = new_sha('commit')
+        repo['commits'][sha] = {'tree': tree_sha, 'message': message, 'parents': parents}
+        return sha
+
+    @fake.post('/user/repos')
+    def create_repo():
+        name = request.json['name']
+        repo = {'blobs': {}, 'trees': {}, 'commits': {}, 'refs': {}}
+        repo['refs']['main'] = commit_files(repo, {'README.md': git_blob_sha(b'# readme\n')}, 'Initial commit', [])
+        state['repos'][name] = repo
+        return jsonify({'name': name, 'default_branch': 'main'}), 201
+
+    @fake.get('/repos/<owner>/<name>')
+    def get_repo(owner, name):
+        if name not in state['repos']:
+            return jsonify({'message': 'Not Found'}), 404
+        return jsonify({'name': name, 'default_branch': 'main'})
+
+    @fake.get('/repos/<owner>/<name>/git/ref/heads/<branch>')
+    def get_ref(owner, name, branch):
+        refs = state['repos'][name]['refs']
+        if branch not in refs:
+            return jsonify({'message': 'Git Repository is empty.'}), 409
+        return jsonify({'object': {'sha': refs[branch]}})
+
+    @fake.post('/repos/<owner>/<name>/git/refs')
+    def create_ref(owner, name):
+        refs = state['repos'][name]['refs']
+        branch = request.json['ref'].removeprefix('refs/heads/')
+        if branch in refs:
+            return jsonify({'message': 'Reference already exists'}), 422
+        refs[branch] = request.json['sha']
+        return jsonify({'object': {'sha': refs[branch]}}), 201
+
+    @fake.patch('/repos/<owner>/<name>/git/refs/heads/<branch>')
+    def update_ref(owner, name, branch):
+        repo = state['repos'][name]
+        new = request.json['sha']
+        if repo['refs'][branch] not in repo['commits'][new]['parents'] and not request.json.get('force'):
+            return jsonify({'message': 'Update is not a fast forward'}), 422
+        repo['refs'][branch] = new
+        return jsonify({'object': {'sha': new}})
+
+    @fake.get('/repos/<owner>/<name>/git/commits/<sha>')
+    def get_commit(owner, name, sha):
+        return jsonify({'sha': sha, 'tree': {'sha': state['repos'][name]['commits'][sha]['tree']}})
+
+    @fake.get('/repos/<owner>/<name>/git/trees/<sha>')
+    def get_tree(owner, name, sha):
+        files = state['repos'][name]['trees'][sha]
+        return jsonify({'sha': sha, 'tree': [{'path': p, 'type': 'blob', 'sha': s} for p, s in files.items()]})
+
+    @fake.post('/repos/<owner>/<name>/git/blobs')
+    def create_blob(owner, name):
+        data = base64.b64decode(request.json['content'])
+        sha = git_blob_sha(data)
+        state['repos'][name]['blobs'][sha] = data
+        return jsonify({'sha': sha}), 201
+
+    @fake.post('/repos/<owner>/<name>/git/trees')
+    def create_tree(owner, name):
+        repo = state['repos'][name]
+        files = dict(repo['trees'].get(request.json.get('base_tree'), {}))
+        files.update({entry['path']: entry['sha'] for entry in request.json['tree']})
+        sha = new_sha('tree')
+        repo['trees'][sha] = files
+        return jsonify({'sha': sha}), 201
+
+    @fake.post('/repos/<owner>/<name>/git/commits')
+    def create_commit(owner, name):
+        repo = state['repos'][name]
+        sha = new_sha('commit')
+        repo['commits'][sha] = {'tree': request.json['tree'], 'message': request.json['message'],
+                                'parents': request.json['parents']}
+        return jsonify({'sha': sha}), 201
+
+    # Contents API, for the per-file baseline
+    @fake.get('/repos/<owner>/<name>/contents/<path:path>')
+    def get_contents(owner, name, path):
+        repo = state['repos'][name]
+        files = repo['trees'][repo['commits'][repo['refs']['main']]['tree']]
+        if path not in files:
+            return jsonify({'message': 'Not Found'}), 404
+        return jsonify({'path': path, 'sha': files[path]})
+
+    @fake.put('/repos/<owner>/<name>/contents/<path:path>')
+    def put_contents(owner, name, path):
+        repo = state['repos'][name]
+        head = repo['refs']['main']
+        files = dict(repo['trees'][repo['commits'][head]['tree']])
+        files[path] = git_blob_sha(base64.b64decode(request.json['content']))
+        repo['refs']['main'] = commit_files(repo, files, request.json['message'], [head])
+        return jsonify({'commit': {'sha': repo['refs']['main']}}), 201
+
+    return fake, state
+
+
+def contents_api_push(base_url, repo_name, files):
+    """The previous push: look up then create/update each file, one commit each"""
+    http = requests.Session()
+    http.post(f'{base_url}/user/repos', json={'name': repo_name})
+    for path, data in files.items():
+        existing = http.get(f'{base_url}/repos/bench/{repo_name}/contents/{path}')
+        body = {'message': f'Add {path}', 'content': base64.b64encode(data).decode('ascii')}
+        if existing.status_code == 200:
+            body['sha'] = existing.json()['sha']
+        http.put(f'{base_url}/repos/bench/{repo_name}/contents/{path}', json=body)
+    http.close()
+
+
+def timed(state, fn):
+    before = state['requests']
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, state['requests'] - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.15, help='seconds added to every fake API request')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    fake, state = make_fake_github(args.latency)
+    server = make_server('127.0.0.1', 0, fake, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    files = {'index.html': b'<html><body>hello</body></html>', 'logo.png': os.urandom(20000)}
+    for i in range(len(files), args.files):
+        files[f'page{i}.html'] = f'<html><body>page {i}</body></html>'.encode()
+
+    old_seconds, old_requests, _ = timed(state, lambda: contents_api_push(base_url, 'old-site', files))
+
+    client = GitHubClient('bench-token', base_url=base_url)
+    new_seconds, new_requests, result = timed(
+        state, lambda: push_files(client, 'bench', 'new-site', files, 'Add generated website files'))
+    repo = state['repos']['new-site']
+    head = repo['commits'][repo['refs']['main']]
+    assert result['changed'] == len(files)
+    assert set(files) <= set(repo['trees'][head['tree']])
+    assert len(repo['commits']) == 2  # initial commit + one push commit
+
+    _, noop_requests, noop = timed(state, lambda: push_files(client, 'bench', 'new-site', files, 'again'))
+    assert noop['commit_sha'] is None
+    client.close()
+    server.shutdown()
+
+    print(f"{'push':<16}{'seconds':>10}{'requests':>10}{'commits':>10}")
+    print(f"{'contents-api':<16}{old_seconds:>10.2f}{old_requests:>10}{len(files):>10}")
+    print(f"{'git-data-api':<16}{new_seconds:>10.2f}{new_requests:>10}{1:>10}")
+    print(f"unchanged re-push: {noop_requests} requests, no commit")
+    print(f"speedup: {old_seconds / new_seconds:.1f}x for {len(files)} files at {args.latency * 1000:.0f} ms/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Throughput benchmark: standalone preview_app vs the main app's /preview route.
+
+Both WSGI apps run in-process through the Flask test client (no network)
+against a throwaway SQLite database seeded with one small project, and the
+same mix of page/CSS/JS/image requests is timed against each.
+
+    python benchmarks/bench_preview.py [--requests 2000] [--cookie-session]
+
+The main app keeps its normal Redis-backed sessions, so REDIS_URL must point
+at a running Redis. --cookie-session swaps in signed-cookie sessions to run
+without one; that leaves out the Redis round trips and flatters the main app.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='bench-preview-'), 'bench.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('SECRET_KEY', 'bench-secret')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as main_module  # noqa: E402
+import preview_app as preview_module  # noqa: E402
+from models import db, User, Project, ProjectFile  # noqa: E402
+from preview_utils import make_preview_token  # noqa: E402
+
+PATHS = ['index.html', 'styles.css', 'scripts.js', 'logo.png']
+
+
+def seed():
+    with main_module.app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com', name='Bench', credits=3)
+        db.session.add(user)
+        db.session.flush()
+        project = Project(user_id=user.id, name='bench')
+        db.session.add(project)
+        db.session.flush()
+        db.session.add_all([
+            ProjectFile(project_id=project.id, filename='index.html', file_type='html',
+                        content='<html><head><link rel="stylesheet" href="styles.css"></head>'
+                                '<body>' + '<p>hello</p>' * 500 + '<img src="logo.png">'
+                                '<script src="scripts.js"></script></body></html>'),
+            ProjectFile(project_id=project.id, filename='styles.css', file_type='css', content='p{color:red}' * 500),
+            ProjectFile(project_id=project.id, filename='scripts.js', file_type='js', content='console.log(1);' * 500),
+            ProjectFile(project_id=project.id, filename='logo.png', file_type='png', content_binary=b'\x89PNG' + b'\0' * 20000),
+        ])
+        db.session.commit()
+        return user.id, project.id
+
+
+def run(client, url_for_path, requests):
+    for path in PATHS * 10:  # warm caches and connection pools
+        assert client.get(url_for_path(path)).status_code == 200
+    started = time.perf_counter()
+    for i in range(requests):
+        response = client.get(url_for_path(PATHS[i % len(PATHS)]))
+        response.get_data()
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--cookie-session', action='store_true')
+    args = parser.parse_args()
+
+    if args.cookie_session:
+        from flask.sessions import SecureCookieSessionInterface
+        main_module.app.session_interface = SecureCookieSessionInterface()
+    main_module.app.config['SESSION_COOKIE_SECURE'] = False
+
+    user_id, project_id = seed()
+
+    main_client = main_module.app.test_client()
+    with main_client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['current_project_id'] = project_id
+    main_rps = run(main_client, lambda path: f'/preview/{path}', args.requests)
+
+    token = make_preview_token(preview_module.app.secret_key, user_id, project_id)
+    preview_client = preview_module.app.test_client()
+    preview_rps = run(preview_client, lambda path: f'/t/{token}/{path}', args.requests)
+
+    print(f"{'route':<32}{'req/s':>10}")
+    print(f"{'app: /preview/<file>':<32}{main_rps:>10.0f}")
+    print(f"{'preview_app: /t/<token>/<file>':<32}{preview_rps:>10.0f}")
+    print(f"speedup: {preview_rps / main_rps:.2f}x over {args.requests} requests")
+
+
+if __name__ == '__main__':
+    main()
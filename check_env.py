@@ -16,6 +16,13 @@ OPTIONAL_VARS = [
     'ANTHROPIC_API_KEY',
     'GITHUB_CLIENT_ID',
     'GITHUB_CLIENT_SECRET',
+    'GITHUB_API_URL',
+    'MAIL_PORT',
+    'MAIL_SERVER',
+    'MAIL_USE_TLS',
+    'METADATA_CACHE_TTL',
+    'RATE_LIMITS',
+    'RAZORPAY_API_URL',
     'REDIS_URL'
 ]
 
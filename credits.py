@@ -0,0 +1,129 @@
+"""Credit balances: computed lazily, changed atomically, recorded in the ledger.
+
+Free users get DAILY_FREE_CREDITS again once DAILY_RESET_INTERVAL has
+passed since their last reset. The stored row is not touched for that:
+effective_credits() works the current balance out from the stored one, and
+the reset is only written along with the next real change to the balance.
+Page views therefore never write.
+
+A change is a compare-and-swap: read the row, compute the new balance,
+then UPDATE ... WHERE the balance and reset time are still the ones read,
+retrying if another request got there first. Each change is its own short
+transaction, so a generation reserves its credit before the model runs
+without holding a row lock meanwhile, and is refunded if it fails. Every
+change appends CreditLedger rows in the same transaction.
+
+These run on their own connection so they neither commit nor expire the
+request's session.
+"""
+import datetime
+import uuid
+
+from sqlalchemy.exc import IntegrityError
+
+from metadata_cache import invalidate_user
+from models import db, User, CreditLedger
+
+DAILY_FREE_CREDITS = 3
+DAILY_RESET_INTERVAL = datetime.timedelta(hours=24)
+CHANGE_ATTEMPTS = 5
+
+
+def _utc_naive(value):
+    """Datetimes are stored as naive UTC; aware ones from older rows are converted"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def has_active_subscription(user, now=None):
+    """True while user (or a row with the same columns) has a paid subscription"""
+    end = _utc_naive(user.subscription_end_date)
+    return user.subscription_status == 'active' and end is not None and (now or utcnow()) < end
+
+
+def effective_credits(user, now=None):
+    """(balance, last_reset) for a user (or row with the same columns) as of now.
+
+    Pure: nothing is written. Active subscribers keep their stored balance;
+    free users are topped up to DAILY_FREE_CREDITS once a day, so a balance
+    above that (e.g. left from a lapsed subscription) is never reduced.
+    """
+    now = now or utcnow()
+    last_reset = _utc_naive(user.last_credit_reset)
+    credits = user.credits or 0
+
+    if has_active_subscription(user, now) or (last_reset is not None and now - last_reset < DAILY_RESET_INTERVAL):
+        return credits, last_reset
+    return max(credits, DAILY_FREE_CREDITS), now
+
+
+def new_reservation_id():
+    return uuid.uuid4().hex
+
+
+def _apply(user_id, delta, reason, reference):
+    """Adds delta to the effective balance and appends the ledger rows, atomically.
+
+    Returns the new balance, or None if it would go negative or this
+    (reason, reference) was already applied.
+    """
+    users = User.__table__
+    ledger = CreditLedger.__table__
+    columns = (users.c.credits, users.c.last_credit_reset,
+               users.c.subscription_status, users.c.subscription_end_date)
+    try:
+        for _ in range(CHANGE_ATTEMPTS):
+            with db.engine.begin() as connection:
+                row = connection.execute(db.select(*columns).where(users.c.id == user_id)).first()
+                if row is None:
+                    return None
+                now = utcnow()
+                balance, last_reset = effective_credits(row, now)
+                if balance + delta < 0:
+                    return None
+
+                unchanged = [users.c.id == user_id, users.c.credits == row.credits]
+                if row.last_credit_reset is None:
+                    unchanged.append(users.c.last_credit_reset.is_(None))
+                else:
+                    unchanged.append(users.c.last_credit_reset == row.last_credit_reset)
+                result = connection.execute(users.update().where(*unchanged).values(
+                    credits=balance + delta, last_credit_reset=last_reset
+                ))
+                if result.rowcount != 1:
+                    continue  # changed since we read it
+
+                if balance != (row.credits or 0):
+                    connection.execute(ledger.insert().values(
+                        user_id=user_id, delta=balance - (row.credits or 0), reason='daily',
+                        reference=f"{user_id}:{now:%Y%m%d%H%M%S%f}", balance=balance
+                    ))
+                # A duplicate (reason, reference) rolls the balance change back too
+                connection.execute(ledger.insert().values(
+                    user_id=user_id, delta=delta, reason=reason, reference=reference, balance=balance + delta
+                ))
+            invalidate_user(user_id)
+            return balance + delta
+    except IntegrityError:
+        return None
+    return None
+
+
+def reserve_credit(user_id, reservation_id):
+    """Takes one credit for a generation; returns the new balance, or None if there was none"""
+    return _apply(user_id, -1, 'generation', reservation_id)
+
+
+def refund_credit(user_id, reservation_id):
+    """Gives back a reserved credit. Refunding the same reservation twice is a no-op."""
+    return _apply(user_id, 1, 'refund', reservation_id)
+
+
+def grant_credits(user_id, amount, reason, reference):
+    """Adds credits once per reference (e.g. a payment id)"""
+    return _apply(user_id, amount, reason, reference)
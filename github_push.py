@@ -0,0 +1,175 @@
+"""Pushes a project to GitHub as a single commit through the Git Data API.
+
+Instead of one contents-API call (and one commit) per file, the push
+uploads only the blobs that differ from the branch head, concurrently,
+then creates one tree and one commit and fast-forwards the branch to it.
+
+Environment:
+    GITHUB_API_URL  - API base URL (default https://api.github.com); point it
+                      at a local stand-in to exercise pushes without GitHub
+"""
+import base64
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+BLOB_UPLOAD_WORKERS = 8
+REQUEST_TIMEOUT = 30  # seconds
+REF_UPDATE_ATTEMPTS = 3
+
+
+class GitHubPushError(Exception):
+    """A GitHub API call failed; status is the HTTP status when there was one"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def git_blob_sha(data):
+    """The sha git assigns to a blob with these bytes"""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class GitHubClient:
+    """Minimal Git Data API client over a pooled requests session"""
+
+    def __init__(self, token, base_url=None):
+        self.base_url = (base_url or GITHUB_API_URL).rstrip('/')
+        self.http = requests.Session()
+        self.http.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=BLOB_UPLOAD_WORKERS)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def request(self, method, path, expected=(200, 201), **kwargs):
+        try:
+            response = self.http.request(method, f"{self.base_url}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            raise GitHubPushError(f"GitHub API unreachable: {type(e).__name__}") from e
+        if response.status_code not in expected:
+            raise GitHubPushError(
+                f"GitHub API {method} {path} returned {response.status_code}",
+                status=response.status_code,
+                retry_after=_retry_after(response)
+            )
+        return response.json() if response.content else {}
+
+    def close(self):
+        self.http.close()
+
+
+def _retry_after(response):
+    """Seconds GitHub asks us to wait, from Retry-After or an exhausted rate limit"""
+    if response.headers.get('Retry-After', '').isdigit():
+        return int(response.headers['Retry-After'])
+    if response.headers.get('X-RateLimit-Remaining') == '0':
+        reset = response.headers.get('X-RateLimit-Reset', '')
+        if reset.isdigit():
+            return max(0, int(reset) - int(time.time()))
+    return None
+
+
+def ensure_repo(client, owner, repo_name, description):
+    """Returns the repo, creating it (with an initial commit) if it does not exist"""
+    try:
+        return client.request('GET', f'/repos/{owner}/{repo_name}'), False
+    except GitHubPushError as e:
+        if e.status != 404:
+            raise
+    repo = client.request('POST', '/user/repos', json={
+        'name': repo_name,
+        'description': description,
+        'private': False,
+        'auto_init': True,
+    })
+    return repo, True
+
+
+def push_files(client, owner, repo_name, files, message, description='', progress=None):
+    """Commits files ({path: bytes}) to the repo's default branch in one commit.
+
+    Paths that are not in `files` are left as they are on the branch.
+    Returns {'commit_sha', 'changed', 'created_repo'}; 'commit_sha' is None
+    when the branch already had identical content.
+    progress, if given, is called as progress(done, total) as blobs upload.
+    """
+    repo, created = ensure_repo(client, owner, repo_name, description)
+    branch = repo.get('default_branch') or 'main'
+    repo_path = f"/repos/{owner}/{repo_name}"
+
+    for attempt in range(REF_UPDATE_ATTEMPTS):
+        try:
+            ref = client.request('GET', f'{repo_path}/git/ref/heads/{branch}')
+            head_sha = ref['object']['sha']
+            head = client.request('GET', f'{repo_path}/git/commits/{head_sha}')
+            base_tree_sha = head['tree']['sha']
+            existing = client.request('GET', f'{repo_path}/git/trees/{base_tree_sha}', params={'recursive': '1'})
+        except GitHubPushError as e:
+            # An empty repository has no branch yet
+            if e.status not in (404, 409):
+                raise
+            head_sha, base_tree_sha, existing = None, None, {'tree': []}
+
+        remote_shas = {entry['path']: entry['sha'] for entry in existing.get('tree', []) if entry.get('type') == 'blob'}
+        changed = {path: data for path, data in files.items() if remote_shas.get(path) != git_blob_sha(data)}
+        if not changed and head_sha:
+            return {'commit_sha': None, 'changed': 0, 'created_repo': created}
+
+        blob_shas = upload_blobs(client, repo_path, changed, progress)
+
+        tree_body = {'tree': [
+            {'path': path, 'mode': '100644', 'type': 'blob', 'sha': sha}
+            for path, sha in sorted(blob_shas.items())
+        ]}
+        if base_tree_sha:
+            tree_body['base_tree'] = base_tree_sha
+        tree = client.request('POST', f'{repo_path}/git/trees', json=tree_body)
+        commit = client.request('POST', f'{repo_path}/git/commits', json={
+            'message': message,
+            'tree': tree['sha'],
+            'parents': [head_sha] if head_sha else [],
+        })
+
+        try:
+            if head_sha:
+                # force=False: rejected unless it is a fast-forward of the head we built on
+                client.request('PATCH', f'{repo_path}/git/refs/heads/{branch}', json={'sha': commit['sha'], 'force': False})
+            else:
+                client.request('POST', f'{repo_path}/git/refs', json={'ref': f'refs/heads/{branch}', 'sha': commit['sha']})
+        except GitHubPushError as e:
+            # Someone else moved the branch meanwhile: rebuild on the new head
+            if e.status == 422 and attempt < REF_UPDATE_ATTEMPTS - 1:
+                continue
+            raise
+        return {'commit_sha': commit['sha'], 'changed': len(changed), 'created_repo': created}
+
+    raise GitHubPushError("Branch kept moving during push")
+
+
+def upload_blobs(client, repo_path, files, progress=None):
+    """Creates a blob per file concurrently; returns {path: blob sha}"""
+    def upload(item):
+        path, data = item
+        blob = client.request('POST', f'{repo_path}/git/blobs', json={
+            'content': base64.b64encode(data).decode('ascii'),
+            'encoding': 'base64',
+        })
+        return path, blob['sha']
+
+    shas = {}
+    with ThreadPoolExecutor(max_workers=BLOB_UPLOAD_WORKERS) as pool:
+        for path, sha in pool.map(upload, files.items()):
+            shas[path] = sha
+            if progress:
+                progress(len(shas), len(files))
+    return shas
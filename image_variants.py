@@ -0,0 +1,129 @@
+"""Responsive, re-encoded variants of uploaded images.
+
+Uploads are stored as-is; a background job then renders smaller widths and
+WebP encodings into the image_variants table. Preview and export ask
+pick_variant() for the smallest acceptable copy and fall back to the
+original when there is none (yet).
+
+Pillow is optional: without it no variants are made and originals are
+served unchanged.
+"""
+from io import BytesIO
+
+from models import db, ImageVariant
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+VARIANT_WIDTHS = (640, 1280, 1920)
+PREVIEW_MAX_WIDTH = 1280
+EXPORT_MAX_WIDTH = 1920
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Extension -> Pillow format for the images we resize. GIFs may be animated
+# and SVGs are vector, so both are always served as uploaded.
+RESIZABLE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG'}
+VARIANT_CONTENT_TYPES = {'webp': 'image/webp', 'png': 'image/png', 'jpeg': 'image/jpeg'}
+
+if Image is not None:
+    # Refuse decompression bombs well before they exhaust a worker
+    Image.MAX_IMAGE_PIXELS = 40_000_000
+
+
+def variants_enabled():
+    return Image is not None
+
+
+def sniff_image_type(data):
+    """Format named by the file's magic bytes, or None if it is not an image we accept"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _encode(img, fmt):
+    out = BytesIO()
+    if fmt == 'WEBP':
+        img.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'JPEG':
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        img.save(out, fmt, optimize=True)
+    return out.getvalue()
+
+
+def make_variants(data, extension):
+    """[(width, height, format, bytes)] for an image; [] without Pillow or for other formats.
+
+    Each VARIANT_WIDTHS width narrower than the original is rendered in WebP
+    and in the original format; the original width is re-encoded as WebP.
+    """
+    extension = extension.lower()
+    if Image is None or extension not in RESIZABLE_FORMATS:
+        return []
+    source_format = RESIZABLE_FORMATS[extension]
+    source_name = 'jpeg' if source_format == 'JPEG' else 'png'
+
+    with Image.open(BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        variants = []
+        widths = [width for width in VARIANT_WIDTHS if width < img.width] + [img.width]
+        for width in widths:
+            if width == img.width:
+                resized = img
+            else:
+                resized = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            variants.append((width, resized.height, 'webp', _encode(resized, 'WEBP')))
+            if width != img.width:
+                variants.append((width, resized.height, source_name, _encode(resized, source_format)))
+    return variants
+
+
+def choose_variant(candidates, accept_webp, max_width, original_size):
+    """Best of [(id, format, width, size_bytes)]: the widest one that fits max_width,
+    smallest first among equal widths, and only if it beats the original's size.
+    Images that already fit are never downscaled. Returns the chosen id or None.
+    """
+    if not candidates:
+        return None
+    # The widest variant is always the full-size WebP, so it gives the original width
+    original_width = max(c[2] for c in candidates)
+    min_width = original_width if original_width <= max_width else 0
+    usable = [c for c in candidates
+              if min_width <= c[2] <= max_width and (accept_webp or c[1] != 'webp')]
+    if not usable:
+        return None
+    best = max(usable, key=lambda c: (c[2], -c[3]))
+    if original_size is not None and best[3] >= original_size:
+        return None
+    return best[0]
+
+
+def best_variant_id(file_id, content_hash, file_type, size_bytes, accept_webp, max_width=PREVIEW_MAX_WIDTH):
+    """Id of the variant to serve for an image, from one query on variant metadata"""
+    if file_type not in RESIZABLE_FORMATS:
+        return None
+    candidates = db.session.query(
+        ImageVariant.id, ImageVariant.format, ImageVariant.width, ImageVariant.size_bytes
+    ).filter_by(file_id=file_id, source_hash=content_hash).all()
+    return choose_variant(candidates, accept_webp, max_width, size_bytes)
+
+
+def pick_variant(file, accept_webp, max_width=PREVIEW_MAX_WIDTH):
+    """The ImageVariant to serve instead of a binary file, or None to serve the original.
+
+    Only the file's metadata is read, so the original's blob is not loaded.
+    """
+    variant_id = best_variant_id(file.id, file.content_hash, file.file_type, file.size_bytes, accept_webp, max_width)
+    return db.session.get(ImageVariant, variant_id) if variant_id else None
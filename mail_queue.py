@@ -0,0 +1,201 @@
+"""Outgoing mail, queued in Redis and delivered in the background.
+
+enqueue_mail() stores the message and returns at once; a MailWorker
+delivers it. Each worker keeps its SMTP connection open between batches
+(closing it after MAIL_IDLE_TIMEOUT without mail), so a burst of messages
+pays for one handshake and login rather than one per message.
+
+Keys:
+    mail:messages   - hash of message id -> JSON message
+    mail:queue      - list of ids ready to send
+    mail:retry      - sorted set of ids by the time (ms) to try again
+    mail:processing - sorted set of ids claimed by a worker, by lease expiry
+    mail:dead       - the last DEAD_LETTER_LIMIT messages that never went out
+
+One Lua script moves due retries and expired claims back onto the queue
+and claims a batch, so a worker that dies mid-send only delays its batch
+by CLAIM_LEASE_MS. Delivery is therefore at least once.
+"""
+import json
+import smtplib
+import threading
+import time
+import uuid
+
+import redis
+from flask_mail import Message
+
+from logging_config import get_logger
+
+logger = get_logger()
+
+MESSAGES_KEY = 'mail:messages'
+QUEUE_KEY = 'mail:queue'
+RETRY_KEY = 'mail:retry'
+PROCESSING_KEY = 'mail:processing'
+DEAD_KEY = 'mail:dead'
+
+BATCH_SIZE = 20
+CLAIM_LEASE_MS = 5 * 60 * 1000
+MAX_ATTEMPTS = 6
+MAX_BACKOFF = 60 * 60  # seconds
+DEAD_LETTER_LIMIT = 1000
+MAIL_IDLE_TIMEOUT = 30  # seconds an unused SMTP connection is kept open
+POLL_INTERVAL = 2  # seconds
+
+# KEYS: messages hash, queue list, retry zset, processing zset
+# ARGV: now ms, batch size, lease ms
+# Returns {id, message json, id, message json, ...} for the claimed batch.
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+for _, key in ipairs({KEYS[3], KEYS[4]}) do
+    local due = redis.call('ZRANGEBYSCORE', key, '-inf', now)
+    for _, id in ipairs(due) do
+        redis.call('ZREM', key, id)
+        redis.call('RPUSH', KEYS[2], id)
+    end
+end
+
+local claimed = {}
+for _ = 1, tonumber(ARGV[2]) do
+    local id = redis.call('RPOP', KEYS[2])
+    if not id then
+        break
+    end
+    local message = redis.call('HGET', KEYS[1], id)
+    if message then
+        redis.call('ZADD', KEYS[4], now + tonumber(ARGV[3]), id)
+        table.insert(claimed, id)
+        table.insert(claimed, message)
+    end
+end
+return claimed
+"""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def enqueue_mail(redis_client, subject, recipients, body, sender=None):
+    """Queues a plain-text message; returns its id. Raises redis.RedisError if Redis is down."""
+    message_id = uuid.uuid4().hex
+    message = {
+        'id': message_id,
+        'subject': subject,
+        'recipients': list(recipients),
+        'body': body,
+        'sender': sender,
+        'attempts': 0,
+    }
+    pipe = redis_client.pipeline()
+    pipe.hset(MESSAGES_KEY, message_id, json.dumps(message))
+    pipe.lpush(QUEUE_KEY, message_id)
+    pipe.execute()
+    return message_id
+
+
+class MailWorker:
+    """Delivers queued mail through Flask-Mail over one reused SMTP connection"""
+
+    def __init__(self, app, mail, redis_client):
+        self.app = app
+        self.mail = mail
+        self.redis = redis_client
+        self._claim = redis_client.register_script(_CLAIM_SCRIPT)
+        self._connection = None
+        self._last_used = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _smtp(self):
+        if self._connection is not None and time.monotonic() - self._last_used > MAIL_IDLE_TIMEOUT:
+            self.close()
+        if self._connection is None:
+            self._connection = self.mail.connect().__enter__()
+        self._last_used = time.monotonic()
+        return self._connection
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass  # the server already hung up
+
+    def _done(self, message_id):
+        pipe = self.redis.pipeline()
+        pipe.zrem(PROCESSING_KEY, message_id)
+        pipe.hdel(MESSAGES_KEY, message_id)
+        pipe.execute()
+
+    def _failed(self, message, error):
+        message['attempts'] += 1
+        message['last_error'] = type(error).__name__
+        pipe = self.redis.pipeline()
+        pipe.zrem(PROCESSING_KEY, message['id'])
+        if message['attempts'] >= MAX_ATTEMPTS:
+            pipe.hdel(MESSAGES_KEY, message['id'])
+            pipe.lpush(DEAD_KEY, json.dumps(message))
+            pipe.ltrim(DEAD_KEY, 0, DEAD_LETTER_LIMIT - 1)
+            logger.error("Mail delivery gave up", extra={'fields': {
+                'message_id': message['id'], 'attempts': message['attempts'], 'error': message['last_error']
+            }})
+        else:
+            delay = min(30 * 2 ** (message['attempts'] - 1), MAX_BACKOFF)
+            pipe.hset(MESSAGES_KEY, message['id'], json.dumps(message))
+            pipe.zadd(RETRY_KEY, {message['id']: _now_ms() + delay * 1000})
+            logger.warning("Mail delivery retrying", extra={'fields': {
+                'message_id': message['id'], 'attempt': message['attempts'], 'delay': delay, 'error': message['last_error']
+            }})
+        pipe.execute()
+
+    def deliver_batch(self):
+        """Claims and sends up to BATCH_SIZE due messages; returns how many were claimed"""
+        claimed = self._claim(keys=[MESSAGES_KEY, QUEUE_KEY, RETRY_KEY, PROCESSING_KEY],
+                              args=[_now_ms(), BATCH_SIZE, CLAIM_LEASE_MS])
+        messages = [json.loads(raw) for raw in claimed[1::2]]
+        if not messages:
+            return 0
+
+        sent = 0
+        with self.app.app_context():
+            for message in messages:
+                try:
+                    self._smtp().send(Message(
+                        subject=message['subject'],
+                        recipients=message['recipients'],
+                        body=message['body'],
+                        sender=message['sender'] or self.app.config.get('MAIL_DEFAULT_SENDER')
+                    ))
+                except Exception as e:
+                    if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                        self.close()  # the connection may be unusable; reconnect for the next one
+                    self._failed(message, e)
+                    continue
+                self._done(message['id'])
+                sent += 1
+        logger.info("Mail batch delivered", extra={'fields': {'claimed': len(messages), 'sent': sent}})
+        return len(messages)
+
+    def run(self, stop=None):
+        """Delivers until stop (a threading.Event) is set, polling when the queue is empty"""
+        while stop is None or not stop.is_set():
+            try:
+                claimed = self.deliver_batch()
+            except redis.RedisError as e:
+                logger.warning("Mail queue unavailable", extra={'fields': {'error': type(e).__name__}})
+                claimed = 0
+            if claimed < BATCH_SIZE:
+                if self._connection is not None and time.monotonic() - self._last_used > MAIL_IDLE_TIMEOUT:
+                    self.close()
+                time.sleep(POLL_INTERVAL)
+        self.close()
+
+    def start(self):
+        """Starts delivering on a daemon thread in this process, once"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='mail-worker', daemon=True)
+                self._thread.start()
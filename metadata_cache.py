@@ -0,0 +1,129 @@
+"""Cached user and project metadata for the checks every request repeats.
+
+Lookups go through two layers: a dict on flask.g for the rest of the
+request, then Redis with a short TTL shared by all workers, then the
+database. Only small, rarely-changing columns are cached, as namedtuples;
+routes that modify a row still load it through the ORM. Writes to cached
+columns must call invalidate_user() / invalidate_project() after commit.
+
+A Redis outage only costs the shared layer: lookups fall through to the
+database.
+
+Environment:
+    METADATA_CACHE_TTL - seconds a Redis entry lives (default 60)
+"""
+import datetime
+import json
+import os
+from collections import namedtuple
+
+import redis
+from flask import g, has_request_context
+
+from models import db, User, Project
+
+METADATA_CACHE_TTL = int(os.getenv('METADATA_CACHE_TTL', 60))
+
+UserMeta = namedtuple('UserMeta', [
+    'id', 'email', 'name', 'credits', 'last_credit_reset',
+    'subscription_status', 'subscription_plan', 'subscription_end_date',
+])
+ProjectMeta = namedtuple('ProjectMeta', ['id', 'user_id', 'name'])
+
+_DATETIME_FIELDS = ('last_credit_reset', 'subscription_end_date')
+
+_redis = None
+
+
+def init_metadata_cache(redis_client):
+    global _redis
+    _redis = redis_client
+
+
+def _request_cache():
+    if not has_request_context():
+        return {}
+    if '_metadata' not in g:
+        g._metadata = {}
+    return g._metadata
+
+
+def _redis_get(key):
+    if _redis is None:
+        return None
+    try:
+        value = _redis.get(key)
+    except redis.RedisError:
+        return None
+    return json.loads(value) if value else None
+
+
+def _redis_set(key, data):
+    if _redis is None:
+        return
+    try:
+        _redis.setex(key, METADATA_CACHE_TTL, json.dumps(data, default=datetime.datetime.isoformat))
+    except redis.RedisError:
+        pass
+
+
+def _forget(key):
+    _request_cache().pop(key, None)
+    if _redis is None:
+        return
+    try:
+        _redis.delete(key)
+    except redis.RedisError:
+        pass
+
+
+def _lookup(key, load, build):
+    cache = _request_cache()
+    if key in cache:
+        return cache[key]
+    data = _redis_get(key)
+    if data is None:
+        data = load()
+        if data is not None:
+            _redis_set(key, data)
+    meta = build(data) if data is not None else None
+    cache[key] = meta
+    return meta
+
+
+def get_user(user_id):
+    """UserMeta for a user id, or None if there is no such user"""
+    def load():
+        columns = [User.__table__.c[field] for field in UserMeta._fields]
+        row = db.session.execute(db.select(*columns).where(User.id == user_id)).first()
+        return dict(row._mapping) if row else None
+
+    def build(data):
+        for field in _DATETIME_FIELDS:
+            if isinstance(data[field], str):
+                data[field] = datetime.datetime.fromisoformat(data[field])
+        return UserMeta(**data)
+
+    return _lookup(f'meta:user:{user_id}', load, build)
+
+
+def get_owned_project(project_id, user_id):
+    """ProjectMeta if the project exists and belongs to user_id, else None"""
+    def load():
+        row = db.session.execute(
+            db.select(Project.id, Project.user_id, Project.name).where(Project.id == project_id)
+        ).first()
+        return dict(row._mapping) if row else None
+
+    project = _lookup(f'meta:project:{project_id}', load, lambda data: ProjectMeta(**data))
+    if project is None or project.user_id != user_id:
+        return None
+    return project
+
+
+def invalidate_user(user_id):
+    _forget(f'meta:user:{user_id}')
+
+
+def invalidate_project(project_id):
+    _forget(f'meta:project:{project_id}')
@@ -1,5 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timezone
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import object_session
+from bs4 import BeautifulSoup
+from datetime import datetime, timedelta, timezone
+import hashlib
+import re
 
 db = SQLAlchemy()
 
@@ -33,6 +39,7 @@ class User(db.Model):
 
 class Project(db.Model):
     __tablename__ = 'projects'
+    __table_args__ = (db.Index('ix_projects_user_id_updated_at', 'user_id', 'updated_at'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -43,21 +50,194 @@ class Project(db.Model):
     # Relationships
     files = db.relationship('ProjectFile', backref='project', lazy=True, cascade='all, delete-orphan')
     chat_messages = db.relationship('ChatHistory', backref='project', lazy=True, cascade='all, delete-orphan')
+    snapshots = db.relationship('PublishedSnapshot', backref='project', lazy=True, cascade='all, delete-orphan')
+
+class FileBlob(db.Model):
+    """Stored file bytes, keyed by their sha256.
+
+    Project files and image variants point at a blob by hash rather than
+    holding the bytes, so every copy of the same content (a forked project,
+    an image uploaded twice) is stored once and copying a file copies only
+    its row. Blobs nothing points at any more are removed by
+    delete_unreferenced_blobs().
+    """
+    __tablename__ = 'file_blobs'
+
+    hash = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+def _blob_data(target, blob_hash, connection=None):
+    """The bytes of the blob target points at, loaded at most once per instance"""
+    if blob_hash is None:
+        return None
+    cached = target.__dict__.get('_blob_cache')
+    if cached and cached[0] == blob_hash:
+        return cached[1]
+    blob = target.__dict__.get('blob')  # already loaded, e.g. by selectinload
+    if blob is not None and blob.hash == blob_hash:
+        return blob.data
+    executor = connection if connection is not None else (object_session(target) or db.session)
+    data = executor.execute(db.select(FileBlob.data).where(FileBlob.hash == blob_hash)).scalar_one()
+    target._blob_cache = (blob_hash, data)
+    return data
+
+def _hold_blob(target, hash_attr, data):
+    """Points target at the blob for data; the blob is written when target is flushed"""
+    blob_hash = hashlib.sha256(data).hexdigest()
+    target._blob_cache = (blob_hash, data)
+    setattr(target, hash_attr, blob_hash)
+
+def _store_blob(connection, target, blob_hash):
+    """Inserts the blob target was given, unless one with its hash is already stored"""
+    cached = target.__dict__.get('_blob_cache')
+    if blob_hash is None or not cached or cached[0] != blob_hash:
+        return  # target points at a blob that is already stored
+    table = FileBlob.__table__
+    values = {'hash': blob_hash, 'data': cached[1], 'created_at': datetime.now(timezone.utc)}
+    if connection.dialect.name in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+        connection.execute(insert(table).values(**values).on_conflict_do_nothing(index_elements=['hash']))
+    elif connection.execute(db.select(table.c.hash).where(table.c.hash == blob_hash)).first() is None:
+        connection.execute(table.insert().values(**values))
 
 class ProjectFile(db.Model):
     __tablename__ = 'project_files'
+    __table_args__ = (db.Index('ix_project_files_project_id_filename', 'project_id', 'filename'),)
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text)  # For text files (HTML, CSS, JS)
-    content_binary = db.Column(db.LargeBinary)  # For binary files (images)
     file_type = db.Column(db.String(50))
+    is_binary = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # images
+    revision = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by the ORM on every update
+    asset_refs = db.Column(db.JSON)  # Project-local assets an HTML page references, for preload hints
+    content_hash = db.Column(db.String(64), db.ForeignKey('file_blobs.hash'), index=True)  # sha256 of the bytes: the FileBlob holding them
+    size_bytes = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
+    __mapper_args__ = {'version_id_col': revision}
+
+    # Rows are deleted without being loaded: by ON DELETE CASCADE, and by
+    # delete_file_variants where foreign keys are not enforced (SQLite)
+    variants = db.relationship('ImageVariant', backref='file', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    # Loaded on first use of content/content_binary; queries that read many
+    # files load them all at once with .options(db.selectinload(ProjectFile.blob))
+    blob = db.relationship('FileBlob', viewonly=True)
+
+    @property
+    def content(self):
+        """Text of a text file (HTML, CSS, JS); None for binary files"""
+        if self.is_binary:
+            return None
+        data = _blob_data(self, self.content_hash)
+        return None if data is None else data.decode('utf-8')
+
+    @content.setter
+    def content(self, text):
+        if text is None:
+            if not self.is_binary:
+                _hold_blob(self, 'content_hash', b'')
+            return
+        self.is_binary = False
+        _hold_blob(self, 'content_hash', text.encode('utf-8'))
+
+    @property
+    def content_binary(self):
+        """Bytes of a binary file (images); None for text files"""
+        return _blob_data(self, self.content_hash) if self.is_binary else None
+
+    @content_binary.setter
+    def content_binary(self, data):
+        if data is None:
+            if self.is_binary:
+                self.is_binary = False
+                _hold_blob(self, 'content_hash', b'')
+            return
+        self.is_binary = True
+        _hold_blob(self, 'content_hash', bytes(data))
+
+class ImageVariant(db.Model):
+    """A resized and/or re-encoded copy of an uploaded image, made in the background"""
+    __tablename__ = 'image_variants'
+    __table_args__ = (db.UniqueConstraint('file_id', 'source_hash', 'width', 'format'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('project_files.id', ondelete='CASCADE'), nullable=False, index=True)
+    source_hash = db.Column(db.String(64), nullable=False)  # content_hash of the original it was made from
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # webp, png or jpeg
+    blob_hash = db.Column(db.String(64), db.ForeignKey('file_blobs.hash'), nullable=False, index=True)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    blob = db.relationship('FileBlob', viewonly=True)
+
+    @property
+    def content_binary(self):
+        return _blob_data(self, self.blob_hash)
+
+    @content_binary.setter
+    def content_binary(self, data):
+        _hold_blob(self, 'blob_hash', bytes(data))
+
+@event.listens_for(ImageVariant, 'before_insert')
+def store_variant_blob(mapper, connection, target):
+    _store_blob(connection, target, target.blob_hash)
+
+PRELOAD_MAX_IMAGES = 3
+
+def extract_asset_refs(html):
+    """Project-local stylesheets, scripts and the first few images a page references"""
+    soup = BeautifulSoup(html or '', 'html.parser')
+    refs = []
+    seen = set()
+    
+    def add(href, kind):
+        if not href or href in seen:
+            return
+        if href.startswith(('http://', 'https://', '//', '/', 'data:', '#', 'mailto:', 'tel:')):
+            return
+        seen.add(href)
+        refs.append({'href': href, 'as': kind})
+    
+    for link in soup.find_all('link', href=True):
+        if 'stylesheet' in (link.get('rel') or []):
+            add(link['href'], 'style')
+    for script in soup.find_all('script', src=True):
+        add(script['src'], 'script')
+    for img in soup.find_all('img', src=True)[:PRELOAD_MAX_IMAGES]:
+        add(img['src'], 'image')
+    return refs
+
+def _file_text(target, connection):
+    """A text file's content, read on the flush's connection"""
+    if target.is_binary:
+        return None
+    return _blob_data(target, target.content_hash, connection).decode('utf-8')
+
+@event.listens_for(ProjectFile, 'before_insert')
+@event.listens_for(ProjectFile, 'before_update')
+def record_file_metadata(mapper, connection, target):
+    """Store the content's blob and derive size and (for HTML) asset references once, when the file is written"""
+    if target.content_hash is None:
+        target.content = ''  # created without content
+    state = inspect(target)
+    changed = state.pending or state.attrs.content_hash.history.has_changes()
+    
+    if changed:
+        _store_blob(connection, target, target.content_hash)
+        target.size_bytes = len(_blob_data(target, target.content_hash, connection))
+    
+    if target.filename.endswith('.html') and (changed or target.asset_refs is None):
+        target.asset_refs = extract_asset_refs(_file_text(target, connection))
+
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (db.Index('ix_chat_history_project_id_timestamp', 'project_id', 'timestamp'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -69,6 +249,66 @@ class ChatHistory(db.Model):
     created_files = db.Column(db.JSON)
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+class CreditLedger(db.Model):
+    """Append-only record of every change to a user's credit balance.
+
+    reference identifies what the change was for (a generation's
+    reservation id, a payment id); (reason, reference) is unique so a
+    refund or grant can never be applied twice.
+    """
+    __tablename__ = 'credit_ledger'
+    __table_args__ = (db.UniqueConstraint('reason', 'reference'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # generation, refund, purchase
+    reference = db.Column(db.String(64))
+    balance = db.Column(db.Integer)  # balance right after this change
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class PaymentOrder(db.Model):
+    """A Razorpay order we created, and what became of it.
+
+    Payments look their order up by order_id to find the user and the plan
+    that was actually ordered; (user_id, created_at) serves billing history.
+    """
+    __tablename__ = 'payment_orders'
+    __table_args__ = (db.Index('ix_payment_orders_user_id_created_at', 'user_id', 'created_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    plan_type = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)  # in paise
+    currency = db.Column(db.String(3), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='created', server_default='created')  # created, paid, failed
+    payment_id = db.Column(db.String(64))
+    paid_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class WebhookEvent(db.Model):
+    """A received webhook, stored before it is processed.
+
+    event_id is unique, so a redelivered event is recognised and dropped.
+    A worker claims pending events whose next_attempt_at has passed; while
+    an event is processing, next_attempt_at is its lease, after which
+    another worker may take it over.
+    """
+    __tablename__ = 'webhook_events'
+    __table_args__ = (db.Index('ix_webhook_events_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(64), unique=True, nullable=False)
+    event_type = db.Column(db.String(64))
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', server_default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime)
+
 class SessionRecord(db.Model):
     __tablename__ = 'session_records'
     
@@ -81,3 +321,127 @@ class SessionRecord(db.Model):
     filename = db.Column(db.String(255))
     created_files = db.Column(db.JSON)
     was_modification = db.Column(db.Boolean, default=False)
+
+class PublishedSnapshot(db.Model):
+    __tablename__ = 'published_snapshots'
+    __table_args__ = (db.UniqueConstraint('project_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    slug = db.Column(db.String(64), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    file_count = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class SearchEntry(db.Model):
+    """One searchable document per project, chat message and text file.
+
+    Maintained by the listeners below in the same transaction as the write.
+    The full-text index itself is dialect specific and created by migration:
+    a generated tsvector column with a GIN index on Postgres, an FTS5 table
+    (search_entries_fts) kept in sync by triggers on SQLite.
+    """
+    __tablename__ = 'search_entries'
+    __table_args__ = (db.UniqueConstraint('kind', 'ref_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    project_id = db.Column(db.Integer, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # project, chat or file
+    ref_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.Text)
+    body = db.Column(db.Text)
+
+SEARCH_BODY_MAX_CHARS = 100_000
+SEARCHABLE_FILE_TYPES = {'html', 'css', 'js', 'txt', 'json', 'svg'}
+_TAG_RE = re.compile(r'<[^>]+>')
+
+def search_text(filename, content):
+    """Text indexed for a file: markup stripped from HTML, capped in size"""
+    if filename.endswith('.html'):
+        content = _TAG_RE.sub(' ', content)
+    return content[:SEARCH_BODY_MAX_CHARS]
+
+def _replace_search_entry(connection, kind, ref_id, **values):
+    table = SearchEntry.__table__
+    connection.execute(table.delete().where(table.c.kind == kind, table.c.ref_id == ref_id))
+    if values:
+        connection.execute(table.insert().values(kind=kind, ref_id=ref_id, **values))
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return state.pending or any(getattr(state.attrs, attr).history.has_changes() for attr in attrs)
+
+@event.listens_for(Project, 'after_insert')
+@event.listens_for(Project, 'after_update')
+def index_project(mapper, connection, target):
+    if _changed(target, 'name'):
+        _replace_search_entry(connection, 'project', target.id,
+                              user_id=target.user_id, project_id=target.id, title=target.name, body='')
+
+@event.listens_for(ChatHistory, 'after_insert')
+@event.listens_for(ChatHistory, 'after_update')
+def index_chat(mapper, connection, target):
+    if _changed(target, 'prompt', 'response'):
+        _replace_search_entry(connection, 'chat', target.id,
+                              user_id=target.user_id, project_id=target.project_id,
+                              title=target.prompt, body=target.response or '')
+
+@event.listens_for(ProjectFile, 'after_insert')
+@event.listens_for(ProjectFile, 'after_update')
+def index_file(mapper, connection, target):
+    if not _changed(target, 'content_hash', 'is_binary', 'filename'):
+        return
+    if target.is_binary or target.file_type not in SEARCHABLE_FILE_TYPES:
+        _replace_search_entry(connection, 'file', target.id)
+        return
+    user_id = connection.execute(
+        db.select(Project.user_id).where(Project.id == target.project_id)
+    ).scalar()
+    _replace_search_entry(connection, 'file', target.id,
+                          user_id=user_id, project_id=target.project_id,
+                          title=target.filename, body=search_text(target.filename, _file_text(target, connection)))
+
+@event.listens_for(Project, 'after_delete')
+def unindex_project(mapper, connection, target):
+    _replace_search_entry(connection, 'project', target.id)
+
+@event.listens_for(ChatHistory, 'after_delete')
+def unindex_chat(mapper, connection, target):
+    _replace_search_entry(connection, 'chat', target.id)
+
+@event.listens_for(ProjectFile, 'after_delete')
+def unindex_file(mapper, connection, target):
+    _replace_search_entry(connection, 'file', target.id)
+
+@event.listens_for(ProjectFile, 'after_delete')
+def delete_file_variants(mapper, connection, target):
+    connection.execute(ImageVariant.__table__.delete().where(ImageVariant.file_id == target.id))
+
+BLOB_GC_GRACE = timedelta(hours=1)
+BLOB_GC_BATCH_SIZE = 500
+
+def delete_unreferenced_blobs(grace=BLOB_GC_GRACE, batch_size=BLOB_GC_BATCH_SIZE):
+    """Deletes blobs no file or variant points at; returns how many.
+
+    Blobs younger than grace are kept, so one written by a transaction that
+    has not committed yet is not taken from under it.
+    """
+    blobs = FileBlob.__table__
+    unreferenced = db.and_(
+        blobs.c.created_at < datetime.now(timezone.utc) - grace,
+        ~db.exists().where(ProjectFile.content_hash == blobs.c.hash),
+        ~db.exists().where(ImageVariant.blob_hash == blobs.c.hash),
+    )
+    deleted = 0
+    while True:
+        hashes = db.session.execute(db.select(blobs.c.hash).where(unreferenced).limit(batch_size)).scalars().all()
+        if not hashes:
+            return deleted
+        # Checked again as it is deleted, for blobs referenced since the select
+        result = db.session.execute(blobs.delete().where(blobs.c.hash.in_(hashes), unreferenced))
+        db.session.commit()
+        deleted += result.rowcount
+        if len(hashes) < batch_size:
+            return deleted
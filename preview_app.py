@@ -0,0 +1,155 @@
+"""Standalone preview server.
+
+A minimal WSGI app for preview traffic only: no server-side sessions, OAuth,
+mail or AI clients. Each request is a signed-token check (tokens come from
+/api/preview-token on the main app), an in-process cache lookup and a
+streamed response. Deploy it separately and scale it independently:
+
+    gunicorn preview_app:app
+
+and point the main app at it with PREVIEW_BASE_URL. Both apps must share
+SECRET_KEY and SQLALCHEMY_DATABASE_URI.
+"""
+import os
+import threading
+
+from cachetools import LRUCache, TTLCache
+from dotenv import load_dotenv
+from flask import Flask, Response, request
+
+from logging_config import configure_logging
+from image_variants import RESIZABLE_FORMATS, VARIANT_CONTENT_TYPES, best_variant_id, pick_variant
+from models import db, ProjectFile
+from preview_utils import guess_content_type, preload_link_header, read_preview_token
+
+load_dotenv()
+
+logger = configure_logging()
+
+# Entries younger than this are served without touching the database; older
+# ones are revalidated with a revision-only query.
+PREVIEW_CACHE_TTL = float(os.getenv('PREVIEW_CACHE_TTL', '2'))
+PREVIEW_CACHE_ENTRIES = int(os.getenv('PREVIEW_CACHE_ENTRIES', '2048'))
+# Bodies are cached up to this many bytes in total per process; larger
+# bodies than PREVIEW_CACHE_MAX_BODY are always read from the database.
+PREVIEW_CACHE_BYTES = int(os.getenv('PREVIEW_CACHE_BYTES', str(256 * 1024 * 1024)))
+PREVIEW_CACHE_MAX_BODY = int(os.getenv('PREVIEW_CACHE_MAX_BODY', str(2 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+app = Flask(__name__)
+app.secret_key = os.getenv("SECRET_KEY")
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': True,
+    'pool_recycle': 300,
+}
+db.init_app(app)
+
+# (project_id, filename, webp) -> (version, body, headers), version being
+# (file id, revision, image variant id or None); least recently used
+# entries are evicted once the bodies exceed PREVIEW_CACHE_BYTES
+_cache = LRUCache(maxsize=PREVIEW_CACHE_BYTES, getsizeof=lambda entry: len(entry[1]))
+_cache_lock = threading.Lock()
+_fresh = TTLCache(maxsize=PREVIEW_CACHE_ENTRIES, ttl=PREVIEW_CACHE_TTL)
+
+
+def _is_resizable(filename):
+    return filename.rsplit('.', 1)[-1].lower() in RESIZABLE_FORMATS
+
+
+def _load(project_id, filename, webp):
+    """Reads a file and returns (version, body, headers), or None if missing"""
+    file = ProjectFile.query.filter_by(project_id=project_id, filename=filename).first()
+    if not file:
+        return None
+    headers = {'Content-Type': guess_content_type(filename)}
+    variant = None
+    if file.is_binary:
+        variant = pick_variant(file, accept_webp=webp)
+        if variant:
+            body = variant.content_binary
+            headers['Content-Type'] = VARIANT_CONTENT_TYPES[variant.format]
+        else:
+            body = file.content_binary
+        headers['Vary'] = 'Accept'
+    else:
+        body = (file.content or '').encode('utf-8')
+        if file.asset_refs:
+            headers['Link'] = preload_link_header(file.asset_refs)
+    return (file.id, file.revision, variant.id if variant else None), body, headers
+
+
+def _current_version(project_id, filename, webp):
+    """The version _load would return, without loading any content"""
+    row = db.session.query(
+        ProjectFile.id, ProjectFile.revision, ProjectFile.content_hash, ProjectFile.size_bytes, ProjectFile.file_type
+    ).filter_by(project_id=project_id, filename=filename).first()
+    if row is None:
+        return None
+    variant_id = None
+    if _is_resizable(filename):
+        variant_id = best_variant_id(row.id, row.content_hash, row.file_type, row.size_bytes, webp)
+    return (row.id, row.revision, variant_id)
+
+
+def _lookup(project_id, filename, webp):
+    key = (project_id, filename, webp)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and key in _fresh:
+            return entry
+
+    if entry:
+        # Stale: indexed queries for the version decide whether to reload
+        version = _current_version(project_id, filename, webp)
+        if version == entry[0]:
+            with _cache_lock:
+                _fresh[key] = True
+            return entry
+
+    loaded = _load(project_id, filename, webp)
+    with _cache_lock:
+        if loaded is None or len(loaded[1]) > PREVIEW_CACHE_MAX_BODY:
+            _cache.pop(key, None)
+            return loaded
+        _cache[key] = loaded
+        _fresh[key] = True
+    return loaded
+
+
+def _stream(body):
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[start:start + STREAM_CHUNK_SIZE]
+
+
+@app.route("/t/<token>/<path:filename>")
+def serve(token, filename):
+    """Serve a project file; the token in the path keeps relative asset URLs working"""
+    claims = read_preview_token(app.secret_key, token)
+    if not claims:
+        return "Invalid or expired preview token", 403, {'Referrer-Policy': 'no-referrer'}
+    _, project_id = claims
+
+    webp = _is_resizable(filename) and 'image/webp' in request.headers.get('Accept', '')
+    entry = _lookup(project_id, filename, webp)
+    if entry is None:
+        return f"File {filename} not found", 404, {'Referrer-Policy': 'no-referrer'}
+
+    (file_id, revision, variant_id), body, headers = entry
+    etag = f'"{file_id}-{revision}-{variant_id}"' if variant_id else f'"{file_id}-{revision}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag, 'Referrer-Policy': 'no-referrer'}
+
+    response = Response(_stream(body), headers=headers)
+    response.headers['Content-Length'] = str(len(body))
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    # The token is in the URL; keep it out of requests the page makes elsewhere
+    response.headers['Referrer-Policy'] = 'no-referrer'
+    return response
+
+
+@app.route("/ping")
+def ping():
+    return "1", 200, {'Content-Type': 'text/plain', 'Content-Length': '1'}
@@ -0,0 +1,59 @@
+"""Helpers shared by the main app and the standalone preview app (preview_app.py)"""
+from urllib.parse import quote
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+PREVIEW_TOKEN_SALT = 'preview-token'
+PREVIEW_TOKEN_MAX_AGE = 60 * 60  # seconds
+
+# URL characters left as they are in Link header hrefs
+LINK_HREF_SAFE = "/:@!$&'()*+=~%?#-._"
+
+
+def guess_content_type(filename):
+    """Content type for a project file, defaulting to HTML"""
+    if filename.endswith('.css'):
+        return 'text/css'
+    elif filename.endswith('.js'):
+        return 'application/javascript'
+    elif filename.endswith('.json'):
+        return 'application/json'
+    elif filename.endswith('.png'):
+        return 'image/png'
+    elif filename.endswith(('.jpg', '.jpeg')):
+        return 'image/jpeg'
+    elif filename.endswith('.gif'):
+        return 'image/gif'
+    elif filename.endswith('.svg'):
+        return 'image/svg+xml'
+    return 'text/html'
+
+
+def preload_link_header(asset_refs):
+    """Link header value with a rel=preload entry per stored asset reference.
+
+    hrefs come from user HTML, so everything that could end the URL or the
+    entry (<, >, comma, semicolon, whitespace, control characters) is
+    percent-encoded; existing escapes are kept.
+    """
+    return ', '.join(
+        f"<{quote(ref['href'], safe=LINK_HREF_SAFE)}>; rel=preload; as={ref['as']}" for ref in asset_refs
+    )
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt=PREVIEW_TOKEN_SALT)
+
+
+def make_preview_token(secret_key, user_id, project_id):
+    """Signed token granting read access to one project's preview files"""
+    return _serializer(secret_key).dumps({'u': user_id, 'p': project_id})
+
+
+def read_preview_token(secret_key, token, max_age=PREVIEW_TOKEN_MAX_AGE):
+    """Returns (user_id, project_id), or None if the token is invalid or expired"""
+    try:
+        data = _serializer(secret_key).loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+    return data.get('u'), data.get('p')
@@ -0,0 +1,189 @@
+"""Per-user rate limits and in-flight caps for expensive endpoints.
+
+Each limited endpoint has, per plan, a token bucket (a sustained rate per
+minute plus a burst) and a cap on how many of the user's requests may run
+at once. Both are checked and updated by one Lua script, so admitting a
+request is a single Redis round trip. Rejected requests get a 429 with
+Retry-After. In-flight slots are released when the response is closed,
+which for streamed responses is after the last byte, or, for endpoints
+that call detach_inflight_slot(), when their background job finishes; slots
+left by a crashed worker expire after INFLIGHT_TTL_MS.
+
+If Redis is unavailable requests are let through.
+
+Environment:
+    RATE_LIMITS - per endpoint and plan overrides as
+                  endpoint.plan=per_minute/burst/concurrent, comma separated,
+                  e.g. "generate.free=6/3/1,download_zip.paid=60/20/4"
+"""
+import math
+import os
+import uuid
+from collections import namedtuple
+from functools import wraps
+
+import redis
+from flask import g, jsonify, make_response, request, session
+
+from credits import has_active_subscription
+from logging_config import get_logger
+from metadata_cache import get_user
+
+logger = get_logger()
+
+Limit = namedtuple('Limit', ['per_minute', 'burst', 'concurrent'])
+
+DEFAULT_RATE_LIMITS = {
+    'generate': {'free': Limit(4, 2, 1), 'paid': Limit(20, 5, 2)},
+    'push_to_github': {'free': Limit(6, 3, 1), 'paid': Limit(20, 5, 2)},
+    'download_zip': {'free': Limit(10, 5, 2), 'paid': Limit(30, 10, 4)},
+}
+
+# Longest a request can hold an in-flight slot if its worker dies
+INFLIGHT_TTL_MS = 10 * 60 * 1000
+
+# KEYS: bucket hash, in-flight sorted set
+# ARGV: burst, tokens per ms, concurrent cap (0 = none), slot ttl ms, request id
+# Returns {1, 0} when admitted, {0, retry after ms} when not.
+_ADMIT_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local concurrent = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+if concurrent > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    if redis.call('ZCARD', KEYS[2]) >= concurrent then
+        return {0, 1000}
+    end
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) / rate)}
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate))
+if concurrent > 0 then
+    redis.call('ZADD', KEYS[2], now + ttl, ARGV[5])
+    redis.call('PEXPIRE', KEYS[2], ttl)
+end
+return {1, 0}
+"""
+
+
+def _parse_rate_limits(value):
+    limits = {endpoint: dict(plans) for endpoint, plans in DEFAULT_RATE_LIMITS.items()}
+    for item in (value or '').split(','):
+        if '=' not in item or '.' not in item.split('=', 1)[0]:
+            continue
+        name, spec = item.split('=', 1)
+        endpoint, plan = name.strip().rsplit('.', 1)
+        try:
+            per_minute, burst, concurrent = (int(part) for part in spec.split('/'))
+        except ValueError:
+            continue
+        if per_minute < 1 or burst < 1:
+            continue
+        limits.setdefault(endpoint, {})[plan] = Limit(per_minute, burst, concurrent)
+    return limits
+
+
+RATE_LIMITS = _parse_rate_limits(os.getenv('RATE_LIMITS'))
+
+_redis = None
+_admit = None
+
+
+def init_rate_limits(redis_client):
+    global _redis, _admit
+    _redis = redis_client
+    _admit = redis_client.register_script(_ADMIT_SCRIPT) if redis_client is not None else None
+
+
+def user_plan(user):
+    """'paid' while a subscription is active, else 'free'"""
+    return 'paid' if user is not None and has_active_subscription(user) else 'free'
+
+
+def _too_many_requests(retry_after_ms):
+    retry_after = max(1, math.ceil(retry_after_ms / 1000))
+    response = jsonify({'error': 'Too many requests. Please wait a moment and try again.', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _no_slot():
+    pass
+
+
+def detach_inflight_slot():
+    """Keeps the current request's in-flight slot past the response.
+
+    Returns the function that releases it (a no-op when the request holds
+    none), for an endpoint that queues a background job to call when done.
+    """
+    detach = g.pop('detach_inflight_slot', None)
+    return detach() if detach else _no_slot
+
+
+def rate_limited(f):
+    """Decorator limiting a logged-in endpoint by RATE_LIMITS[endpoint][plan].
+
+    The plan comes from the cached user metadata the endpoint reads anyway.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        limits = RATE_LIMITS.get(request.endpoint)
+        user_id = session.get('user_id')
+        if not limits or _admit is None or user_id is None:
+            return f(*args, **kwargs)
+
+        limit = limits.get(user_plan(get_user(user_id))) or limits.get('free')
+        bucket_key = f"ratelimit:{request.endpoint}:{user_id}"
+        inflight_key = f"inflight:{request.endpoint}:{user_id}"
+        slot = uuid.uuid4().hex
+        try:
+            admitted, retry_after_ms = _admit(
+                keys=[bucket_key, inflight_key],
+                args=[limit.burst, limit.per_minute / 60000, limit.concurrent, INFLIGHT_TTL_MS, slot]
+            )
+        except redis.RedisError as e:
+            logger.warning("Rate limiter unavailable", extra={'fields': {'error': type(e).__name__}})
+            return f(*args, **kwargs)
+        if not admitted:
+            logger.info("Rate limited", extra={'fields': {'user_id': user_id, 'retry_after_ms': retry_after_ms}})
+            return _too_many_requests(retry_after_ms)
+        if not limit.concurrent:
+            return f(*args, **kwargs)
+
+        detached = False
+
+        def release():
+            try:
+                _redis.zrem(inflight_key, slot)
+            except redis.RedisError:
+                pass  # the slot expires on its own
+
+        def detach():
+            nonlocal detached
+            detached = True
+            return release
+
+        g.detach_inflight_slot = detach
+        try:
+            response = make_response(f(*args, **kwargs))
+        except BaseException:
+            if not detached:
+                release()
+            raise
+        response.call_on_close(lambda: detached or release())
+        return response
+    return decorated_function
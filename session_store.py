@@ -0,0 +1,98 @@
+"""Session storage that only writes when the session really changed, and the
+per-user state that used to live in it.
+
+Flask-Session rewrites the whole session to Redis on every request when
+SESSION_REFRESH_EACH_REQUEST is on, and on any assignment even if the value
+is unchanged. CompactRedisSessionInterface keeps the msgspec MessagePack
+encoding but compares the encoded bytes with what was loaded and skips the
+write when they match. Idle sessions are rewritten (to extend their TTL)
+only once half their lifetime has passed.
+
+The session itself holds just the user's identity and current project.
+Data that belongs to the user rather than the browser session lives in
+Redis under its own keys: the linked GitHub account and a pending Figma
+URL. Credits and project names are read from the database (through
+metadata_cache) instead of being copied into the session.
+"""
+import time
+
+from flask import g
+from flask_session.redis import RedisSessionInterface
+
+GITHUB_LINK_TTL = 30 * 24 * 60 * 60
+FIGMA_URL_TTL = 24 * 60 * 60
+
+# Key inside the session holding the time (hours since epoch) it was last written
+_WRITTEN_KEY = '_w'
+
+
+class CompactRedisSessionInterface(RedisSessionInterface):
+
+    def _retrieve_session_data(self, store_id):
+        serialized = self.client.get(store_id)
+        g._session_loaded = serialized
+        if serialized:
+            return self.serializer.decode(serialized)
+        return None
+
+    def should_set_storage(self, app, session):
+        if session.modified:
+            return True
+        lifetime_hours = app.permanent_session_lifetime.total_seconds() / 3600
+        return _hours_now() - session.get(_WRITTEN_KEY, 0) >= lifetime_hours / 2
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        loaded = g.get('_session_loaded')
+        written = session.get(_WRITTEN_KEY, 0)
+        stale = _hours_now() - written >= session_lifetime.total_seconds() / 3600 / 2
+        if loaded and not stale and self.serializer.encode(session) == loaded:
+            return  # assigned, but nothing actually changed
+
+        dict.__setitem__(session, _WRITTEN_KEY, _hours_now())
+        self.client.set(
+            name=store_id,
+            value=self.serializer.encode(session),
+            ex=int(session_lifetime.total_seconds()),
+        )
+
+
+def _hours_now():
+    return int(time.time() // 3600)
+
+
+def _github_key(user_id):
+    return f"user:{user_id}:github"
+
+
+def set_github_link(redis_client, user_id, token, username):
+    key = _github_key(user_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={'token': token, 'username': username})
+    pipe.expire(key, GITHUB_LINK_TTL)
+    pipe.execute()
+
+
+def _text(value):
+    # Clients made with decode_responses=True already return str
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_github_link(redis_client, user_id):
+    """(token, username) of the user's linked GitHub account, or (None, None)"""
+    link = {_text(k): _text(v) for k, v in redis_client.hgetall(_github_key(user_id)).items()}
+    if not link.get('token'):
+        return None, None
+    return link['token'], link.get('username', '')
+
+
+def clear_user_links(redis_client, user_id):
+    """Forgets the GitHub account and Figma URL linked for the user"""
+    redis_client.delete(_github_key(user_id), f"user:{user_id}:figma_url")
+
+
+def set_figma_url(redis_client, user_id, url):
+    redis_client.set(f"user:{user_id}:figma_url", url, ex=FIGMA_URL_TTL)
+
+
+def clear_figma_url(redis_client, user_id):
+    redis_client.delete(f"user:{user_id}:figma_url")
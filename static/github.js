@@ -61,6 +61,43 @@ if (githubAuthBtn) {
   });
 }
 
+// Give up on a push that has not finished after this long
+const PUSH_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+const PUSH_POLL_MAX_ERRORS = 5;
+
+// Poll a push job until it finishes, showing progress on the push button
+async function pollPushJob(statusUrl) {
+  const deadline = Date.now() + PUSH_POLL_TIMEOUT_MS;
+  let errors = 0;
+  while (true) {
+    if (Date.now() > deadline) {
+      throw new Error('The push is taking too long. Check the repository on GitHub or try again.');
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000));
+    let res, data;
+    try {
+      res = await fetch(statusUrl);
+      data = await res.json();
+    } catch (err) {
+      // Network blips are retried a few times before giving up
+      if (++errors >= PUSH_POLL_MAX_ERRORS) throw err;
+      continue;
+    }
+    errors = 0;
+    if (!res.ok) throw new Error(data.error || 'Lost track of the push');
+    
+    if (data.status === 'done' || data.status === 'failed') {
+      return data;
+    }
+    if (data.status === 'retrying') {
+      const wait = Math.max(0, Math.round(data.retry_at - Date.now() / 1000));
+      pushBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> GitHub is busy, retrying in ${wait}s...`;
+    } else if (data.files_total) {
+      pushBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> Pushing... ${data.files_done}/${data.files_total} files`;
+    }
+  }
+}
+
 // Push to GitHub
 if (pushBtn) {
   pushBtn.addEventListener('click', async () => {
@@ -87,9 +124,14 @@ if (pushBtn) {
         })
       });
       
-      const data = await res.json();
+      const job = await res.json();
+      if (!res.ok) {
+        throw new Error(job.error || 'Failed to push to GitHub');
+      }
+      
+      const data = await pollPushJob(job.status_url);
       
-      if (res.ok && data.success) {
+      if (data.status === 'done') {
         // Show success message
         document.getElementById('github-result').style.display = 'block';
         document.getElementById('github-message').textContent = data.message;
@@ -101,6 +143,8 @@ if (pushBtn) {
         setTimeout(() => {
           closeGithubModal();
           checkGithubStatus();
+          pushBtn.innerHTML = originalHTML;
+          pushBtn.disabled = false;
         }, 3000);
       } else {
         alert('Error: ' + (data.error || 'Failed to push to GitHub'));
@@ -22,7 +22,12 @@ function openProjectsSidebar() {
   if (sidebar && appShell) {
     sidebar.classList.add('active');
     appShell.classList.add('sidebar-open');
-    loadProjects('sidebar');
+    const search = document.getElementById('projects-search-sidebar');
+    if (search && search.value.trim()) {
+      searchProjects('sidebar', search.value.trim());
+    } else {
+      loadProjects('sidebar');
+    }
   }
 }
 
@@ -36,22 +41,64 @@ function closeProjectsSidebar() {
   }
 }
 
-async function loadProjects(location) {
+// Pagination state per list ('overlay' / 'sidebar')
+const projectListState = {};
+
+function renderProjectItem(project, location) {
+  return `
+      <div class="project-item" onclick="loadProjectWithFeedback(${project.id}, '${location}')">
+        <div class="project-item-name">${escapeHtml(project.name)}</div>
+        <div class="project-item-preview">${escapeHtml(project.preview)}</div>
+        <div class="project-item-date" data-date="${project.updated_at}">
+          <i class="fas fa-clock"></i>
+          ${formatDate(project.updated_at)}
+        </div>
+      </div>
+    `;
+}
+
+async function loadProjects(location, query = '') {
   const listId = location === 'overlay' ? 'projects-list-overlay' : 'projects-list-sidebar';
   const listEl = document.getElementById(listId);
   
   if (!listEl) return;
   
+  // Start over: first page is fetched by loadMoreProjects
+  if (projectListState[location] && projectListState[location].observer) {
+    projectListState[location].observer.disconnect();
+  }
+  projectListState[location] = { cursor: null, query, loading: false, done: false, observer: null };
+  listEl.innerHTML = '';
+  
+  await loadMoreProjects(location);
+  
+  // Start auto-refresh
+  startTimestampUpdates();
+}
+
+async function loadMoreProjects(location) {
+  const listId = location === 'overlay' ? 'projects-list-overlay' : 'projects-list-sidebar';
+  const listEl = document.getElementById(listId);
+  const state = projectListState[location];
+  
+  if (!listEl || !state || state.loading || state.done) return;
+  state.loading = true;
+  
   try {
-    const res = await fetch('/api/projects');
+    const params = new URLSearchParams();
+    if (state.cursor) params.set('cursor', state.cursor);
+    if (state.query) params.set('q', state.query);
+    
+    const res = await fetch(`/api/projects?${params}`);
     const data = await res.json();
     
     if (data.error) {
       listEl.innerHTML = `<div class="empty-projects"><i class="fas fa-exclamation-circle"></i><p>Error loading projects</p></div>`;
+      state.done = true;
       return;
     }
     
-    if (!data.projects || data.projects.length === 0) {
+    if (!state.cursor && (!data.projects || data.projects.length === 0)) {
       listEl.innerHTML = `
         <div class="empty-projects">
           <i class="fas fa-folder-open"></i>
@@ -59,27 +106,123 @@ async function loadProjects(location) {
           <p style="font-size: 12px;">Create your first website to get started!</p>
         </div>
       `;
+      state.done = true;
       return;
     }
     
-    // Render projects - UPDATED with loadProjectWithFeedback
-    listEl.innerHTML = data.projects.map(project => `
-      <div class="project-item" onclick="loadProjectWithFeedback(${project.id}, '${location}')">
-        <div class="project-item-name">${escapeHtml(project.name)}</div>
-        <div class="project-item-preview">${escapeHtml(project.preview)}</div>
-        <div class="project-item-date" data-date="${project.updated_at}">
-          <i class="fas fa-clock"></i>
-          ${formatDate(project.updated_at)}
-        </div>
-      </div>
-    `).join('');
+    // Append this page instead of re-rendering the whole list
+    const sentinel = listEl.querySelector('.projects-list-sentinel');
+    if (sentinel) sentinel.remove();
+    listEl.insertAdjacentHTML('beforeend', data.projects.map(project => renderProjectItem(project, location)).join(''));
     
-    // Start auto-refresh
-    startTimestampUpdates();
+    state.cursor = data.next_cursor;
+    state.done = !data.next_cursor;
+    
+    // Fetch the next page when the end of the list scrolls into view
+    if (!state.done) {
+      const nextSentinel = document.createElement('div');
+      nextSentinel.className = 'projects-list-sentinel';
+      listEl.appendChild(nextSentinel);
+      if (!state.observer) {
+        state.observer = new IntersectionObserver(entries => {
+          if (entries.some(entry => entry.isIntersecting)) loadMoreProjects(location);
+        }, { root: listEl });
+      }
+      state.observer.observe(nextSentinel);
+    } else if (state.observer) {
+      state.observer.disconnect();
+    }
     
   } catch (err) {
     console.error('Failed to load projects:', err);
     listEl.innerHTML = `<div class="empty-projects"><i class="fas fa-exclamation-circle"></i><p>Failed to load projects</p></div>`;
+    state.done = true;
+  } finally {
+    state.loading = false;
+  }
+}
+
+// --- Search ---
+const SEARCH_DEBOUNCE_MS = 250;
+const SEARCH_KIND_ICONS = { project: 'fa-folder', chat: 'fa-comment', file: 'fa-file-code' };
+let searchTimer = null;
+let searchSeq = 0;
+
+function onProjectSearchInput(input, location) {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => searchProjects(location, input.value.trim()), SEARCH_DEBOUNCE_MS);
+}
+
+// Snippets arrive as plain text with <mark></mark> around the matches
+function highlightSnippet(snippet) {
+  return escapeHtml(snippet).replace(/&lt;mark&gt;/g, '<mark>').replace(/&lt;\/mark&gt;/g, '</mark>');
+}
+
+function renderSearchResult(result, location) {
+  const title = result.kind === 'project' ? result.project_name : `${result.project_name || ''} · ${result.title}`;
+  return `
+      <div class="project-item search-result" onclick="loadProjectWithFeedback(${result.project_id}, '${location}')">
+        <div class="project-item-name"><i class="fas ${SEARCH_KIND_ICONS[result.kind] || 'fa-search'}"></i> ${escapeHtml(title)}</div>
+        ${result.snippet ? `<div class="project-item-preview">${highlightSnippet(result.snippet)}</div>` : ''}
+      </div>
+    `;
+}
+
+async function searchProjects(location, query) {
+  const seq = ++searchSeq;
+  if (!query) {
+    loadProjects(location);
+    return;
+  }
+  
+  const listId = location === 'overlay' ? 'projects-list-overlay' : 'projects-list-sidebar';
+  const listEl = document.getElementById(listId);
+  if (!listEl) return;
+  
+  // Results replace the paginated list until the query is cleared
+  const state = projectListState[location];
+  if (state && state.observer) state.observer.disconnect();
+  projectListState[location] = { cursor: null, query, loading: false, done: true, observer: null };
+  
+  try {
+    const res = await fetch(`/api/search?${new URLSearchParams({ q: query })}`);
+    const data = await res.json();
+    if (seq !== searchSeq) return; // a newer search is in flight
+    
+    if (data.error) {
+      listEl.innerHTML = `<div class="empty-projects"><i class="fas fa-exclamation-circle"></i><p>Search failed</p></div>`;
+      return;
+    }
+    const results = data.results.filter(result => result.project_id);
+    if (results.length === 0) {
+      listEl.innerHTML = `<div class="empty-projects"><i class="fas fa-search"></i><p>No matches</p></div>`;
+      return;
+    }
+    listEl.innerHTML = results.map(result => renderSearchResult(result, location)).join('');
+  } catch (err) {
+    if (seq !== searchSeq) return;
+    console.error('Search failed:', err);
+    listEl.innerHTML = `<div class="empty-projects"><i class="fas fa-exclamation-circle"></i><p>Search failed</p></div>`;
+  }
+}
+
+// Copy a project (optionally as of one chat turn) and open the copy
+async function forkProject(projectId = null, chatId = null) {
+  try {
+    const res = await fetch('/api/fork-project', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ project_id: projectId, chat_id: chatId })
+    });
+    const data = await res.json();
+    if (!res.ok || data.error) {
+      alert(data.error || 'Failed to fork project');
+      return;
+    }
+    await loadProjectWithFeedback(data.project_id, 'sidebar');
+  } catch (err) {
+    console.error('Failed to fork project:', err);
+    alert('Failed to fork project');
   }
 }
 
@@ -21,6 +21,7 @@ const refreshFilesBtn = document.getElementById('refresh-files-btn');
 const currentFileNameEl = document.getElementById('current-file-name');
 const pageTitleInput = document.getElementById('page-title-input');
 const openNewTabBtn = document.getElementById('open-new-tab-btn');
+const publishBtn = document.getElementById('publish-btn');
 
 // Navigation buttons
 const navBackBtn = document.getElementById('nav-back-btn');
@@ -35,6 +36,12 @@ let currentPreviewFile = 'index.html';
 let isFirstPrompt = true;
 let projectTitle = 'Untitled';
 
+// Editor save state (see Editing)
+const SAVE_DEBOUNCE_MS = 800;
+let editingFile = null;  // { filename, revision, hash, savedText }
+let saveTimer = null;
+let savePromise = null;
+
 // Loading steps configuration
 const LOADING_STEPS = [
   { icon: 'fa-solid fa-brain', label: 'Thinking', duration: 2000 },
@@ -364,35 +371,56 @@ if (pageTitleInput) {
 }
 
 // --- Preview Navigation Controls ---
+// Back/forward walk the files this page loaded into the preview. The
+// iframe's own history is off limits once previews come from another
+// origin, so a link followed inside the preview is only noted: going back
+// from it reloads the file it started from.
+let previewHistory = [];
+let previewHistoryIndex = -1;
+let previewLeftHistory = false;
+let expectingPreviewLoad = false;
+
+function updatePreviewNavButtons() {
+  const hasEntry = previewHistoryIndex >= 0;
+  if (navBackBtn) navBackBtn.disabled = !(hasEntry && (previewHistoryIndex > 0 || previewLeftHistory));
+  if (navForwardBtn) navForwardBtn.disabled = !(previewHistoryIndex < previewHistory.length - 1);
+}
+
+function resetPreviewHistory() {
+  previewHistory = [];
+  previewHistoryIndex = -1;
+  previewLeftHistory = false;
+  updatePreviewNavButtons();
+}
+
 if (preview) {
   preview.addEventListener('load', () => {
-    try {
-      const iframeWindow = preview.contentWindow;
-      if (navBackBtn) {
-        navBackBtn.disabled = false;
-      }
-      if (navForwardBtn) {
-        navForwardBtn.disabled = false;
-      }
-    } catch (e) {
-      // Cross-origin restrictions
+    if (expectingPreviewLoad) {
+      expectingPreviewLoad = false;
+    } else if (previewHistoryIndex >= 0) {
+      // The page navigated by itself, e.g. a link inside the preview
+      previewLeftHistory = true;
+      updatePreviewNavButtons();
     }
   });
 }
 
 if (navBackBtn) {
   navBackBtn.addEventListener('click', () => {
-    if (preview && preview.contentWindow) {
-      preview.contentWindow.history.back();
+    if (previewHistoryIndex < 0) return;
+    if (!previewLeftHistory) {
+      if (previewHistoryIndex === 0) return;
+      previewHistoryIndex--;
     }
+    loadPreview(previewHistory[previewHistoryIndex], true);
   });
 }
 
 if (navForwardBtn) {
   navForwardBtn.addEventListener('click', () => {
-    if (preview && preview.contentWindow) {
-      preview.contentWindow.history.forward();
-    }
+    if (previewHistoryIndex >= previewHistory.length - 1) return;
+    previewHistoryIndex++;
+    loadPreview(previewHistory[previewHistoryIndex], true);
   });
 }
 
@@ -616,11 +644,25 @@ function createLoadingContainer() {
 function wireHistoryLoaders() {
   document.querySelectorAll('.history-item').forEach(item => {
     item.removeEventListener('click', item._vcListener);
-    const listener = () => {
+    const listener = async () => {
       const hidden = item.querySelector('.hidden-code');
+      // Messages restored from history (or rendered with a truncated preview)
+      // fetch their full code on first open
+      if (hidden && (!hidden.textContent || item.dataset.truncated) && item.dataset.chatId) {
+        try {
+          const res = await fetch(`/api/project/${item.dataset.projectId}/chat/${item.dataset.chatId}`);
+          if (res.ok) {
+            const data = await res.json();
+            hidden.textContent = data.generated_code || '';
+            delete item.dataset.truncated;
+          }
+        } catch (err) {
+          console.error('Failed to load message code:', err);
+        }
+      }
       const code = hidden ? hidden.textContent : '';
       if (code) {
-        codeView.textContent = code;
+        setCodeView(code);
         loadPreview('index.html');
         showPreview();
 
@@ -636,13 +678,52 @@ function wireHistoryLoaders() {
 }
 
 // --- Preview Loading ---
-function loadPreview(filename) {
+// Inline mode returns each page as one document (CSS/JS/small images embedded).
+// Set localStorage.inlinePreview = 'off' to load assets individually instead.
+const INLINE_PREVIEW = localStorage.getItem('inlinePreview') !== 'off';
+
+// When a standalone preview app is configured, previews load from it with a
+// signed token in the path instead of going through /preview on this app.
+let previewToken = null;
+let previewTokenExpiresAt = 0;
+
+async function getPreviewToken() {
+  if (previewToken && Date.now() < previewTokenExpiresAt) return previewToken;
+  try {
+    const res = await fetch('/api/preview-token');
+    if (!res.ok) return null;
+    const data = await res.json();
+    previewToken = data.token;
+    previewTokenExpiresAt = Date.now() + (data.expires_in - 60) * 1000;
+    return previewToken;
+  } catch (err) {
+    console.error('Failed to get preview token:', err);
+    return null;
+  }
+}
+
+function loadPreview(filename, fromHistory = false) {
+  if (!fromHistory && previewHistory[previewHistoryIndex] !== filename) {
+    previewHistory = previewHistory.slice(0, previewHistoryIndex + 1);
+    previewHistory.push(filename);
+    previewHistoryIndex = previewHistory.length - 1;
+  }
+  previewLeftHistory = false;
+  expectingPreviewLoad = true;
+  
   const timestamp = new Date().getTime();
-  preview.src = `/preview/${filename}?t=${timestamp}`;
+  const inlineParam = INLINE_PREVIEW && filename.endsWith('.html') ? '&inline=1' : '';
+  if (window.PREVIEW_BASE_URL) {
+    getPreviewToken().then(token => {
+      preview.src = token
+        ? `${window.PREVIEW_BASE_URL}/t/${token}/${filename}?t=${timestamp}`
+        : `/preview/${filename}?t=${timestamp}${inlineParam}`;
+    });
+  } else {
+    preview.src = `/preview/${filename}?t=${timestamp}${inlineParam}`;
+  }
   currentPreviewFile = filename;
-  
-  if (navBackBtn) navBackBtn.disabled = false;
-  if (navForwardBtn) navForwardBtn.disabled = false;
+  updatePreviewNavButtons();
 }
 
 // --- Download All Files as ZIP ---
@@ -706,10 +787,38 @@ if (copyBtn) {
   });
 }
 
+// --- Publish Static Snapshot ---
+async function publishProject() {
+  const originalHTML = publishBtn.innerHTML;
+  publishBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+  publishBtn.disabled = true;
+
+  try {
+    const res = await fetch('/api/publish', { method: 'POST' });
+    const data = await res.json();
+
+    if (!res.ok || data.error) {
+      throw new Error(data.error || 'Publish failed');
+    }
+
+    createBotMessage(`🌐 Published version ${data.version}! Your site is live at [${data.url}](${data.url})`);
+  } catch (err) {
+    console.error('Publish failed:', err);
+    alert('Publish failed: ' + err.message);
+  } finally {
+    publishBtn.innerHTML = originalHTML;
+    publishBtn.disabled = false;
+  }
+}
+
 if (downloadBtn) {
   downloadBtn.addEventListener('click', downloadAllFiles);
 }
 
+if (publishBtn) {
+  publishBtn.addEventListener('click', publishProject);
+}
+
 if (previewBtn) {
   previewBtn.addEventListener('click', showPreview);
 }
@@ -841,12 +950,13 @@ const hasExistingHistory = chatBox.querySelectorAll('.history-item .prompt-text'
 if (!window.lastGeneratedCode || !hasExistingHistory) {
   chatBox.innerHTML = '';
   preview.src = '';
-  codeView.textContent = '';
+  setCodeView('');
   projectTitle = 'Untitled';
   if (pageTitleInput) pageTitleInput.value = 'Untitled';
   fileTreeEl.innerHTML = '';
   currentOpenFile = null;
   currentPreviewFile = 'index.html';
+  resetPreviewHistory();
   window.lastGeneratedCode = ''; // Clear it
 }
 
@@ -876,10 +986,11 @@ if (!window.lastGeneratedCode || !hasExistingHistory) {
     const isModification = window.window.lastGeneratedCode && 
                       !newProjectKeywords.some(kw => promptLower.includes(kw));
 
+    // The server modifies its stored index.html; we only say which revision we saw
     const payload = {
   prompt: prompt,
   is_modification: isModification,
-  previous_code: isModification ? window.lastGeneratedCode : null
+  base_revision: isModification ? window.indexRevision : null
 };
 
 console.log('🔍 DEBUG:', {
@@ -943,6 +1054,7 @@ console.log('🔍 DEBUG:', {
     
     // Store code
     window.lastGeneratedCode = data.code || '';
+    window.indexRevision = data.index_revision || null;
     window.window.lastGeneratedCode = window.lastGeneratedCode; // ADD THIS LINE
 
     // ADD THIS: Show description immediately
@@ -981,7 +1093,7 @@ console.log('🔍 DEBUG:', {
     }
 
     // Update code view
-    codeView.textContent = window.lastGeneratedCode;
+    setCodeView(window.lastGeneratedCode);
     
     // Refresh file list and track progress
     const createdFiles = data.created_files || ['index.html'];
@@ -1027,7 +1139,8 @@ console.log('🔍 DEBUG:', {
     
     await fetchAndRenderFiles();
     
-    // Load preview
+    // Load preview (a new project needs a new preview token)
+    previewToken = null;
     loadPreview('index.html');
     
     // Set active file
@@ -1059,6 +1172,7 @@ console.log('🔍 DEBUG:', {
 
 async function resetChat() {
   try {
+    await flushFileSave();  // save into the current project before /new_chat switches away
     // Call new_chat endpoint which handles everything properly
     const res = await fetch('/new_chat', { method: 'POST' });
     const data = await res.json();
@@ -1076,7 +1190,7 @@ async function resetChat() {
     
     // Clear preview and code
     preview.src = '';
-    codeView.textContent = '';
+    setCodeView('');
     
     // Update credits without resetting
     const creditsEl = document.getElementById('credits');
@@ -1094,8 +1208,7 @@ async function resetChat() {
     if (pageTitleInput) pageTitleInput.value = 'Untitled';
     
     // Disable navigation
-    if (navBackBtn) navBackBtn.disabled = true;
-    if (navForwardBtn) navForwardBtn.disabled = true;
+    resetPreviewHistory();
     
     // Clear file search
     if (fileSearchInput) fileSearchInput.value = '';
@@ -1121,6 +1234,7 @@ if (newChatBtn) {
 
 async function newChat() {
     try {
+        await flushFileSave();
         const res = await fetch('/new_chat', {
             method: "POST"
         });
@@ -1147,10 +1261,9 @@ async function newChat() {
         if (pageTitleInput) pageTitleInput.value = 'Untitled';
 
         preview.src = "";
-        codeView.textContent = "";
+        setCodeView('');
         
-        if (navBackBtn) navBackBtn.disabled = true;
-        if (navForwardBtn) navForwardBtn.disabled = true;
+        resetPreviewHistory();
         
         fetchAndRenderFiles();
         renderMarkdownBlocks();
@@ -1165,6 +1278,7 @@ async function restoreProjectFiles(project, projectId) {
   try {
     // STEP 1: Clear all previous state FIRST
     console.log('🧹 Clearing previous project state...');
+    await flushFileSave();
     window.lastGeneratedCode = '';
     currentOpenFile = null;
     currentPreviewFile = 'index.html';
@@ -1176,10 +1290,7 @@ async function restoreProjectFiles(project, projectId) {
     }
     
     // STEP 3: Clear code view
-    const codeView = document.getElementById('code-view');
-    if (codeView) {
-      codeView.textContent = '';
-    }
+    setCodeView('');
     
     // STEP 4: Show loading in file tree
     const fileTreeEl = document.getElementById('file-tree');
@@ -1305,18 +1416,131 @@ async function fetchAndRenderFiles() {
     }
 
     renderNode(tree, fileTreeEl);
+
+    // Files may have changed (e.g. after a generation): refresh the content cache
+    fileContentCache = new Map();
+    prefetchFileContents();
 }
 
 
-async function openFile(filename) {
+// Text file contents prefetched in one batch request when the file tree loads
+let fileContentCache = new Map();
+
+async function prefetchFileContents() {
   try {
-    const res = await fetch(`/api/file?filename=${encodeURIComponent(filename)}`);
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const res = await fetch('/api/files/batch-read', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({})
+    });
+    if (!res.ok) return;
     const data = await res.json();
-    if (data.error) throw new Error(data.error);
+    fileContentCache = new Map((data.files || []).map(f => [f.filename, f]));
+  } catch (err) {
+    console.error('Failed to prefetch files:', err);
+  }
+}
+
+// --- Editing ---
+// The code view is editable while a text file is open. Edits are saved as a
+// single patch (the changed range) against the revision the file was opened at.
+function setCodeView(code, file = null) {
+  if (saveTimer) flushFileSave();  // keep edits still waiting on the debounce
+  codeView.textContent = code;
+  editingFile = file && file.revision ? { filename: file.filename, revision: file.revision, hash: file.hash, savedText: code } : null;
+  codeView.contentEditable = editingFile ? 'plaintext-only' : 'false';
+}
+
+// Smallest single replacement turning oldText into newText (UTF-16 offsets)
+function diffRange(oldText, newText) {
+  let start = 0;
+  const maxStart = Math.min(oldText.length, newText.length);
+  while (start < maxStart && oldText[start] === newText[start]) start++;
+  let oldEnd = oldText.length;
+  let newEnd = newText.length;
+  while (oldEnd > start && newEnd > start && oldText[oldEnd - 1] === newText[newEnd - 1]) {
+    oldEnd--;
+    newEnd--;
+  }
+  return { start, end: oldEnd, text: newText.slice(start, newEnd) };
+}
+
+async function saveEditingFile(file, text) {
+  if (!file || text === file.savedText) return;
+
+  const patch = diffRange(file.savedText, text);
+  const res = await fetch('/api/file', {
+    method: 'PATCH',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      filename: file.filename,
+      base_revision: file.revision,
+      base_hash: file.hash,
+      patches: [patch]
+    })
+  });
+  const data = await res.json();
+
+  if (res.status === 409) {
+    // Someone else saved first: stop saving over their change
+    if (editingFile === file) {
+      editingFile = null;
+      codeView.contentEditable = 'false';
+    }
+    createBotMessage(`⚠️ ${file.filename} was changed elsewhere. Reopen it to get the latest version; your last edit was not saved.`);
+    return;
+  }
+  if (!res.ok) throw new Error(data.error || `HTTP ${res.status}`);
+
+  file.revision = data.revision;
+  file.hash = data.hash;
+  file.savedText = text;
+  if (file.filename === 'index.html') {
+    window.indexRevision = data.revision;
+    window.lastGeneratedCode = text;
+  }
+  fileContentCache.set(file.filename, { filename: file.filename, content: text, revision: data.revision, hash: data.hash });
+  if (file.filename === currentPreviewFile && previewContainer.style.display !== 'none') {
+    loadPreview(file.filename);
+  }
+}
+
+function scheduleFileSave() {
+  clearTimeout(saveTimer);
+  saveTimer = setTimeout(flushFileSave, SAVE_DEBOUNCE_MS);
+}
+
+// Saves pending edits now; saves run one at a time so each patch builds on the last revision.
+// The file and text are taken now, so the save survives the code view moving on.
+function flushFileSave() {
+  clearTimeout(saveTimer);
+  saveTimer = null;
+  const file = editingFile;
+  const text = file ? codeView.textContent : null;
+  savePromise = (savePromise || Promise.resolve()).then(() => saveEditingFile(file, text)).catch(err => {
+    console.error('Failed to save file:', err);
+    createBotMessage('⚠️ Error saving file: ' + err.message);
+  });
+  return savePromise;
+}
+
+codeView.addEventListener('input', () => {
+  if (editingFile) scheduleFileSave();
+});
+
+async function openFile(filename) {
+  try {
+    await flushFileSave();
+    let file = fileContentCache.get(filename);
+    if (!file) {
+      const res = await fetch(`/api/file?filename=${encodeURIComponent(filename)}`);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const data = await res.json();
+      if (data.error) throw new Error(data.error);
+      file = { filename, content: data.content || '', revision: data.revision, hash: null };
+    }
 
-    const code = data.content || '';
-    codeView.textContent = code;
+    setCodeView(file.content || '', file);
     
     if (currentFileNameEl) {
       currentFileNameEl.textContent = filename;
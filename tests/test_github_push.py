@@ -0,0 +1,211 @@
+"""github_push.push_files against the in-memory GitHub stand-in from
+benchmarks/bench_github_push.py, served on a local port.
+
+    python -m pytest tests
+"""
+import logging
+import os
+import socket
+import sys
+import threading
+
+import pytest
+from flask import jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_github_push import make_fake_github  # noqa: E402
+from github_push import GitHubClient, GitHubPushError, git_blob_sha, push_files  # noqa: E402
+
+FILES = {
+    'index.html': b'<html><body>hello</body></html>',
+    'styles.css': b'body { color: red; }',
+    'logo.png': bytes(range(256)) * 4,
+}
+
+
+@pytest.fixture
+def github():
+    """(client, state, calls, fail): calls logs (method, path) per request;
+    fail maps (method, path) to (status, headers) to answer with instead."""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    fake, state = make_fake_github(latency=0)
+    calls = []
+    fail = {}
+
+    @fake.before_request
+    def record():
+        calls.append((request.method, request.path))
+        if (request.method, request.path) in fail:
+            status, headers = fail[(request.method, request.path)]
+            return jsonify({'message': 'stand-in failure'}), status, headers
+
+    server = make_server('127.0.0.1', 0, fake, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = GitHubClient('test-token', base_url=f'http://127.0.0.1:{server.server_port}')
+    yield client, state, calls, fail
+    client.close()
+    server.shutdown()
+    thread.join()
+
+
+def head_files(state, name):
+    repo = state['repos'][name]
+    return repo['trees'][repo['commits'][repo['refs']['main']]['tree']]
+
+
+def test_new_repo_gets_one_commit_with_every_file(github):
+    client, state, calls, _ = github
+    progress = []
+
+    result = push_files(client, 'me', 'site', FILES, 'Add site', progress=lambda done, total: progress.append((done, total)))
+
+    assert result['created_repo'] is True
+    assert result['changed'] == len(FILES)
+    repo = state['repos']['site']
+    assert repo['refs']['main'] == result['commit_sha']
+    commit = repo['commits'][result['commit_sha']]
+    assert commit['message'] == 'Add site'
+    assert len(repo['commits']) == 2  # the repo's initial commit, then ours on top of it
+    assert commit['parents'] == [next(sha for sha in repo['commits'] if sha != result['commit_sha'])]
+    assert head_files(state, 'site') == {
+        'README.md': git_blob_sha(b'# readme\n'),
+        **{path: git_blob_sha(data) for path, data in FILES.items()},
+    }
+    assert progress[-1] == (len(FILES), len(FILES))
+
+    # Lookups, then the blobs, then exactly one tree, one commit and one ref update
+    methods = [call for call in calls if not call[1].endswith('/git/blobs')]
+    assert methods == [
+        ('GET', '/repos/me/site'),
+        ('POST', '/user/repos'),
+        ('GET', '/repos/me/site/git/ref/heads/main'),
+        ('GET', f"/repos/me/site/git/commits/{commit['parents'][0]}"),
+        ('GET', f"/repos/me/site/git/trees/{repo['commits'][commit['parents'][0]]['tree']}"),
+        ('POST', '/repos/me/site/git/trees'),
+        ('POST', '/repos/me/site/git/commits'),
+        ('PATCH', '/repos/me/site/git/refs/heads/main'),
+    ]
+    assert calls.count(('POST', '/repos/me/site/git/blobs')) == len(FILES)
+
+
+def test_only_changed_files_are_uploaded(github):
+    client, state, calls, _ = github
+    push_files(client, 'me', 'site', FILES, 'first')
+    calls.clear()
+
+    result = push_files(client, 'me', 'site', {**FILES, 'index.html': b'<html>changed</html>'}, 'second')
+
+    assert result['created_repo'] is False
+    assert result['changed'] == 1
+    assert calls.count(('POST', '/repos/me/site/git/blobs')) == 1
+    assert head_files(state, 'site')['index.html'] == git_blob_sha(b'<html>changed</html>')
+    assert head_files(state, 'site')['styles.css'] == git_blob_sha(FILES['styles.css'])
+
+
+def test_unchanged_push_makes_no_commit(github):
+    client, state, calls, _ = github
+    first = push_files(client, 'me', 'site', FILES, 'first')
+    calls.clear()
+
+    result = push_files(client, 'me', 'site', FILES, 'again')
+
+    assert result == {'commit_sha': None, 'changed': 0, 'created_repo': False}
+    assert state['repos']['site']['refs']['main'] == first['commit_sha']
+    assert not [call for call in calls if call[0] != 'GET']
+
+
+def test_empty_repo_gets_a_root_commit_and_a_new_branch(github):
+    client, state, calls, _ = github
+    state['repos']['empty'] = {'blobs': {}, 'trees': {}, 'commits': {}, 'refs': {}}
+
+    result = push_files(client, 'me', 'empty', FILES, 'Initial site')
+
+    repo = state['repos']['empty']
+    assert repo['refs'] == {'main': result['commit_sha']}
+    assert repo['commits'][result['commit_sha']]['parents'] == []
+    assert head_files(state, 'empty') == {path: git_blob_sha(data) for path, data in FILES.items()}
+    assert ('POST', '/repos/me/empty/git/refs') in calls
+    assert not [call for call in calls if call[0] == 'PATCH']
+
+
+def test_branch_moved_during_push_is_rebuilt_on_the_new_head(github):
+    client, state, calls, _ = github
+    push_files(client, 'me', 'site', FILES, 'first')
+    repo = state['repos']['site']
+    ref_path = '/repos/me/site/git/refs/heads/main'
+    send = client.request
+
+    def request(method, path, *args, **kwargs):
+        # Someone else commits just before our first ref update, so it is not a fast-forward
+        if method == 'PATCH' and ('PATCH', ref_path) not in calls:
+            tree = dict(head_files(state, 'site'), **{'other.html': git_blob_sha(b'other')})
+            repo['trees']['other-tree'] = tree
+            repo['commits']['other-commit'] = {'tree': 'other-tree', 'message': 'other', 'parents': [repo['refs']['main']]}
+            repo['refs']['main'] = 'other-commit'
+        return send(method, path, *args, **kwargs)
+    client.request = request
+    calls.clear()
+
+    result = push_files(client, 'me', 'site', {'index.html': b'<html>v2</html>'}, 'second')
+
+    assert calls.count(('PATCH', ref_path)) == 2
+    assert repo['refs']['main'] == result['commit_sha']
+    assert repo['commits'][result['commit_sha']]['parents'] == ['other-commit']
+    assert head_files(state, 'site')['index.html'] == git_blob_sha(b'<html>v2</html>')
+    assert head_files(state, 'site')['other.html'] == git_blob_sha(b'other')
+
+
+def test_branch_that_keeps_moving_gives_up(github):
+    client, _, calls, fail = github
+    push_files(client, 'me', 'site', FILES, 'first')
+    fail[('PATCH', '/repos/me/site/git/refs/heads/main')] = (422, {})
+    calls.clear()
+
+    with pytest.raises(GitHubPushError) as error:
+        push_files(client, 'me', 'site', {'index.html': b'<html>v2</html>'}, 'second')
+
+    assert error.value.status == 422
+    assert calls.count(('PATCH', '/repos/me/site/git/refs/heads/main')) == 3
+
+
+@pytest.mark.parametrize('status, headers, retry_after', [
+    (401, {}, None),
+    (500, {}, None),
+    (429, {'Retry-After': '7'}, 7),
+])
+def test_api_errors_raise_push_error_with_status(github, status, headers, retry_after):
+    client, _, _, fail = github
+    fail[('GET', '/repos/me/site')] = (status, headers)
+
+    with pytest.raises(GitHubPushError) as error:
+        push_files(client, 'me', 'site', FILES, 'Add site')
+
+    assert error.value.status == status
+    assert error.value.retry_after == retry_after
+
+
+def test_exhausted_rate_limit_gives_retry_after_from_reset(github, monkeypatch):
+    client, _, _, fail = github
+    monkeypatch.setattr('github_push.time.time', lambda: 1000)
+    fail[('GET', '/repos/me/site')] = (403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1060'})
+
+    with pytest.raises(GitHubPushError) as error:
+        push_files(client, 'me', 'site', FILES, 'Add site')
+
+    assert (error.value.status, error.value.retry_after) == (403, 60)
+
+
+def test_unreachable_api_raises_push_error_without_status():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = GitHubClient('test-token', base_url=f'http://127.0.0.1:{port}')
+
+    with pytest.raises(GitHubPushError) as error:
+        push_files(client, 'me', 'site', FILES, 'Add site')
+
+    assert error.value.status is None
+    client.close()